@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Optional
+from app.services.ask_service import ask_stream
+from app.services.session_service import load_session
+import json
+
+router = APIRouter()
+
+
+class AskRequest(BaseModel):
+    question: str
+    db_name: Optional[str] = None       # omitted → routed across all databases
+    table_name: Optional[str] = None
+    session_id: Optional[str] = None    # the run becomes the session's first turn / last result
+    max_rows: Optional[int] = None      # capped at GOVERNOR_MAX_ROWS
+    summarize: bool = True
+
+
+@router.post("/")
+def ask_route(request: AskRequest):
+    """
+    Generate → validate → execute → profile → summarize in one round trip.
+    Streams NDJSON (one JSON object per line, see ask_service.ask_stream for the sections);
+    the last line is {"section": "done", "timings": {...}}.
+    """
+    if request.session_id:
+        try:
+            load_session(request.session_id)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    sections = ask_stream(request.question, request.db_name, request.table_name, request.max_rows,
+                          request.session_id, request.summarize)
+    return StreamingResponse((json.dumps(s, default=str) + "\n" for s in sections),
+                             media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
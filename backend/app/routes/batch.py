@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from app.services.batch_service import submit_job, load_job, cancel_job
+import traceback
+
+router = APIRouter()
+
+
+class BatchJobRequest(BaseModel):
+    db_name: str
+    questions: List[str]
+    execute: bool = True
+    max_rows: Optional[int] = None
+
+
+@router.post("/")
+def submit_batch_route(request: BatchJobRequest):
+    """
+    Queues a list of questions for one database; poll GET /api/batch/{job_id} for progress.
+    """
+    try:
+        job = submit_job(request.db_name, request.questions, request.execute, request.max_rows)
+        return {"status": "success", "job_id": job["job_id"], "progress": job["progress"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{job_id}")
+def get_batch_route(job_id: str):
+    """
+    Job status, progress counters and every finished question's SQL / result so far.
+    """
+    try:
+        return {"status": "success", "job": load_job(job_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.delete("/{job_id}")
+def cancel_batch_route(job_id: str):
+    try:
+        job = cancel_job(job_id)
+        return {"status": "success", "job_status": job["status"], "progress": job["progress"]}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
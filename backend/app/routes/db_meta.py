@@ -1,24 +1,39 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy import text
-from utils.db import root_engine
+from utils.db_utils import dataframe_to_response
+from utils.db_async import read_frame, fetch_column
 import traceback
-from utils.db import DB_USER, DB_PASS, DB_HOST, DB_PORT
-from sqlalchemy import create_engine
+import hashlib
+import json
 
 
 
 router = APIRouter()
 
+
+def _etag_response(request: Request, payload: dict):
+    """
+    Metadata changes rarely: send an ETag and answer a matching If-None-Match with 304
+    (no body), so the frontend's cached copy is revalidated instead of re-downloaded.
+    """
+    payload = jsonable_encoder(payload)
+    body = json.dumps(payload, sort_keys=True, default=str).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=payload, headers=headers)
+
+
 @router.get("/")
-def list_databases():
+async def list_databases(request: Request):
     try:
-        print("🚀 Using root_engine for SHOW DATABASES")
-        with root_engine.connect() as conn:
-            print("✅ Connected successfully")
-            result = conn.execute(text("SHOW DATABASES;"))
-            dbs = [row[0] for row in result.fetchall()]
-            print("📂 Databases found:", dbs)
-        return {"databases": dbs}
+        print("🚀 Using root connection for SHOW DATABASES")
+        dbs = await fetch_column("SHOW DATABASES;", root=True)
+        print("📂 Databases found:", dbs)
+        return _etag_response(request, {"databases": dbs})
     except Exception as e:
         print("❌ Error in /databases:", e)
         traceback.print_exc()
@@ -26,19 +41,28 @@ def list_databases():
 
 
 @router.get("/{db_name}")
-def list_tables(db_name: str):
+async def list_tables(db_name: str, request: Request):
     try:
         print(f"🚀 Connecting to DB: {db_name}")
-        engine_db = create_engine(
-            f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{db_name}"
-        )
-        with engine_db.connect() as conn:
-            print("✅ Connected to", db_name)
-            result = conn.execute(text("SHOW TABLES;"))
-            tables = [row[0] for row in result.fetchall()]
-            print(f"📂 Tables in {db_name}:", tables)
-        return {"tables": tables}
+        tables = await fetch_column("SHOW TABLES;", db_name)
+        print(f"📂 Tables in {db_name}:", tables)
+        return _etag_response(request, {"tables": tables})
     except Exception as e:
         print(f"❌ Error listing tables in {db_name}:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{db_name}/{table_name}/preview")
+async def preview_table(db_name: str, table_name: str, request: Request, limit: int = 5):
+    """First `limit` rows of a table (sidebar preview); same row format as /api/execute."""
+    if "`" in table_name:
+        raise HTTPException(status_code=400, detail="Invalid table name.")
+    limit = max(1, min(limit, 100))
+    try:
+        df = await read_frame(text(f"SELECT * FROM `{table_name}` LIMIT {limit}"), db_name)
+        return _etag_response(request, {"status": "success", **dataframe_to_response(df)})
+    except Exception as e:
+        print(f"❌ Error previewing {db_name}.{table_name}:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,19 @@
-from fastapi import APIRouter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from utils.embeddings import get_embedding_model, check_parity, benchmark_backends
+from utils.fewshot_utils import get_fewshot_index
+from utils.schema_index import schema_index_name
+from utils.vector_snapshots import get_reader, list_indexes
+from utils.sql_validator import VALIDATION_STATS
+from utils.llm_gateway import get_llm_gateway, benchmark_gateway
+from utils.partitioning import explain_partitions
+from utils.pdf_extract import benchmark_pdf_extraction
+from utils.cleaning import benchmark_cleaning
+from utils.db import get_engine_for_db
+from utils import result_cache
+from utils.scheduler import scheduler_stats
+from utils.db_async import benchmark_async_db
+from utils.profiling import list_profiles, load_profile, load_collapsed
 import os
 
 router = APIRouter()
@@ -8,26 +21,169 @@ router = APIRouter()
 @router.get("/chroma/{db_name}")
 def debug_chroma(db_name: str):
     """
-    Returns documents and metadata from Chroma schema and few-shot stores.
+    Returns records and versions of the schema snapshot and the few-shot index.
+    (Route name kept for compatibility; both indexes are now shared vector snapshots.)
     """
     try:
-        embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        embedding_model = get_embedding_model()
 
-        # Schema collection
-        schema_dir = f"./chroma_schemas/{db_name}"
-        schema_coll_name = f"schema_{db_name}"
-        schema_store = Chroma(collection_name=schema_coll_name, embedding_function=embedding_model, persist_directory=schema_dir)
-        schema_docs = schema_store._collection.get(include=["documents", "metadatas"])
+        # Schema snapshot
+        schema_snapshot = get_reader(schema_index_name(db_name)).get()
+        schema_docs = schema_snapshot.records if schema_snapshot is not None else []
 
-        # Few-shot collection
-        ex_store = Chroma(collection_name="fewshot_examples", embedding_function=embedding_model, persist_directory="./chroma_examples")
-        ex_docs = ex_store._collection.get(include=["documents", "metadatas"])
+        # Few-shot index
+        ex_docs = get_fewshot_index(embedding_model).examples
+        fewshot_snapshot = get_reader("fewshot").get()
 
         return {
             "schema_docs": schema_docs,
+            "schema_version": schema_snapshot.version if schema_snapshot is not None else None,
             "example_docs": ex_docs,
+            "example_version": fewshot_snapshot.version if fewshot_snapshot is not None else None,
+            "indexes": list_indexes(),
             "status": "success"
         }
 
     except Exception as e:
         return {"status": "error", "message": str(e)}
+
+@router.get("/embeddings/benchmark")
+def debug_embedding_backends(n_texts: int = 256):
+    """
+    Parity (cosine torch vs ONNX, must be ≥ 0.99) and embeddings/sec for both backends.
+    """
+    try:
+        return {
+            "parity": check_parity(),
+            "benchmark": benchmark_backends(n_texts=n_texts),
+            "status": "success"
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/sql-validation")
+def debug_sql_validation():
+    """
+    Pre-execution validation counters: every `invalid` is a MySQL round trip (and user re-ask) avoided.
+    """
+    return {"status": "success", "stats": dict(VALIDATION_STATS)}
+
+
+@router.get("/llm")
+def debug_llm_gateway():
+    """
+    LLM gateway accounting: calls, coalesced (single-flight) hits, retries, tokens and latency per purpose.
+    """
+    return {"status": "success", "stats": get_llm_gateway().stats()}
+
+
+@router.get("/llm/benchmark")
+def debug_llm_benchmark(n_requests: int = 64, distinct_prompts: int = 8):
+    """
+    Burst against the local stub backend (no API calls): coalescing + concurrency limits in isolation.
+    """
+    try:
+        return {"status": "success", "benchmark": benchmark_gateway(n_requests=n_requests, distinct_prompts=distinct_prompts)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/partitions/{db_name}")
+def debug_partition_pruning(db_name: str, limit: int = 20):
+    """
+    EXPLAIN of the most recent generated queries on this DB: partitions read vs. total per partitioned table.
+    """
+    try:
+        return {"status": "success", **explain_partitions(get_engine_for_db(db_name), db_name, limit=limit)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/pdf/benchmark")
+def debug_pdf_benchmark(path: str, workers: str = None):
+    """
+    pages/sec of the PDF extraction stage on a server-side file for several pool sizes, e.g. workers=1,2,4,8.
+    """
+    if not path.lower().endswith(".pdf") or not os.path.isfile(path):
+        return {"status": "error", "message": f"'{path}' is not a PDF file on the server."}
+    try:
+        counts = [int(w) for w in workers.split(",")] if workers else None
+        return {"status": "success", **benchmark_pdf_extraction(path, counts)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/cleaning/benchmark")
+def debug_cleaning_benchmark(rows: int = 200_000):
+    """
+    rows/sec of the upload cleaning stage vs. the previous clean_dataframe on a synthetic frame.
+    """
+    try:
+        return {"status": "success", **benchmark_cleaning(rows=min(rows, 5_000_000))}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/result-cache")
+def debug_result_cache(evict: bool = False):
+    """
+    Summary / chart cache: entries, bytes vs. budget and this worker's hit rate; evict=true trims it now.
+    """
+    if evict:
+        result_cache.evict()
+    return {"status": "success", "stats": result_cache.stats()}
+
+
+@router.get("/scheduler")
+def debug_scheduler():
+    """
+    Fair scheduler per resource (db / llm): running vs. budget and, per tenant, queue depth,
+    queue-time p50/p95, mean service time, admitted / shed counts (this worker).
+    """
+    return {"status": "success", "stats": scheduler_stats()}
+
+
+@router.get("/db/benchmark")
+async def debug_db_benchmark(db_name: str = None, concurrency: str = None, sleep_ms: int = 50, stand_in: bool = False):
+    """
+    Request concurrency vs latency for a query waiting `sleep_ms` in MySQL: sync engine in the
+    threadpool vs the async engine, plus how long a no-op waits for a threadpool worker meanwhile.
+    stand_in=true simulates the wait without MySQL. e.g. concurrency=1,8,32,128
+    """
+    try:
+        levels = tuple(max(1, min(int(c), 512)) for c in concurrency.split(",")) if concurrency else (1, 8, 32, 64, 128)
+        return {"status": "success", **await benchmark_async_db(levels, sleep_ms=max(0, min(sleep_ms, 1000)), db_name=db_name,
+                                                                 stand_in=stand_in)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/profiles")
+def debug_profiles(limit: int = 50):
+    """
+    Recent request profiles of this deployment (X-Profile: 1 or sampled, PROFILE_ENABLED=1), newest first.
+    """
+    return {"status": "success", "profiles": list_profiles(limit=limit)}
+
+
+@router.get("/profiles/{request_id}")
+def debug_profile(request_id: str):
+    """
+    One profile: duration, sample count, hottest leaf frames and the top allocation sites (tracemalloc).
+    """
+    try:
+        return {"status": "success", "profile": load_profile(request_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/profiles/{request_id}/collapsed", response_class=PlainTextResponse)
+def debug_profile_collapsed(request_id: str):
+    """
+    Collapsed stacks of the profile: `flamegraph.pl < file > out.svg`, or drop into speedscope.app.
+    """
+    try:
+        return PlainTextResponse(load_collapsed(request_id))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -1,9 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from utils.db import get_engine_for_db
-import pandas as pd
-import numpy as np
-import traceback, json
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from utils.query_governor import governed_read_async, cancel_query, describe_error, QueryRejected
+from utils.db_utils import dataframe_to_response
+from utils.scheduler import Overloaded
+import traceback
 
 router = APIRouter()
 
@@ -11,54 +13,52 @@ router = APIRouter()
 class QueryRequest(BaseModel):
     sql_query: str
     db_name: str
+    query_id: Optional[str] = None      # client-chosen id, usable with /cancel while running
+    max_rows: Optional[int] = None      # capped at GOVERNOR_MAX_ROWS
+    timeout_ms: Optional[int] = None
 
 
 @router.post("/")
-def execute_query(request: QueryRequest):
+async def execute_query(request: QueryRequest):
     try:
-        engine = get_engine_for_db(request.db_name)
-        with engine.connect() as conn:
-            df = pd.read_sql(request.sql_query, conn)
+        # Governor: EXPLAIN cost guard, MAX_EXECUTION_TIME, LIMIT injection; DuckDB or MySQL via the router
+        # (MySQL awaited on the async engine: no threadpool worker waits on the query)
+        df, info = await governed_read_async(
+            request.sql_query,
+            request.db_name,
+            query_id=request.query_id,
+            max_rows=request.max_rows,
+            timeout_ms=request.timeout_ms,
+        )
 
-        # --- Step 1: Clean numeric edge cases ---
-        df = df.replace([np.inf, -np.inf], None)
-        df = df.where(pd.notnull(df), None)
-
-        # --- Step 2: Convert all timestamps/dates to strings ---
-        for col in df.columns:
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
-                df[col] = df[col].astype(str)
-
-        # --- Step 3: Convert to plain Python objects ---
-        df = df.astype(object)
-
-        response = {
+        payload = await run_in_threadpool(dataframe_to_response, df)  # CPU-bound for large results: off the loop
+        return {
             "status": "success",
-            "rows": df.to_dict(orient="records"),
-            "columns": list(df.columns),
-            "row_count": len(df)
+            **payload,
+            "truncated": info["truncated"],
+            "query_id": info["query_id"],
+            "engine": info["engine"],
+            "governor": info,
         }
 
-        # --- Step 4: Validate JSON safety ---
-        try:
-            json.dumps(response, allow_nan=False)
-        except (TypeError, ValueError):
-            def clean_for_json(obj):
-                if isinstance(obj, float):
-                    if np.isnan(obj) or np.isinf(obj):
-                        return None
-                elif isinstance(obj, dict):
-                    return {k: clean_for_json(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [clean_for_json(x) for x in obj]
-                elif hasattr(obj, "isoformat"):  # Handle datetime objects
-                    return obj.isoformat()
-                return obj
-
-            response = clean_for_json(response)
+    except QueryRejected as e:
+        return {"status": "error", "detail": str(e), "governor": {"explain": e.explain}}
+    except Overloaded:
+        raise  # 429 + Retry-After (handler in main.py)
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "detail": describe_error(e)}
 
-        return response
 
+@router.post("/cancel/{query_id}")
+def cancel_query_route(query_id: str):
+    """
+    Cancels a running query by id (KILL QUERY on MySQL, interrupt on DuckDB).
+    """
+    try:
+        return cancel_query(query_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         traceback.print_exc()
-        return {"status": "error", "detail": str(e)}
+        raise HTTPException(status_code=500, detail=str(e))
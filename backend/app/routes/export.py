@@ -0,0 +1,100 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import BaseModel
+from typing import Optional
+from app.services.export_service import (
+    start_export, load_export, cancel_export, artifact_path, parse_range, iter_file, follow_file, MEDIA_TYPES,
+)
+import traceback
+
+router = APIRouter()
+
+
+class ExportRequest(BaseModel):
+    sql_query: str
+    db_name: str
+    format: str = "csv"              # csv | parquet | xlsx
+    gzip: bool = False               # csv → .csv.gz, parquet → gzip codec
+    max_rows: Optional[int] = None   # capped at EXPORT_MAX_ROWS
+    filename: Optional[str] = None   # without extension
+
+
+@router.post("/")
+def start_export_route(request: ExportRequest):
+    """
+    Starts writing the result to a spooled artifact; poll GET /{export_id}, download from /{export_id}/download.
+    """
+    try:
+        meta = start_export(request.sql_query, request.db_name, request.format, request.gzip,
+                            request.max_rows, request.filename)
+        return {"status": "success", "export": _public(meta)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _public(meta: dict) -> dict:
+    return {k: meta.get(k) for k in ("export_id", "status", "format", "gzip", "filename", "rows", "bytes",
+                                     "error", "elapsed_s", "rows_per_sec", "query_id")}
+
+
+@router.get("/{export_id}")
+def export_status_route(export_id: str):
+    try:
+        return {"status": "success", "export": _public(load_export(export_id))}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/{export_id}/download")
+def download_export_route(export_id: str, request: Request):
+    """
+    Finished artifact with Range support (206 / 416, If-Range) so interrupted downloads resume.
+    A CSV export that is still running is streamed as it is written (no Range, no length);
+    the connection is aborted if that export then fails or is cancelled.
+    """
+    try:
+        meta = load_export(export_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    path = artifact_path(meta)
+    media_type = MEDIA_TYPES[meta["suffix"]]
+    disposition = {"Content-Disposition": f'attachment; filename="{meta["filename"]}"'}
+
+    if meta["status"] == "running":
+        if meta["format"] != "csv":
+            return JSONResponse(status_code=409, content={"status": "error", "detail": "Export still running.",
+                                                          "export": _public(meta)})
+        return StreamingResponse(follow_file(export_id), media_type=media_type, headers=disposition)
+    if meta["status"] != "done":
+        raise HTTPException(status_code=409, detail=meta.get("error") or f"Export is {meta['status']}.")
+
+    size = meta["bytes"]
+    etag = f'"{export_id}-{size}"'
+    headers = {**disposition, "Accept-Ranges": "bytes", "ETag": etag}
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None  # artifact changed since the partial download: send it whole
+    try:
+        byte_range = parse_range(range_header, size) if size else None
+    except ValueError as e:
+        return JSONResponse(status_code=416, content={"status": "error", "detail": str(e)},
+                            headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(iter_file(path, 0, size - 1), media_type=media_type,
+                                 headers={**headers, "Content-Length": str(size)})
+    start, end = byte_range
+    return StreamingResponse(iter_file(path, start, end), status_code=206, media_type=media_type,
+                             headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}",
+                                      "Content-Length": str(end - start + 1)})
+
+
+@router.delete("/{export_id}")
+def cancel_export_route(export_id: str):
+    try:
+        return {"status": "success", "export": cancel_export(export_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -1,20 +1,31 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from app.services.nl2sql_service import generate_sql_from_nl
+from app.services.nl2sql_service import generate_sql_from_nl, save_confirmed_example, route_question
+from utils.scheduler import Overloaded
 import traceback
 
 router = APIRouter()
 
 class NLQueryRequest(BaseModel):
     question: str
-    db_name: str
-    table_name: str
+    db_name: str | None = None      # omitted → routed across all databases
+    table_name: str | None = None
+
+class RouteRequest(BaseModel):
+    question: str
+    k: int | None = None
+
+class ConfirmedExampleRequest(BaseModel):
+    question: str
+    sql_query: str
+    db_name: str | None = None
 
 
 @router.post("/")
 def nl2sql_route(request: NLQueryRequest):
     """
     Converts a natural language question into an SQL query for a specific database and table.
+    Without db_name the database is picked by the cross-database table router.
     """
     try:
         response = generate_sql_from_nl(
@@ -24,6 +35,39 @@ def nl2sql_route(request: NLQueryRequest):
         )
         return {"status": "success", **response}
 
+    except Overloaded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/route")
+def route_question_route(request: RouteRequest):
+    """
+    Returns the top (db, table) candidates for a question, without generating SQL.
+    """
+    try:
+        routed = route_question(request.question, k=request.k)
+        routed.pop("question_vector", None)
+        return {"status": "success", **routed}
+
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/examples")
+def save_example_route(request: ConfirmedExampleRequest):
+    """
+    Stores a user-confirmed question → SQL pair in the few-shot index (dedup + size cap).
+    """
+    try:
+        result = save_confirmed_example(request.question, request.sql_query, request.db_name)
+        return {"status": "success", **result}
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -3,7 +3,6 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import traceback
 from utils.db_utils import refresh_schema_cache
-from utils.chroma_utils import sync_chroma_schema_embeddings
 
 router = APIRouter()
 
@@ -13,12 +12,11 @@ class DBRefreshRequest(BaseModel):
 @router.post("/")
 def refresh_schema_and_embeddings(request: DBRefreshRequest):
     """
-    Refresh both SQLAlchemy schema cache and Chroma embeddings for the selected DB.
+    Re-synchronize the schema index snapshot for the selected DB (one incremental sync).
     """
     try:
         db_name = request.db_name
         refresh_schema_cache(db_name)
-        sync_chroma_schema_embeddings(db_name)
         
         return {
             "status": "success",
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+from app.services.report_service import (
+    create_report, list_reports, read_report, refresh_report, delete_report
+)
+from utils.scheduler import Overloaded
+import traceback
+
+router = APIRouter()
+
+
+class ReportCreateRequest(BaseModel):
+    name: str
+    db_name: str
+    question: Optional[str] = None
+    sql_query: Optional[str] = None
+    schedule: Optional[dict] = None      # {"every_minutes": 60} or {"daily_at": "06:00"}
+    summarize: bool = False
+
+
+@router.post("/")
+def create_report_route(request: ReportCreateRequest):
+    """
+    Saves a report (question and/or SQL + schedule) and materializes its first result.
+    """
+    try:
+        report = create_report(request.name, request.db_name, request.question, request.sql_query,
+                               request.schedule, request.summarize)
+        return {"status": "success", "report": report}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/")
+def list_reports_route():
+    return {"status": "success", "reports": list_reports()}
+
+
+@router.get("/{report_id}")
+def read_report_route(report_id: str):
+    """
+    Returns the materialized result; no query runs on read.
+    """
+    try:
+        return {"status": "success", **read_report(report_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/{report_id}/refresh")
+def refresh_report_route(report_id: str, force: bool = False):
+    """
+    Recomputes now if the source tables changed (incrementally where possible); force=true recomputes fully.
+    """
+    try:
+        report = refresh_report(report_id, force=force)
+        return {"status": "success", "report": report}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.delete("/{report_id}")
+def delete_report_route(report_id: str):
+    try:
+        delete_report(report_id)
+        return {"status": "success"}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
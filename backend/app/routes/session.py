@@ -0,0 +1,71 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+from app.services.session_service import (
+    create_session, load_session, delete_session, ask_in_session, execute_in_session
+)
+from utils.scheduler import Overloaded
+import traceback
+
+router = APIRouter()
+
+
+class SessionCreateRequest(BaseModel):
+    db_name: str
+    table_name: Optional[str] = None
+
+class SessionAskRequest(BaseModel):
+    question: str
+
+class SessionExecuteRequest(BaseModel):
+    sql_query: str
+
+
+@router.post("/")
+def create_session_route(request: SessionCreateRequest):
+    """
+    Starts a conversation bound to a database. Follow-ups reuse its tables, schema and last result.
+    """
+    state = create_session(request.db_name, request.table_name)
+    return {"status": "success", "session_id": state["session_id"]}
+
+
+@router.get("/{session_id}")
+def get_session_route(session_id: str):
+    try:
+        return {"status": "success", **load_session(session_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.delete("/{session_id}")
+def delete_session_route(session_id: str):
+    try:
+        delete_session(session_id)
+        return {"status": "success"}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/{session_id}/ask")
+def ask_route(session_id: str, request: SessionAskRequest):
+    """
+    Asks a question in the session. Returns mode=DB (SQL to execute) or mode=LOCAL (rows included).
+    """
+    try:
+        return ask_in_session(session_id, request.question)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Overloaded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{session_id}/execute")
+def execute_route(session_id: str, request: SessionExecuteRequest):
+    try:
+        return execute_in_session(session_id, request.sql_query)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from app.services.summarize_service import summarize_sql_result
+from utils.scheduler import Overloaded
 
 router = APIRouter()
 
@@ -15,5 +16,7 @@ def summarize_query(request: SummarizeRequest):
         if "error" in result:
             raise Exception(result["error"])
         return {"status": "success", **result}
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException, Request, Header
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import List, Optional
+from app.services.chunked_upload_service import (
+    init_upload, append_chunk, load_upload, commit_upload, abort_upload, UploadConflict,
+)
+from utils.db_utils import refresh_schema_cache
+import traceback
+
+router = APIRouter()
+
+
+class InitUploadRequest(BaseModel):
+    filename: str
+    db_name: str
+    total_size: int
+    table_name: Optional[str] = None
+    if_exists: str = "replace"  # allowed: replace, append, upsert, fail
+    key_columns: Optional[List[str]] = None
+    sha256: Optional[str] = None  # of the whole file; verified at commit
+
+
+class CommitUploadRequest(BaseModel):
+    sha256: Optional[str] = None
+
+
+def _conflict(e: UploadConflict):
+    # 409 + the offset the client should resume from
+    return JSONResponse(status_code=409, content={"status": "error", "error": str(e), "received": e.received})
+
+
+@router.post("/")
+def init_upload_route(request: InitUploadRequest):
+    """
+    Starts a resumable upload; send the bytes with PUT /{upload_id}?offset=N, then POST /{upload_id}/commit.
+    """
+    if request.if_exists not in ("replace", "append", "upsert", "fail"):
+        raise HTTPException(status_code=400, detail="if_exists must be one of 'replace','append','upsert','fail'")
+    try:
+        meta = init_upload(request.filename, request.db_name, request.total_size, request.table_name,
+                           request.if_exists, request.key_columns, request.sha256)
+        return {"status": "success", **meta}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put("/{upload_id}")
+async def append_chunk_route(upload_id: str, request: Request, offset: int,
+                             x_chunk_sha256: Optional[str] = Header(None)):
+    """
+    Raw chunk bytes as the request body, written at `offset`. A 409 carries the server's
+    `received` offset to resume from; re-sending a chunk that was already stored is harmless.
+    """
+    data = await request.body()
+    try:
+        # checksum, file lock and fsync block: keep them off the event loop
+        meta = await run_in_threadpool(append_chunk, upload_id, offset, data, x_chunk_sha256)
+        return {"status": "success", "received": meta["received"], "total_size": meta["total_size"],
+                "duplicate": meta.get("duplicate", False)}
+    except UploadConflict as e:
+        return _conflict(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/{upload_id}")
+def upload_status_route(upload_id: str):
+    """
+    Resume point (`received`) and how far the CSV has been parsed while receiving.
+    """
+    try:
+        return {"status": "success", **load_upload(upload_id)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/{upload_id}/commit")
+def commit_upload_route(upload_id: str, request: CommitUploadRequest = None):
+    try:
+        result = commit_upload(upload_id, request.sha256 if request else None)
+        if result.get("status") == "success":
+            refresh_schema_cache(result["db_name"], tables=[t["table_name"] for t in result.get("tables", [result])])
+        return result
+    except UploadConflict as e:
+        return _conflict(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/{upload_id}")
+def abort_upload_route(upload_id: str):
+    try:
+        abort_upload(upload_id)
+        return {"status": "success"}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
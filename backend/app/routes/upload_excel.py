@@ -1,10 +1,10 @@
 # backend/routes/upload_excel.py
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
 from app.services.upload_service import ingest_file_to_db
 import traceback
 from utils.db_utils import refresh_schema_cache
-from utils.chroma_utils import sync_chroma_schema_embeddings
 
 router = APIRouter()
 
@@ -13,21 +13,24 @@ async def upload_excel(
     file: UploadFile = File(...),
     table_name: Optional[str] = Form(None),
     db_name: str = Form(...),
-    if_exists: str = Form("replace")  # allowed: replace, append, fail
+    if_exists: str = Form("replace"),  # allowed: replace, append, upsert, fail
+    key_columns: Optional[str] = Form(None)  # upsert only, comma-separated; detected when omitted
 ):
-    if if_exists not in ("replace", "append", "fail"):
-        raise HTTPException(status_code=400, detail="if_exists must be one of 'replace','append','fail'")
+    if if_exists not in ("replace", "append", "upsert", "fail"):
+        raise HTTPException(status_code=400, detail="if_exists must be one of 'replace','append','upsert','fail'")
 
     try:
-        result = await ingest_file_to_db(file,db_name=db_name, table_name=table_name, if_exists=if_exists)
+        keys = [k.strip() for k in key_columns.split(",") if k.strip()] if key_columns else None
+        result = await ingest_file_to_db(file, db_name=db_name, table_name=table_name, if_exists=if_exists,
+                                         key_columns=keys)
 
-         # Step 2: Refresh SQLAlchemy cache
-        refresh_schema_cache(db_name)
-
-        # Step 3: Rebuild Chroma schema embeddings
-        sync_chroma_schema_embeddings(db_name)
+        # Step 2: Re-index only the uploaded table(s), once
+        if result.get("status") == "success":
+            await run_in_threadpool(refresh_schema_cache, db_name, tables=[t["table_name"] for t in result.get("tables", [result])])
 
         return {"status": "success", **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from utils.query_governor import governed_read, describe_error, QueryRejected
+from utils.db_utils import dataframe_to_response
+from app.services.nl2sql_service import generate_sql_from_nl
+from app.services.summarize_service import profile_result, summary_for, chart_for
+from utils.result_cache import frame_digest
+from utils.scheduler import Overloaded
+from app.services.session_service import record_first_turn, record_result
+
+# Fused question → SQL → rows → summary pipeline, streamed as NDJSON sections.
+# The result is read once: the summary, profile and chart reuse the same DataFrame
+# (the separate /summarize call re-runs the query), and the summary LLM call runs
+# while the rows are being streamed to the client.
+ASK_ROW_BATCH = int(os.getenv("ASK_ROW_BATCH", "500"))
+ASK_SUMMARY_WORKERS = int(os.getenv("ASK_SUMMARY_WORKERS", "4"))
+
+_summary_pool = ThreadPoolExecutor(max_workers=ASK_SUMMARY_WORKERS, thread_name_prefix="ask-summary")
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _timed_summary(sql_query, df, db_name, profile, digest):
+    start = time.perf_counter()
+    summary, cached = summary_for(sql_query, df, db_name, profile, digest)
+    return summary, cached, _ms(start)
+
+
+def _pipeline(question, db_name, table_name, max_rows, session_id, summarize, timings, pending):
+    # --- 1. generate (+ validate / one repair, inside the NL2SQL service) ---
+    timings["stage"] = "generate"
+    start = time.perf_counter()
+    gen = generate_sql_from_nl(question, db_name, table_name)
+    timings["generate_ms"] = _ms(start)
+    if gen.get("status") != "success":
+        yield {"section": "error", "stage": "generate", "detail": gen.get("error")}
+        return
+    for k, v in (gen.get("timings") or {}).items():
+        timings[f"generate.{k}"] = v
+    db_name, sql_query, validation = gen["db_name"], gen["sql_query"], gen["validation"]
+    yield {
+        "section": "sql",
+        "db_name": db_name,
+        "sql_query": sql_query,
+        "tables_used": gen["tables_used"],
+        "validation": validation,
+        "routing": gen.get("routing"),
+        "retrieval": gen.get("retrieval"),
+    }
+    if session_id:
+        record_first_turn(session_id, question, gen)
+
+    timings["stage"] = "validate"
+    if not validation.get("valid", True):
+        issues = validation.get("remaining_issues") or validation.get("issues", [])
+        yield {"section": "error", "stage": "validate",
+               "detail": "SQL references unknown identifiers: " + ", ".join(i["identifier"] for i in issues)}
+        return
+
+    # --- 2. execute through the governor (cost guard, row cap, timeout) ---
+    timings["stage"] = "execute"
+    start = time.perf_counter()
+    query_id = uuid.uuid4().hex
+    yield {"section": "executing", "query_id": query_id}  # cancel with POST /api/execute/cancel/{query_id}
+    try:
+        df, info = governed_read(sql_query, db_name, query_id=query_id, max_rows=max_rows)
+    except QueryRejected as e:
+        yield {"section": "error", "stage": "execute", "detail": str(e), "governor": {"explain": e.explain}}
+        return
+    except Overloaded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        yield {"section": "error", "stage": "execute", "detail": describe_error(e)}
+        return
+    timings["execute_ms"] = _ms(start)
+    if session_id:
+        record_result(session_id, df, sql_query)
+
+    # --- 3. profile, then start the summary before streaming the rows ---
+    timings["stage"] = "profile"
+    start = time.perf_counter()
+    profile = profile_result(df)
+    digest = frame_digest(df)  # content address for the summary / chart cache
+    timings["profile_ms"] = _ms(start)
+    future = None
+    if summarize and not df.empty:
+        # copy the request context: the summary is scheduled as this caller's LLM work
+        future = _summary_pool.submit(contextvars.copy_context().run, _timed_summary, sql_query, df, db_name, profile, digest)
+        pending.append(future)
+
+    # --- 4. stream the rows in batches while the LLM works ---
+    timings["stage"] = "stream"
+    start = time.perf_counter()
+    payload = dataframe_to_response(df)
+    yield {
+        "section": "result",
+        "columns": payload["columns"],
+        "row_count": payload["row_count"],
+        "truncated": info["truncated"],
+        "engine": info["engine"],
+        "governor": info,
+    }
+    rows = payload["rows"]
+    for offset in range(0, len(rows), ASK_ROW_BATCH):
+        yield {"section": "rows", "offset": offset, "rows": rows[offset:offset + ASK_ROW_BATCH]}
+    yield {"section": "profile", **profile}
+    chart_json, chart_cached = chart_for(df, profile, digest) if not df.empty else (None, False)
+    yield {"section": "chart", "chart_json": chart_json, "cached": chart_cached}
+    timings["stream_ms"] = _ms(start)
+
+    # --- 5. summary (usually finished by now) ---
+    if not summarize:
+        return
+    timings["stage"] = "summarize"
+    if future is None:
+        yield {"section": "summary", "summary": "No data returned for this query."}
+        return
+    start = time.perf_counter()
+    summary, cached, llm_ms = future.result()
+    timings["summary_wait_ms"] = _ms(start)  # time the client actually waited for the LLM
+    timings["summary_llm_ms"] = llm_ms
+    yield {"section": "summary", "summary": summary, "cached": cached}
+
+
+def ask_stream(question: str, db_name: str = None, table_name: str = None, max_rows: int = None,
+               session_id: str = None, summarize: bool = True):
+    """
+    Generator of response sections, each a dict with a "section" key:
+    sql → executing → result → rows (batches of ASK_ROW_BATCH) → profile → chart → summary → done.
+    On failure an "error" section (with the failing "stage") is followed by "done".
+    "done" carries the per-stage timings in ms.
+    """
+    started = time.perf_counter()
+    timings, pending = {}, []
+    try:
+        yield from _pipeline(question, db_name, table_name, max_rows, session_id, summarize, timings, pending)
+    except Overloaded as e:  # headers are already sent: the 429 travels as a section
+        yield {"section": "error", "stage": timings.get("stage"), "detail": str(e), "status_code": 429,
+               "retry_after": e.retry_after}
+    except Exception as e:
+        traceback.print_exc()
+        yield {"section": "error", "stage": timings.get("stage"), "detail": str(e)}
+    finally:
+        for future in pending:
+            future.cancel()  # client went away before the summary was needed
+    timings.pop("stage", None)
+    timings["total_ms"] = _ms(started)
+    print(f"[Ask] ✅ '{question[:60]}' timings: {timings}")
+    yield {"section": "done", "timings": timings}
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from utils.schema_index import get_schema_snapshot
+from utils.query_governor import governed_read, describe_error, QueryRejected
+from utils.db_utils import dataframe_to_response
+from app.services.nl2sql_service import generate_sql_from_nl, embedding_model
+
+# Jobs live on disk so any uvicorn worker can answer a progress poll;
+# the questions themselves run on the pool of the worker that accepted the job.
+BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", "./jobs")
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_RESULT_ROWS = int(os.getenv("BATCH_RESULT_ROWS", "200"))   # rows kept per question in the job file
+BATCH_JOB_TTL_SECONDS = int(os.getenv("BATCH_JOB_TTL_SECONDS", str(24 * 3600)))
+
+_pool = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="batch")
+_job_locks = {}
+_job_locks_guard = threading.Lock()
+
+
+def _job_path(job_id: str) -> str:
+    if not job_id or not all(c.isalnum() for c in job_id):
+        raise KeyError(f"Unknown job '{job_id}'.")
+    return os.path.join(BATCH_JOB_DIR, f"{job_id}.json")
+
+
+def _cancel_path(job_id: str) -> str:
+    return _job_path(job_id)[:-len(".json")] + ".cancel"
+
+
+def _job_lock(job_id: str) -> threading.Lock:
+    with _job_locks_guard:
+        return _job_locks.setdefault(job_id, threading.Lock())
+
+
+def _release_lock(job_id: str):
+    """The job has no writer left: drop its lock so _job_locks does not grow with every job."""
+    with _job_locks_guard:
+        _job_locks.pop(job_id, None)
+
+
+def _save(job: dict):
+    job["updated_at"] = time.time()
+    path = _job_path(job["job_id"])
+    tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, default=str)
+    os.replace(tmp, path)
+
+
+def load_job(job_id: str) -> dict:
+    path = _job_path(job_id)
+    if not os.path.exists(path):
+        raise KeyError(f"Unknown job '{job_id}'.")
+    with open(path, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    if job.get("status") == "running" and os.path.exists(_cancel_path(job_id)):
+        job["status"] = "cancelled"  # cancel marker not yet picked up by the job's writer
+    return job
+
+
+def _prune_expired():
+    if not os.path.isdir(BATCH_JOB_DIR):
+        return
+    cutoff = time.time() - BATCH_JOB_TTL_SECONDS
+    for name in os.listdir(BATCH_JOB_DIR):
+        path = os.path.join(BATCH_JOB_DIR, name)
+        try:
+            if name.endswith((".json", ".cancel")) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _save_checked(job: dict):
+    """
+    _save for the job's own writer (caller holds the job lock): the stored status is re-read
+    first, so a cancel requested through any worker is never overwritten by a stale "running".
+    """
+    if _cancel_requested(job["job_id"]) and job["status"] == "running":
+        job["status"] = "cancelled"
+        job["finished_at"] = time.time()
+    _save(job)
+
+
+def _update_item(job: dict, index: int, **fields):
+    """Apply one item's progress to the in-memory job and persist it (one writer per job)."""
+    with _job_lock(job["job_id"]):
+        job["items"][index].update(fields)
+        items = job["items"]
+        job["progress"] = {
+            "total": len(items),
+            "done": sum(i["status"] in ("done", "error", "skipped") for i in items),
+            "failed": sum(i["status"] == "error" for i in items),
+        }
+        finished = job["progress"]["done"] == len(items)
+        if finished and job["status"] == "running" and not _cancel_requested(job["job_id"]):
+            job["status"] = "completed"
+            job["finished_at"] = time.time()
+        _save_checked(job)
+    if finished:
+        _release_lock(job["job_id"])
+
+
+def _cancel_requested(job_id: str) -> bool:
+    try:
+        return load_job(job_id).get("status") == "cancelled"
+    except KeyError:
+        return True
+
+
+def _run_item(job: dict, index: int, snapshot, question_vector):
+    job_id, item = job["job_id"], job["items"][index]
+    if _cancel_requested(job_id):
+        _update_item(job, index, status="skipped")
+        return
+    _update_item(job, index, status="running")
+    start = time.perf_counter()
+    try:
+        result = generate_sql_from_nl(item["question"], job["db_name"],
+                                      question_vector=question_vector, schema_snapshot=snapshot)
+        if result.get("status") != "success":
+            _update_item(job, index, status="error", error=result.get("error"))
+            return
+        fields = {
+            "sql_query": result["sql_query"],
+            "tables_used": result["tables_used"],
+            "validation": result.get("validation"),
+            "generate_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        if job["execute"]:
+            exec_start = time.perf_counter()
+            df, info = governed_read(result["sql_query"], job["db_name"], max_rows=job.get("max_rows"))
+            fields.update(
+                result=dataframe_to_response(df.head(BATCH_RESULT_ROWS)),
+                row_count=len(df),
+                truncated=info["truncated"] or len(df) > BATCH_RESULT_ROWS,
+                engine=info["engine"],
+                execute_ms=round((time.perf_counter() - exec_start) * 1000, 1),
+            )
+        _update_item(job, index, status="done", **fields)
+    except QueryRejected as e:
+        _update_item(job, index, status="error", error=str(e), governor={"explain": e.explain})
+    except Exception as e:
+        traceback.print_exc()
+        _update_item(job, index, status="error", error=describe_error(e))
+
+
+def _run_job(job: dict):
+    """Shared work first (catalog load + one batched embedding pass), then questions fan out on the pool."""
+    try:
+        start = time.perf_counter()
+        snapshot = get_schema_snapshot(job["db_name"])
+        if snapshot is None:
+            raise Exception(f"No schema index for database '{job['db_name']}'.")
+        questions = [i["question"] for i in job["items"]]
+        vectors = embedding_model.embed_documents(questions)
+        with _job_lock(job["job_id"]):
+            job["prepare_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            _save_checked(job)
+            if job["status"] == "cancelled":  # cancelled while preparing: no question is started
+                for item in job["items"]:
+                    item["status"] = "skipped"
+                job["progress"]["done"] = len(job["items"])
+                _save(job)
+        if job["status"] == "cancelled":
+            _release_lock(job["job_id"])
+            print(f"[Batch] 🛑 Job {job['job_id']} cancelled before its questions started")
+            return
+        print(f"[Batch] ⚙️ Job {job['job_id']}: catalog {snapshot.name}@{snapshot.version}, embedded {len(questions)} questions in one pass")
+    except Exception as e:
+        traceback.print_exc()
+        with _job_lock(job["job_id"]):
+            if job["status"] == "running":
+                job.update(status="error", error=str(e), finished_at=time.time())
+            _save_checked(job)
+        _release_lock(job["job_id"])
+        return
+    for index, vec in enumerate(vectors):
+        _pool.submit(_run_item, job, index, snapshot, vec)
+
+
+def submit_job(db_name: str, questions: list, execute: bool = True, max_rows: int = None) -> dict:
+    questions = [q.strip() for q in questions if q and q.strip()]
+    if not questions:
+        raise ValueError("At least one question is required.")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"A batch job accepts at most {BATCH_MAX_QUESTIONS} questions.")
+    _prune_expired()
+    os.makedirs(BATCH_JOB_DIR, exist_ok=True)
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "db_name": db_name,
+        "execute": execute,
+        "max_rows": max_rows,
+        "status": "running",
+        "items": [{"index": i, "question": q, "status": "pending"} for i, q in enumerate(questions)],
+        "progress": {"total": len(questions), "done": 0, "failed": 0},
+        "created_at": time.time(),
+        "pid": os.getpid(),
+    }
+    _save(job)
+    _pool.submit(_run_job, job)
+    print(f"[Batch] ✅ Job {job['job_id']} queued: {len(questions)} questions on '{db_name}'")
+    return job
+
+
+def cancel_job(job_id: str) -> dict:
+    """
+    Pending questions are skipped; questions already running finish normally.
+    Only a marker file is written here: the job file has a single writer (the worker running the
+    job), which re-reads the status before each save and records the cancellation itself.
+    """
+    job = load_job(job_id)
+    if job["status"] in ("running", "cancelled"):
+        with open(_cancel_path(job_id), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+        job["status"] = "cancelled"
+    return job
@@ -0,0 +1,329 @@
+import io
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from app.services.upload_service import ingest_path_to_db
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: single-worker only
+    fcntl = None
+
+# Resumable uploads: init → PUT chunks at explicit offsets → commit.
+# State is the data file itself (its size is the resume offset) plus meta.json, both on disk,
+# so a chunk may land on any uvicorn worker. CSV uploads are parsed while chunks arrive:
+# every complete record block is parsed into a pickled DataFrame chunk (all columns as text) in the
+# background; column types are inferred once over the whole file at commit.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(16 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+SUPPORTED_SUFFIXES = (".csv", ".xlsx", ".xls", ".pdf")
+
+_parser_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-parse")
+
+
+class UploadConflict(Exception):
+    """Chunk offset does not match what the server has; carries the offset to resume from."""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+def _upload_dir(upload_id: str) -> str:
+    if not upload_id or not all(c.isalnum() for c in upload_id):
+        raise KeyError(f"Unknown upload '{upload_id}'.")
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+
+def _paths(upload_id: str) -> dict:
+    base = _upload_dir(upload_id)
+    return {"dir": base, "meta": os.path.join(base, "meta.json"), "data": os.path.join(base, "data.part"),
+            "parse": os.path.join(base, "parse.json"), "chunks": os.path.join(base, "parsed")}
+
+
+class _Lock:
+    """
+    Per-upload file lock shared by all workers; blocking=False yields None if it is held.
+    "write" guards the data file + meta.json, "parse" guards parse.json + parsed chunks,
+    so appends never wait for the background parser.
+    """
+
+    def __init__(self, upload_id: str, name: str = "write", blocking: bool = True):
+        self.path = os.path.join(_upload_dir(upload_id), f".{name}.lock")
+        self.blocking, self.fh = blocking, None
+
+    def __enter__(self):
+        try:
+            self.fh = open(self.path, "a+")
+        except FileNotFoundError:
+            raise KeyError(f"Unknown upload '{os.path.basename(os.path.dirname(self.path))}'.")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.fh.fileno(), fcntl.LOCK_EX | (0 if self.blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                self.fh.close()
+                return None
+        return self
+
+    def __exit__(self, *exc):
+        if self.fh is not None and not self.fh.closed:
+            if fcntl is not None:
+                fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+            self.fh.close()
+
+
+def _write_json(path: str, obj: dict):
+    tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _save(meta: dict):
+    meta = {k: v for k, v in meta.items() if k not in ("received", "parse")}  # derived on load
+    meta["updated_at"] = time.time()
+    _write_json(_paths(meta["upload_id"])["meta"], meta)
+
+
+def _load_parse_state(upload_id: str) -> dict:
+    try:
+        with open(_paths(upload_id)["parse"], "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"offset": 0, "rows": 0, "chunks": 0, "columns": None, "error": None}
+
+
+def load_upload(upload_id: str) -> dict:
+    """meta + `received` (= size of the data file, the resume offset) + incremental parse progress."""
+    paths = _paths(upload_id)
+    if not os.path.exists(paths["meta"]):
+        raise KeyError(f"Unknown upload '{upload_id}'.")
+    with open(paths["meta"], "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["received"] = os.path.getsize(paths["data"]) if os.path.exists(paths["data"]) else 0
+    meta["parse"] = _load_parse_state(upload_id) if meta["streaming_parse"] else None
+    return meta
+
+
+def _prune_expired():
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+    cutoff = time.time() - UPLOAD_TTL_SECONDS
+    for name in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def init_upload(filename: str, db_name: str, total_size: int, table_name: str = None,
+                if_exists: str = "replace", key_columns: list = None, sha256: str = None) -> dict:
+    if not filename.lower().endswith(SUPPORTED_SUFFIXES):
+        raise ValueError(f"Unsupported file type; expected one of {', '.join(SUPPORTED_SUFFIXES)}.")
+    if total_size <= 0 or total_size > UPLOAD_MAX_BYTES:
+        raise ValueError(f"total_size must be between 1 and {UPLOAD_MAX_BYTES} bytes.")
+    _prune_expired()
+    upload_id = uuid.uuid4().hex
+    paths = _paths(upload_id)
+    os.makedirs(paths["chunks"], exist_ok=True)
+    open(paths["data"], "wb").close()
+    meta = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "db_name": db_name,
+        "table_name": table_name,
+        "if_exists": if_exists,
+        "key_columns": key_columns,
+        "total_size": total_size,
+        "sha256": sha256.lower() if sha256 else None,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "status": "receiving",
+        "streaming_parse": filename.lower().endswith(".csv"),  # xlsx / pdf are containers: parsed at commit
+        "created_at": time.time(),
+    }
+    _save(meta)
+    print(f"[Upload] ✅ Started chunked upload {upload_id}: {filename} ({total_size} bytes) → '{db_name}'")
+    return load_upload(upload_id)
+
+
+def append_chunk(upload_id: str, offset: int, data: bytes, chunk_sha256: str = None) -> dict:
+    """
+    Writes `data` at `offset`. Offsets must be contiguous: a retransmitted chunk that is already
+    fully stored (ack lost) is accepted as a no-op; a gap raises UploadConflict with the resume offset.
+    """
+    if len(data) > UPLOAD_MAX_CHUNK_BYTES:
+        raise ValueError(f"Chunks are limited to {UPLOAD_MAX_CHUNK_BYTES} bytes.")
+    if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise ValueError("Chunk checksum mismatch; resend this chunk.")
+    paths = _paths(upload_id)
+    with _Lock(upload_id):
+        meta = load_upload(upload_id)
+        if meta["status"] != "receiving":
+            raise UploadConflict(f"Upload is already {meta['status']}.", meta["received"])
+        received = meta["received"]
+        if offset + len(data) <= received:
+            return {**meta, "duplicate": True}
+        if offset != received:
+            raise UploadConflict(f"Expected offset {received}, got {offset}.", received)
+        if received + len(data) > meta["total_size"]:
+            raise ValueError("Chunk goes past the declared total_size.")
+        with open(paths["data"], "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        meta["received"] = received + len(data)
+    if meta["streaming_parse"]:
+        _parser_pool.submit(_parse_available, upload_id, False)
+    return meta
+
+
+def _complete_records_end(block: bytes) -> int:
+    """Length of the prefix of `block` that ends on a record boundary (newline outside quotes)."""
+    end = len(block)
+    while True:
+        nl = block.rfind(b"\n", 0, end)
+        if nl < 0:
+            return 0
+        if block.count(b'"', 0, nl) % 2 == 0:
+            return nl + 1
+        end = nl
+
+
+def _parse_available(upload_id: str, final: bool = False):
+    """
+    Parses every complete CSV record received so far into a pickled DataFrame chunk.
+    Runs in the background after each append (skipped while another worker is parsing) and
+    once more, blocking, at commit (final=True also parses a tail without a trailing newline).
+    """
+    try:
+        with _Lock(upload_id, "parse", blocking=final) as lock:
+            if lock is None:
+                return
+            paths = _paths(upload_id)
+            state = _load_parse_state(upload_id)
+            if state["error"]:
+                return
+            with open(paths["data"], "rb") as f:
+                f.seek(state["offset"])
+                block = f.read()
+            end = len(block) if final else _complete_records_end(block)
+            if end == 0:
+                return
+            block, consumed = block[:end], 0
+            if state["columns"] is None:
+                header_end = _complete_records_end(block[:block.find(b"\n") + 1]) if b"\n" in block else len(block)
+                state["columns"] = list(pd.read_csv(io.BytesIO(block[:header_end]), nrows=0).columns)
+                block, consumed = block[header_end:], header_end
+            if block.strip():
+                # text only: per-chunk inference would type a column by the rows that happened to be in the chunk
+                chunk = pd.read_csv(io.BytesIO(block), header=None, names=state["columns"], dtype=str)
+                chunk.to_pickle(os.path.join(paths["chunks"], f"{state['chunks']:06d}.pkl"))
+                state["chunks"] += 1
+                state["rows"] += len(chunk)
+            state["offset"] += consumed + len(block)
+            _write_json(paths["parse"], state)
+    except (KeyError, FileNotFoundError):
+        pass  # upload aborted / committed meanwhile
+    except Exception as e:
+        # parsing ahead is an optimization: commit then parses the whole file instead
+        print(f"[Upload] ⚠️ Incremental parse failed for {upload_id}: {e}")
+        try:
+            state = _load_parse_state(upload_id)
+            state["error"] = str(e)
+            _write_json(_paths(upload_id)["parse"], state)
+        except Exception:
+            pass
+
+
+_BOOL_TEXT = {"True": True, "TRUE": True, "true": True, "False": False, "FALSE": False, "false": False}
+
+
+def _infer_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The column types pd.read_csv would infer over the whole file (int / float / bool, else text),
+    for a frame concatenated from text-only chunks.
+    """
+    for col in df.columns:
+        values = df[col].dropna()
+        if values.empty:
+            if len(df):
+                df[col] = df[col].astype(float)
+        elif values.isin(_BOOL_TEXT.keys()).all():
+            df[col] = df[col].map(_BOOL_TEXT)
+        else:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def commit_upload(upload_id: str, sha256: str = None) -> dict:
+    """Verifies size + checksum, then ingests (CSV: from the chunks parsed while receiving)."""
+    paths = _paths(upload_id)
+    meta = load_upload(upload_id)
+    if meta["received"] != meta["total_size"]:
+        raise UploadConflict(f"Upload incomplete: {meta['received']}/{meta['total_size']} bytes.", meta["received"])
+    expected = (sha256 or meta.get("sha256") or "").lower()
+    if expected and _file_sha256(paths["data"]) != expected:
+        raise ValueError("File checksum mismatch; restart the upload.")
+
+    with _Lock(upload_id):
+        meta = load_upload(upload_id)
+        if meta["status"] != "receiving":
+            raise UploadConflict(f"Upload is already {meta['status']}.", meta["received"])
+        meta["status"] = "committing"
+        _save(meta)
+
+    result = None
+    try:
+        start = time.perf_counter()
+        df, state = None, None
+        if meta["streaming_parse"]:
+            _parse_available(upload_id, final=True)
+            state = _load_parse_state(upload_id)
+            if not state["error"] and state["offset"] == meta["received"]:
+                files = sorted(os.listdir(paths["chunks"]))
+                frames = [pd.read_pickle(os.path.join(paths["chunks"], name)) for name in files]
+                df = _infer_types(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame(columns=state["columns"])
+        parse_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        result = ingest_path_to_db(paths["data"], meta["filename"], meta["db_name"], meta["table_name"],
+                                   meta["if_exists"], meta["key_columns"], df=df)
+        result["upload"] = {
+            "upload_id": upload_id,
+            "bytes": meta["received"],
+            "parsed_while_receiving": df is not None,
+            "parsed_chunks": state["chunks"] if state else 0,
+            "commit_parse_ms": parse_ms,
+        }
+    finally:
+        if result is not None and result.get("status") == "success":
+            shutil.rmtree(paths["dir"], ignore_errors=True)
+        else:
+            meta["status"] = "receiving"  # keep the bytes: the client may fix the target and commit again
+            _save(meta)
+    return result
+
+
+def abort_upload(upload_id: str):
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
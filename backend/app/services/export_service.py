@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import uuid
+import gzip
+import shutil
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.query_governor import governed_stream, cancel_query, describe_error, QueryRejected
+
+# Exports: the query is streamed from a server-side cursor in batches straight into a
+# spooled artifact on disk (CSV / CSV.gz / Parquet / write-only XLSX), so memory stays
+# constant. State lives next to the artifact (meta.json) so any worker can serve the
+# download; finished artifacts are served with HTTP Range support (resumable downloads).
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "5000000"))
+EXPORT_TIMEOUT_MS = int(os.getenv("EXPORT_TIMEOUT_MS", str(15 * 60 * 1000)))
+EXPORT_TTL_SECONDS = int(os.getenv("EXPORT_TTL_SECONDS", "3600"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+XLSX_MAX_SHEET_ROWS = 1_048_575  # + header row
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "xlsx": ".xlsx"}
+MEDIA_TYPES = {".csv": "text/csv", ".csv.gz": "application/gzip", ".parquet": "application/vnd.apache.parquet",
+               ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+_export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+# --- artifact writers: write(batch) per DataFrame batch, close() once ---
+class _CsvWriter:
+    def __init__(self, path: str, compress: bool):
+        self.fh = gzip.open(path, "wt", encoding="utf-8", newline="") if compress else \
+            open(path, "w", encoding="utf-8", newline="")
+        self.header = True
+
+    def write(self, df: pd.DataFrame):
+        df.to_csv(self.fh, index=False, header=self.header)
+        self.header = False
+        self.fh.flush()  # followers of a running export read what is on disk
+
+    def close(self):
+        self.fh.close()
+
+
+class _ParquetWriter:
+    @staticmethod
+    def _stable_type(field):
+        """
+        Type a column keeps for the whole file. pyarrow infers a DECIMAL's precision from the values
+        of one batch, so later batches with wider values would not fit: use the widest precision
+        (the scale is the column's, MySQL returns it on every value).
+        """
+        import pyarrow as pa
+        if pa.types.is_null(field.type):
+            return field.with_type(pa.string())  # all-NULL in the first batch: no type yet
+        if pa.types.is_decimal(field.type):
+            wide = pa.decimal128(38, field.type.scale) if field.type.precision <= 38 else pa.decimal256(76, field.type.scale)
+            return field.with_type(wide)
+        return field
+
+    def __init__(self, path: str, compress: bool):
+        self.path, self.compression = path, "gzip" if compress else "snappy"
+        self.writer, self.schema = None, None
+
+    def write(self, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.schema = pa.schema([self._stable_type(f) for f in table.schema]).remove_metadata()
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        try:
+            table = table.cast(self.schema)  # e.g. an int column that is float in a batch with NULLs
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Column types changed between batches, export as CSV instead: {e}")
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({}), self.path)
+        else:
+            self.writer.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path: str, compress: bool):
+        from openpyxl import Workbook
+        self.path = path
+        self.wb = Workbook(write_only=True)  # rows are streamed to a temp file, not kept in memory
+        self.ws, self.sheet_rows, self.columns = None, 0, None
+
+    def _new_sheet(self):
+        self.ws = self.wb.create_sheet(f"result_{len(self.wb.worksheets) + 1}" if self.ws is not None else "result")
+        self.ws.append(self.columns)
+        self.sheet_rows = 0
+
+    def write(self, df: pd.DataFrame):
+        if self.columns is None:
+            self.columns = [str(c) for c in df.columns]
+            self._new_sheet()
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = df[col].dt.tz_localize(None)  # Excel has no time zones
+        values = df.astype(object).where(df.notna(), None).to_numpy()
+        for row in values:
+            if self.sheet_rows >= XLSX_MAX_SHEET_ROWS:
+                self._new_sheet()
+            self.ws.append([v.item() if isinstance(v, np.generic) else v for v in row])
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.ws is None:
+            self.wb.create_sheet("result")
+        self.wb.save(self.path)
+
+
+_WRITERS = {"csv": _CsvWriter, "parquet": _ParquetWriter, "xlsx": _XlsxWriter}
+
+
+# --- state on disk ---
+def _export_dir(export_id: str) -> str:
+    if not export_id or not all(c.isalnum() for c in export_id):
+        raise KeyError(f"Unknown export '{export_id}'.")
+    return os.path.join(EXPORT_DIR, export_id)
+
+
+def _meta_path(export_id: str) -> str:
+    return os.path.join(_export_dir(export_id), "meta.json")
+
+
+def _save(meta: dict):
+    meta["updated_at"] = time.time()
+    path = _meta_path(meta["export_id"])
+    tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def load_export(export_id: str) -> dict:
+    path = _meta_path(export_id)
+    if not os.path.exists(path):
+        raise KeyError(f"Unknown export '{export_id}'.")
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    artifact = artifact_path(meta)
+    meta["bytes"] = os.path.getsize(artifact) if os.path.exists(artifact) else 0
+    return meta
+
+
+def artifact_path(meta: dict) -> str:
+    return os.path.join(_export_dir(meta["export_id"]), "data" + meta["suffix"])
+
+
+def _cancel_requested(export_id: str) -> bool:
+    return os.path.exists(os.path.join(_export_dir(export_id), "cancel"))
+
+
+def _prune_expired():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(os.path.join(path, "meta.json")) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+# --- lifecycle ---
+def start_export(sql_query: str, db_name: str, fmt: str = "csv", compress: bool = False,
+                 max_rows: int = None, filename: str = None) -> dict:
+    fmt = (fmt or "csv").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}.")
+    if compress and fmt == "xlsx":
+        raise ValueError("XLSX files are already zip-compressed; gzip is available for csv and parquet.")
+    _prune_expired()
+    export_id = uuid.uuid4().hex
+    suffix = FORMATS[fmt] + (".gz" if compress and fmt == "csv" else "")
+    os.makedirs(_export_dir(export_id), exist_ok=True)
+    meta = {
+        "export_id": export_id,
+        "query_id": f"export-{export_id}",
+        "db_name": db_name,
+        "sql_query": sql_query,
+        "format": fmt,
+        "gzip": bool(compress),
+        "suffix": suffix,
+        "filename": re.sub(r"[^A-Za-z0-9._-]+", "_", filename or f"{db_name}_export") + suffix,
+        "max_rows": max(1, min(int(max_rows or EXPORT_MAX_ROWS), EXPORT_MAX_ROWS)),
+        "status": "running",
+        "rows": 0,
+        "created_at": time.time(),
+    }
+    _save(meta)
+    _export_pool.submit(_run_export, export_id)
+    print(f"[Export] ✅ Started {export_id}: {fmt}{' (gzip)' if compress else ''} from '{db_name}'")
+    return load_export(export_id)
+
+
+def _run_export(export_id: str):
+    meta = load_export(export_id)
+    start = time.perf_counter()
+    writer = None
+    try:
+        writer = _WRITERS[meta["format"]](artifact_path(meta), meta["gzip"])
+        batches = governed_stream(meta["sql_query"], meta["db_name"], EXPORT_BATCH_ROWS,
+                                  query_id=meta["query_id"], max_rows=meta["max_rows"], timeout_ms=EXPORT_TIMEOUT_MS)
+        try:
+            for batch in batches:
+                if _cancel_requested(export_id):
+                    meta["status"] = "cancelled"
+                    break
+                writer.write(batch)
+                meta["rows"] += len(batch)
+                meta["batches"] = meta.get("batches", 0) + 1
+                _save(meta)  # progress for GET /api/export/{id}
+        finally:
+            batches.close()
+        writer.close()
+        writer = None
+        if meta["status"] == "running":
+            meta["status"] = "done"
+    except QueryRejected as e:
+        meta.update(status="error", error=str(e), governor={"explain": e.explain})
+    except Exception as e:
+        if _cancel_requested(export_id):
+            meta["status"] = "cancelled"  # the KILL QUERY surfaced as an error
+        else:
+            traceback.print_exc()
+            meta.update(status="error", error=describe_error(e))
+    finally:
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception:
+                pass
+    meta["elapsed_s"] = round(time.perf_counter() - start, 2)
+    meta["rows_per_sec"] = int(meta["rows"] / meta["elapsed_s"]) if meta["elapsed_s"] else None
+    try:
+        _save(meta)
+    except (KeyError, OSError):
+        return  # deleted while running
+    if meta["status"] == "cancelled":
+        shutil.rmtree(_export_dir(export_id), ignore_errors=True)
+    print(f"[Export] {'✅' if meta['status'] == 'done' else '⚠️'} {export_id}: {meta['status']}, "
+          f"{meta['rows']} rows in {meta['elapsed_s']}s")
+
+
+def cancel_export(export_id: str) -> dict:
+    """Stops a running export (KILL QUERY on its cursor) or deletes a finished artifact."""
+    meta = load_export(export_id)
+    if meta["status"] == "running":
+        open(os.path.join(_export_dir(export_id), "cancel"), "w").close()
+        try:
+            cancel_query(meta["query_id"])
+        except Exception as e:
+            print(f"[Export] ⚠️ Could not kill query of {export_id}: {e}")
+        return {"export_id": export_id, "status": "cancelling"}
+    shutil.rmtree(_export_dir(export_id), ignore_errors=True)
+    return {"export_id": export_id, "status": "deleted"}
+
+
+# --- download ---
+def parse_range(header: str, size: int):
+    """
+    'bytes=a-b' / 'bytes=a-' / 'bytes=-n' → (start, end) inclusive; None = serve the whole file.
+    Raises ValueError for unsatisfiable ranges (→ 416). Multi-range requests get the whole file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0:
+                raise ValueError
+            start, end = max(0, size - n), size - 1
+        else:
+            start, end = int(first), int(last) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range '{header}'.")
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(f"Range '{header}' not satisfiable for {size} bytes.")
+    return start, end
+
+
+def iter_file(path: str, start: int, end: int, block: int = 256 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def follow_file(export_id: str, block: int = 256 * 1024, poll_s: float = 0.25):
+    """
+    CSV artifacts only: stream the bytes written so far and keep following until the export ends.
+    An export that does not end "done" raises mid-stream, so the connection is aborted and the
+    client sees a failed download instead of a complete-looking, truncated CSV.
+    """
+    meta = load_export(export_id)
+    path = artifact_path(meta)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block)
+            if data:
+                yield data
+                continue
+            meta = load_export(export_id)  # KeyError once deleted: abort as well
+            if meta["status"] != "running":
+                rest = f.read()
+                if rest:
+                    yield rest
+                if meta["status"] != "done":
+                    raise RuntimeError(f"Export {export_id} ended '{meta['status']}': {meta.get('error') or 'no error recorded'}")
+                return
+            time.sleep(poll_s)
@@ -1,24 +1,23 @@
 import os
+import time
 import traceback
 from dotenv import load_dotenv
-from sqlalchemy import inspect
-from utils.db import get_engine_for_db
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from utils.chroma_utils import sync_chroma_schema_embeddings
-from utils.fewshot_utils import build_fewshot_example_store
+from utils.schema_index import get_schema_snapshot, table_records, search_tables, select_columns, count_tokens
+from utils.fewshot_utils import get_fewshot_index, FEWSHOT_EXAMPLES
+from utils.embeddings import get_embedding_model
+from utils.sql_validator import validate_sql, build_repair_prompt, record_stat
+from utils.lexical_index import get_lexical_index, rrf_fuse
+from utils.db_router import get_table_router
+from utils.llm_gateway import get_llm_gateway
+from utils.partitioning import record_generated_query
+from utils.scheduler import Overloaded
 
 load_dotenv()
 
 # --- LLM + embedding initialization (singleton-style) ---
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0,
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+llm = get_llm_gateway()  # shared: single-flight, concurrency limits, retry/backoff, token accounting
 
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+embedding_model = get_embedding_model()  # torch or ONNX/int8, see EMBEDDING_BACKEND
 
 # --- Static default examples (will be indexed into chroma_examples if empty) ---
 STATIC_EXAMPLES = [
@@ -53,69 +52,131 @@ STATIC_EXAMPLES = [
 
 
 
-def _get_relevant_examples(example_store: Chroma, question: str, k: int = 3):
+def _get_relevant_examples(question_vector, k: int = 3, question: str = None):
     """
-    Retrieve top-k semantically similar few-shot examples to the given question.
+    Retrieve top-k semantically similar few-shot examples from the in-process index
+    (token overlap with `question` when the lexical fast path skipped the embedding).
     Returns a formatted string block ready to inject into the LLM prompt.
     """
     try:
-        # Perform similarity search
-        hits = example_store.similarity_search(question, k=k)
-        examples = []
+        index = get_fewshot_index(embedding_model)
+        hits = index.search(question_vector, k=k) if question_vector is not None else index.search_lexical(question, k=k)
+        examples = [f"Q: {ex['input']}\nSQL: {ex['sql']}" for _, ex in hits]
 
-        for h in hits:
-            # h.page_content should look like "Q: ...\nSQL: ..."
-            content = getattr(h, "page_content", "").strip()
-
-            if "SQL:" in content:
-                q_text, sql_text = content.split("SQL:", 1)
-                q_text = q_text.replace("Q:", "").strip()
-                sql_text = sql_text.strip()
-            else:
-                q_text, sql_text = content, ""
-
-            examples.append(f"Q: {q_text}\nSQL: {sql_text}")
-
-        print(f"[FewShotSelector] ✅ Retrieved {len(examples)} relevant few-shot examples for question '{question}'")
+        print(f"[FewShotSelector] ✅ Retrieved {len(examples)} relevant few-shot examples (scores={[round(s, 3) for s, _ in hits]})")
         return "\n\n".join(examples) if examples else "No relevant examples found."
 
     except Exception as e:
         print(f"[FewShotSelector] ⚠️ Error retrieving few-shot examples: {e}")
         # Fallback: use static examples if search fails
-        try:
-            from utils.fewshot_utils import FEWSHOT_EXAMPLES  # or wherever you stored them
-            return "\n\n".join([f"Q: {ex['input']}\nSQL: {ex['sql']}" for ex in FEWSHOT_EXAMPLES])
-        except Exception:
-            return "No few-shot examples available."
+        return "\n\n".join([f"Q: {ex['input']}\nSQL: {ex['sql']}" for ex in FEWSHOT_EXAMPLES[:k]])
+
 
-def generate_sql_from_nl(question: str, db_name: str, table_name: str = None) -> dict:
+def save_confirmed_example(question: str, sql_query: str, db_name: str = None) -> dict:
+    """Feed a user-confirmed question → SQL pair back into the few-shot index."""
+    return get_fewshot_index(embedding_model).add_example(question, sql_query, db_name=db_name)
+
+def _clean_llm_sql(text: str) -> str:
+    return text.strip().replace("```sql", "").replace("```", "").strip()
+
+
+def _validate_and_repair(sql_query: str, catalog: dict, db_name: str = None) -> tuple:
+    """
+    Check the generated SQL against the cached catalog; on failure run ONE targeted repair
+    prompt (offending identifiers + closest matches only). Returns (sql, validation_info).
+    """
+    validation = validate_sql(sql_query, catalog)
+    record_stat("skipped" if validation.get("skipped") else "checked")
+    info = {**validation, "repaired": False, "repair_llm_calls": 0}
+    if validation["valid"]:
+        return sql_query, info
+
+    record_stat("invalid")
+    print(f"[SQLValidator] ⚠️ Invalid identifiers: {validation['issues']}")
+    response = llm.invoke(build_repair_prompt(sql_query, validation["issues"]), db_name=db_name, purpose="repair")
+    repaired_sql = _clean_llm_sql(response.content)
+    revalidation = validate_sql(repaired_sql, catalog)
+    info.update(repair_llm_calls=1, remaining_issues=revalidation["issues"])
+
+    if revalidation["valid"]:
+        record_stat("repaired")
+        info.update(valid=True, repaired=True)
+        print("[SQLValidator] ✅ Repaired SQL passes validation")
+        return repaired_sql, info
+
+    record_stat("unrepaired")
+    print(f"[SQLValidator] ❌ Repair still invalid: {revalidation['issues']}")
+    # keep whichever version has fewer problems; the UI shows the remaining issues
+    return (repaired_sql if len(revalidation["issues"]) < len(validation["issues"]) else sql_query), info
+
+
+def route_question(question: str, question_vector=None, k: int = None) -> dict:
     """
-    Few-shot + Chroma-enhanced NL → SQL generator.
-    Dynamically retrieves few-shot examples & schema embeddings using Chroma.
+    Picks the database for a question asked without one: a single vectorized search over the
+    table rows of every schema snapshot. The best (db, table) candidate decides the database.
+    """
+    if question_vector is None:
+        question_vector = embedding_model.embed_query(question)
+    hits = get_table_router().route(question_vector, **({"k": k} if k else {}))
+    if not hits:
+        raise Exception("No indexed databases available to route the question.")
+    candidates = [{"db_name": db, "table": t, "score": round(score, 4)} for score, db, t in hits]
+    print(f"[NL2SQL] 🧭 Routed question to '{hits[0][1]}' (candidates={[(c['db_name'], c['table']) for c in candidates]})")
+    return {"db_name": hits[0][1], "candidates": candidates, "question_vector": question_vector}
+
+
+def generate_sql_from_nl(question: str, db_name: str = None, table_name: str = None,
+                         question_vector=None, schema_snapshot=None) -> dict:
+    """
+    Few-shot + vector-index-enhanced NL → SQL generator.
+    Retrieves tables from the shared schema snapshot and few-shot examples from the in-process index.
+    Without a db_name the question is first routed across all databases (see route_question).
+    Batch callers pass a precomputed question_vector and the already-loaded schema_snapshot.
     Returns: {status, db_name, tables_used, question, sql_query} or error dict.
     """
     try:
-        engine = get_engine_for_db(db_name)
-        inspector = inspect(engine)
-        all_tables = inspector.get_table_names()
+        started = time.perf_counter()
+        routing = None
+        if not db_name:
+            routed = route_question(question, question_vector)
+            question_vector = routed.pop("question_vector")  # reused below, no second embedding
+            db_name, routing = routed["db_name"], routed
+            table_name = None
+
+        # --- Memory-mapped schema snapshot (published by the sync job, shared by all workers) ---
+        if schema_snapshot is None or routing is not None:
+            schema_snapshot = get_schema_snapshot(db_name)
+        records = table_records(schema_snapshot) if schema_snapshot is not None else {}
+        all_tables = list(records)
 
         if not all_tables:
             raise Exception(f"No tables found in database '{db_name}'.")
 
-        # --- Ensure dynamic stores are ready ---
-        example_store = build_fewshot_example_store()        # Few-shot examples Chroma
-        schema_store = sync_chroma_schema_embeddings(db_name)  # Schema Chroma
-
-        # --- Retrieve relevant tables from schema_store ---
+        # --- Hybrid table retrieval: BM25 over identifiers first, embedding only when needed ---
         top_k = min(3, max(1, len(all_tables)))
-        schema_hits = schema_store.similarity_search(question, k=top_k)
-
-        relevant_tables = []
-        for h in schema_hits:
-            md = getattr(h, "metadata", None) or {}
-            table = md.get("table")
-            if table and table not in relevant_tables:
-                relevant_tables.append(table)
+        lexical = get_lexical_index(schema_snapshot, records)
+        lexical_scores = lexical.score(question)
+        decisive = lexical.decisive_tables(question, lexical_scores, k=top_k)
+        lexical_ranking = sorted(lexical_scores, key=lambda t: -lexical_scores[t])
+
+        if decisive:
+            # literal table / column names settle it → no embedding call on this request
+            schema_hits = [(lexical_scores[t], t) for t in decisive]
+            relevant_tables = list(decisive)
+        else:
+            # embed the question once, reuse for schema + column + few-shot retrieval
+            if question_vector is None:
+                question_vector = embedding_model.embed_query(question)
+            schema_hits = search_tables(schema_snapshot, question_vector, k=len(all_tables))
+            fused = rrf_fuse([t for _, t in schema_hits], lexical_ranking)
+            relevant_tables = [t for t in fused if t][:top_k]
+
+        retrieval = {
+            "mode": "lexical" if decisive else "hybrid",
+            "embedding_skipped": question_vector is None,
+            "lexical_scores": {t: round(lexical_scores[t], 3) for t in lexical_ranking[:top_k]},
+        }
+        print(f"[NL2SQL] 🔎 Table retrieval mode={retrieval['mode']} → {relevant_tables}")
 
         # fallback: include selected table if not already present
         if table_name and table_name in all_tables and table_name not in relevant_tables:
@@ -124,32 +185,44 @@ def generate_sql_from_nl(question: str, db_name: str, table_name: str = None) ->
         if not relevant_tables:
             relevant_tables = [all_tables[0]]
 
-        # --- Build schema context string ---
-        schema_str = ""
+        # --- Build schema context string (column-level pruning for wide tables) ---
+        column_owners = {}
         for t in relevant_tables:
-            cols = inspector.get_columns(t)
-            col_parts = [f"{c.get('name')} ({c.get('type')})" for c in cols]
-            schema_str += f"TABLE: {t}\nCOLUMNS: {', '.join(col_parts)}\n\n"
+            for c in records[t]["columns"]:
+                column_owners.setdefault(c, set()).add(t)
+        join_columns = {c for c, owners in column_owners.items() if len(owners) > 1}
+
+        schema_str, schema_full_str = "", ""
+        columns_kept, columns_total = 0, 0
+        for t in relevant_tables:
+            rec = records[t]
+            types = dict(zip(rec["columns"], rec["types"]))
+            kept = select_columns(schema_snapshot, t, question_vector, question, join_columns)
+            columns_kept += len(kept)
+            columns_total += len(rec["columns"])
+            schema_str += f"TABLE: {t}\nCOLUMNS: {', '.join(f'{c} ({types[c]})' for c in kept)}\n\n"
+            schema_full_str += f"TABLE: {t}\nCOLUMNS: {', '.join(f'{c} ({types[c]})' for c in rec['columns'])}\n\n"
+
+        full_tokens, pruned_tokens = count_tokens(schema_full_str), count_tokens(schema_str)
+        prompt_tokens = {
+            "schema_tokens_full": full_tokens,
+            "schema_tokens_sent": pruned_tokens,
+            "tokens_saved": full_tokens - pruned_tokens,
+            "columns_kept": columns_kept,
+            "columns_total": columns_total,
+        }
+        print(f"[NL2SQL] ✂️ Column pruning kept {columns_kept}/{columns_total} columns, saved {full_tokens - pruned_tokens} prompt tokens")
 
         # --- Retrieve few-shot examples dynamically ---
-        fewshot_str = _get_relevant_examples(example_store, question, k=3)
-        if "No few-shot examples available" in fewshot_str or not fewshot_str.strip():
-            print("[FewShot] ⚠️ No dynamic examples found, rebuilding few-shot store...")
-            example_store = build_fewshot_example_store()
-            fewshot_str = _get_relevant_examples(example_store, question, k=3)
+        fewshot_str = _get_relevant_examples(question_vector, k=3, question=question)
 
         # --- Debug info (optional, safe to keep) ---
         try:
-            print("\n[DEBUG] --- Chroma schema collection snapshot ---")
-            docs_schema = schema_store._collection.get(include=["documents", "metadatas"])
-            for i, doc in enumerate(docs_schema.get("documents", [])):
-                print(f"  - SCHEMA DOC {i+1}: {doc[:150]} ...  METADATA: {docs_schema['metadatas'][i]}")
-            print("[DEBUG] --- Chroma few-shot collection snapshot ---")
-            docs_examples = example_store._collection.get(include=["documents", "metadatas"])
-            for i, doc in enumerate(docs_examples.get("documents", [])):
-                print(f"  - EXAMPLE DOC {i+1}: {doc[:150]} ... METADATA: {docs_examples['metadatas'][i]}")
+            print(f"\n[DEBUG] --- Schema snapshot {schema_snapshot.name}@{schema_snapshot.version} ---")
+            for i, rec in enumerate(records.values()):
+                print(f"  - SCHEMA DOC {i+1}: {rec['doc'][:150]} ...  SCORE: {dict((t, round(s, 3)) for s, t in schema_hits).get(rec['table'])}")
         except Exception as e:
-            print("[DEBUG] (info) Could not dump Chroma internals for debug:", e)
+            print("[DEBUG] (info) Could not dump schema snapshot for debug:", e)
 
         # --- Prompt building (LLM input) ---
         prompt = f"""
@@ -174,12 +247,24 @@ Instructions:
 """
 
         # --- Query LLM ---
-        response = llm.invoke(prompt)
-        sql_query = response.content.strip().replace("```sql", "").replace("```", "").strip()
+        llm_started = time.perf_counter()
+        response = llm.invoke(prompt, db_name=db_name, purpose="nl2sql")
+        sql_query = _clean_llm_sql(response.content)
+
+        # --- Validate against the cached catalog before anything reaches MySQL ---
+        validate_started = time.perf_counter()
+        catalog = {t: rec["columns"] for t, rec in records.items()}
+        sql_query, validation = _validate_and_repair(sql_query, catalog, db_name)
+        timings = {
+            "retrieval_ms": round((llm_started - started) * 1000, 1),
+            "llm_ms": round((validate_started - llm_started) * 1000, 1),
+            "validate_ms": round((time.perf_counter() - validate_started) * 1000, 1),  # incl. a repair call
+        }
 
         # Escape % for pandas/pymysql
         if "%" in sql_query:
             sql_query = sql_query.replace("%", "%%")
+        record_generated_query(db_name, sql_query)  # feeds /api/debug/partitions
 
         print("\n=======================")
         print(f"[NL2SQL] Database: {db_name}")
@@ -196,10 +281,19 @@ Instructions:
             "tables_used": relevant_tables,
             "question": question,
             "schema_str": schema_str,
+            "schema_full_str": schema_full_str,
+            "prompt_tokens": prompt_tokens,
+            "retrieval": retrieval,
+            "routing": routing,
             "fewshot_str": fewshot_str,
-            "sql_query": sql_query
+            "llm_usage": response.usage,
+            "sql_query": sql_query,
+            "validation": validation,
+            "timings": timings
         }
 
+    except Overloaded:
+        raise  # → 429 + Retry-After, not a generation error
     except Exception as e:
         traceback.print_exc()
         return {"status": "error", "error": str(e), "question": question}
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+import traceback
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import text
+from utils.db import get_engine_for_db
+from utils import columnar
+from utils.query_router import referenced_tables, fresh_table_stats
+from utils.query_governor import governed_read
+from utils.incremental_agg import plan_decomposable, compute_partial, merge_and_finalize
+from utils.db_utils import dataframe_to_response
+from utils.scheduler import Overloaded
+from app.services.nl2sql_service import generate_sql_from_nl
+from app.services.summarize_service import build_summary_prompt, llm
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: every worker may refresh (still correct, just duplicated work)
+    fcntl = None
+
+# Saved reports live on disk (definition + materialized result + partial aggregate state),
+# so every uvicorn worker serves reads from the same materialization.
+REPORTS_DIR = os.getenv("REPORTS_DIR", "./reports")
+REPORT_SCHEDULER_TICK = float(os.getenv("REPORT_SCHEDULER_TICK", "30"))
+REPORT_SCHEDULER_ENABLED = os.getenv("REPORT_SCHEDULER_ENABLED", "1") == "1"
+
+
+def _report_dir(report_id: str) -> str:
+    if not report_id or not all(c.isalnum() for c in report_id):
+        raise KeyError(f"Unknown report '{report_id}'.")
+    return os.path.join(REPORTS_DIR, report_id)
+
+
+def _save(report: dict):
+    report["updated_at"] = time.time()
+    path = os.path.join(_report_dir(report["report_id"]), "report.json")
+    tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, default=str)
+    os.replace(tmp, path)
+
+
+def load_report(report_id: str) -> dict:
+    path = os.path.join(_report_dir(report_id), "report.json")
+    if not os.path.exists(path):
+        raise KeyError(f"Unknown report '{report_id}'.")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_reports() -> list:
+    if not os.path.isdir(REPORTS_DIR):
+        return []
+    reports = []
+    for rid in sorted(os.listdir(REPORTS_DIR)):
+        try:
+            reports.append(load_report(rid))
+        except (KeyError, ValueError):
+            pass
+    return reports
+
+
+# --- schedule ---
+def _next_run(schedule: dict, after: float):
+    """schedule = {"every_minutes": N} or {"daily_at": "HH:MM"} (server local time); None → manual only."""
+    if not schedule:
+        return None
+    if schedule.get("every_minutes"):
+        return after + 60 * float(schedule["every_minutes"])
+    if schedule.get("daily_at"):
+        hh, mm = (int(x) for x in str(schedule["daily_at"]).split(":"))
+        base = datetime.fromtimestamp(after)
+        run = base.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        if run.timestamp() <= after:
+            run += timedelta(days=1)
+        return run.timestamp()
+    raise ValueError("schedule must be {'every_minutes': N} or {'daily_at': 'HH:MM'}")
+
+
+# --- change detection ---
+def _table_fingerprint(db_name: str, table: str) -> dict:
+    """Parquet manifest batches when mirrored (appends are visible per batch), else MySQL table metadata."""
+    manifest = columnar.read_manifest(db_name, table)
+    if manifest is not None:
+        return {"source": "parquet", "batches": [b["batch_id"] for b in manifest["batches"]], "rows": manifest["rows"]}
+    with get_engine_for_db(db_name).connect() as conn:
+        fresh_table_stats(conn)  # cached statistics would make a changed table look unchanged
+        row = conn.execute(text(
+            "SELECT UPDATE_TIME, CREATE_TIME, TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :t"
+        ), {"db": db_name, "t": table}).first()
+    if row is None:
+        return {"source": "mysql", "missing": True}
+    return {"source": "mysql", "update_time": str(row[0]), "create_time": str(row[1]), "rows": row[2]}
+
+
+def _fingerprints(report: dict) -> dict:
+    return {t: _table_fingerprint(report["db_name"], t) for t in report["tables"]}
+
+
+def _unchanged(old: dict, new: dict) -> bool:
+    if not old or old.keys() != new.keys():
+        return False
+    for t, fp in new.items():
+        # InnoDB may report UPDATE_TIME = NULL → we cannot prove "unchanged", so recompute
+        if fp.get("source") == "mysql" and fp.get("update_time") in (None, "None"):
+            return False
+        if fp != old[t]:
+            return False
+    return True
+
+
+# --- refresh ---
+def _artifact(report_id: str, name: str) -> str:
+    return os.path.join(_report_dir(report_id), name)
+
+
+def _refresh_locked(report: dict, force: bool) -> dict:
+    rid = report["report_id"]
+    start = time.perf_counter()
+    fingerprints = _fingerprints(report)
+    if not force and report.get("last_run") and _unchanged(report.get("fingerprints"), fingerprints):
+        report["last_check"] = {"at": time.time(), "action": "unchanged"}
+        print(f"[Reports] ⚙️ {rid}: source tables unchanged, keeping materialized result")
+        return report
+
+    plan, reason = plan_decomposable(report["sql_query"])
+    table = plan["table"] if plan else None
+    manifest = columnar.read_manifest(report["db_name"], table) if table else None
+    state_path, result_path = _artifact(rid, "state.parquet"), _artifact(rid, "result.parquet")
+    action, rows_processed = None, None
+
+    if plan and manifest is not None:
+        processed = report.get("processed_batches") or []
+        current = [b["batch_id"] for b in manifest["batches"]]
+        incremental = (not force and processed and os.path.exists(state_path)
+                       and current[:len(processed)] == processed)
+        new_batches = [b for b in manifest["batches"] if b["batch_id"] not in set(processed)] if incremental \
+            else manifest["batches"]
+        old_state = pd.read_parquet(state_path) if incremental else None
+        partial = compute_partial(plan, report["db_name"], new_batches)  # None when there is nothing new
+        if old_state is None and partial is None:
+            state, result = None, pd.DataFrame()
+        else:
+            state, result = merge_and_finalize(plan, old_state, partial)
+        if state is not None:
+            state.to_parquet(state_path, index=False)
+        report["processed_batches"] = current
+        rows_processed = sum(b["rows"] for b in new_batches)
+        action = "incremental" if incremental else "full (parquet)"
+        engine = {"engine": "duckdb", "reason": f"{reason}; {len(new_batches)} new batch(es)"}
+    else:
+        df, info = governed_read(report["sql_query"], report["db_name"])
+        result, engine = df, info["engine"]
+        report["processed_batches"] = None
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        action = "full"
+        engine["incremental"] = reason if not plan else "no parquet mirror"
+
+    result.to_parquet(result_path, index=False)
+    if report.get("summarize") and len(result):
+        try:
+            report["summary"] = llm.invoke(build_summary_prompt(report["sql_query"], result),
+                                           db_name=report["db_name"], purpose="report_summary").content.strip()
+        except Exception as e:
+            print(f"[Reports] ⚠️ {rid}: summary failed, keeping the previous one: {e}")
+
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+    report.update(
+        fingerprints=fingerprints,
+        last_run={"at": time.time(), "action": action, "elapsed_ms": elapsed, "rows": len(result),
+                  "rows_processed": rows_processed, "engine": engine},
+        last_check={"at": time.time(), "action": action},
+    )
+    print(f"[Reports] ✅ {rid}: {action} refresh in {elapsed} ms (rows={len(result)}, processed={rows_processed})")
+    return report
+
+
+def refresh_report(report_id: str, force: bool = False, blocking: bool = True) -> dict:
+    """
+    Recompute a report if its source tables changed (or force=True).
+    One refresher per report across workers (file lock); a non-blocking caller skips if busy.
+    """
+    report = load_report(report_id)
+    lock_path = _artifact(report_id, ".refresh.lock")
+    fh = open(lock_path, "a+")
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return report
+        report = load_report(report_id)  # may have been refreshed while we waited
+        try:
+            report = _refresh_locked(report, force)
+            report.pop("last_error", None)
+        except Overloaded:
+            # not the report's fault: no last_error and the schedule is not advanced, so the
+            # scheduler retries on a later tick (a report that never ran becomes due now)
+            stored = load_report(report_id)  # `report` may hold half-applied refresh state
+            if stored.get("next_run_at") is None:
+                stored["next_run_at"] = time.time()
+                _save(stored)
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            report["last_error"] = {"at": time.time(), "error": str(e)}
+        report["next_run_at"] = _next_run(report.get("schedule"), time.time())
+        _save(report)
+        return report
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        fh.close()
+
+
+def create_report(name: str, db_name: str, question: str = None, sql_query: str = None,
+                  schedule: dict = None, summarize: bool = False) -> dict:
+    if not sql_query:
+        if not question:
+            raise ValueError("Either question or sql_query is required.")
+        generated = generate_sql_from_nl(question, db_name)
+        if generated.get("status") != "success":
+            raise ValueError(f"Could not generate SQL: {generated.get('error')}")
+        sql_query = generated["sql_query"]
+    _next_run(schedule, time.time())  # validates the schedule
+
+    report_id = uuid.uuid4().hex
+    os.makedirs(_report_dir(report_id), exist_ok=True)
+    plan, reason = plan_decomposable(sql_query)
+    report = {
+        "report_id": report_id,
+        "name": name,
+        "db_name": db_name,
+        "question": question,
+        "sql_query": sql_query,
+        "tables": referenced_tables(sql_query.replace("%%", "%")),
+        "schedule": schedule,
+        "summarize": summarize,
+        "incremental": {"eligible": plan is not None, "reason": reason},
+        "created_at": time.time(),
+    }
+    _save(report)
+    print(f"[Reports] ✅ Created report {report_id} '{name}' on '{db_name}' (incremental: {reason})")
+    return refresh_report(report_id, force=True)
+
+
+def read_report(report_id: str) -> dict:
+    """Served from the materialized result — no SQL is executed on read."""
+    report = load_report(report_id)
+    path = _artifact(report_id, "result.parquet")
+    result = dataframe_to_response(pd.read_parquet(path)) if os.path.exists(path) else None
+    return {**report, "result": result}
+
+
+def delete_report(report_id: str):
+    shutil.rmtree(_report_dir(report_id), ignore_errors=True)
+
+
+# --- scheduler (one thread per worker; the per-report lock keeps runs single) ---
+_scheduler_started = False
+
+
+def _scheduler_loop():
+    while True:
+        now = time.time()
+        for report in list_reports():
+            due = report.get("next_run_at")
+            if due and due <= now:
+                try:
+                    refresh_report(report["report_id"], blocking=False)
+                except Overloaded as e:
+                    print(f"[Reports] ⏳ {report['report_id']}: {e} Retrying on a later tick.")
+                except Exception:
+                    traceback.print_exc()
+        time.sleep(REPORT_SCHEDULER_TICK)
+
+
+def start_report_scheduler():
+    global _scheduler_started
+    if _scheduler_started or not REPORT_SCHEDULER_ENABLED:
+        return
+    _scheduler_started = True
+    threading.Thread(target=_scheduler_loop, name="report-scheduler", daemon=True).start()
+    print(f"[Reports] ⏰ Scheduler started (tick={REPORT_SCHEDULER_TICK}s)")
@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import traceback
+import pandas as pd
+from utils.query_governor import governed_read, describe_error, QueryRejected
+from utils.db_utils import dataframe_to_response
+from utils.scheduler import Overloaded
+from app.services.nl2sql_service import generate_sql_from_nl, llm
+
+# Sessions live on disk so any uvicorn worker can serve the follow-up.
+SESSION_DIR = os.getenv("SESSION_DIR", "./sessions")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+LOCAL_RESULT_TABLE = "last_result"
+
+
+def _session_dir(session_id: str) -> str:
+    if not session_id or not all(c.isalnum() for c in session_id):
+        raise KeyError(f"Unknown session '{session_id}'.")
+    return os.path.join(SESSION_DIR, session_id)
+
+
+def _save(state: dict):
+    state["updated_at"] = time.time()
+    path = os.path.join(_session_dir(state["session_id"]), "session.json")
+    tmp = path + f".tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def load_session(session_id: str) -> dict:
+    path = os.path.join(_session_dir(session_id), "session.json")
+    if not os.path.exists(path):
+        raise KeyError(f"Unknown session '{session_id}'.")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _prune_expired():
+    if not os.path.isdir(SESSION_DIR):
+        return
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    for sid in os.listdir(SESSION_DIR):
+        path = os.path.join(SESSION_DIR, sid, "session.json")
+        try:
+            if os.path.getmtime(path) < cutoff:
+                delete_session(sid)
+        except OSError:
+            pass
+
+
+def create_session(db_name: str, table_name: str = None) -> dict:
+    _prune_expired()
+    session_id = uuid.uuid4().hex
+    os.makedirs(_session_dir(session_id), exist_ok=True)
+    state = {
+        "session_id": session_id,
+        "db_name": db_name,
+        "table_name": table_name,
+        "tables_used": [],
+        "schema_str": "",
+        "turns": [],
+        "last_result": None,
+        "created_at": time.time(),
+    }
+    _save(state)
+    print(f"[Session] ✅ Created session {session_id} for '{db_name}'")
+    return state
+
+
+def delete_session(session_id: str):
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+
+
+# --- Result cache (one parquet per session, the "last result handle") ---
+def _cache_result(state: dict, df: pd.DataFrame, sql: str, source: str):
+    path = os.path.join(_session_dir(state["session_id"]), "last_result.parquet")
+    try:
+        df.to_parquet(path, index=False)
+        state["last_result"] = {
+            "path": path,
+            "sql": sql,
+            "source": source,
+            "columns": [f"{c} ({df[c].dtype})" for c in df.columns],
+            "row_count": len(df),
+        }
+    except Exception as e:
+        # Not every MySQL type round-trips through parquet; follow-ups then simply go to the DB
+        print(f"[Session] ⚠️ Could not cache result for {state['session_id']}: {e}")
+        state["last_result"] = None
+
+
+def _load_result(state: dict) -> pd.DataFrame:
+    return pd.read_parquet(state["last_result"]["path"])
+
+
+def _run_local(state: dict, sql: str) -> pd.DataFrame:
+    """Evaluate a refinement query over the cached result in an in-memory SQLite database."""
+    with sqlite3.connect(":memory:") as conn:
+        _load_result(state).to_sql(LOCAL_RESULT_TABLE, conn, index=False)
+        return pd.read_sql(sql, conn)
+
+
+# --- Follow-up prompt (delta only: no retrieval, no few-shot block) ---
+def _build_followup_prompt(state: dict, question: str) -> str:
+    last_turn = state["turns"][-1]
+    result = state.get("last_result")
+    if result:
+        result_block = (
+            f"The previous result is cached as table `{LOCAL_RESULT_TABLE}` "
+            f"({result['row_count']} rows) with columns: {', '.join(result['columns'])}."
+        )
+    else:
+        result_block = "The previous result is not cached; you must query the database."
+
+    return f"""
+You are continuing a conversation about the MySQL database '{state['db_name']}'.
+
+Schema already selected for this conversation:
+{state['schema_str']}
+Previous question: {last_turn['question']}
+Previous SQL: {last_turn['sql']}
+{result_block}
+
+Follow-up question:
+{question}
+
+Instructions:
+- If the follow-up only refines the previous result (filter, sort, limit, re-aggregate or
+  project its columns) answer with the word LOCAL on the first line, then a SQLite query over `{LOCAL_RESULT_TABLE}`.
+- Otherwise answer with the word DB on the first line, then a MySQL query over the schema above.
+- Only use the listed tables and columns. Return no markdown or commentary.
+"""
+
+
+def _parse_followup_response(text: str, can_run_local: bool):
+    text = text.strip().replace("```sql", "").replace("```", "").strip()
+    first, _, rest = text.partition("\n")
+    mode = first.strip().upper()
+    if mode in ("LOCAL", "DB"):
+        sql = rest.strip()
+    else:
+        mode, sql = "DB", text
+    if mode == "LOCAL" and not can_run_local:
+        mode = "DB"
+    return mode, sql
+
+
+def _store_first_turn(state: dict, question: str, result: dict):
+    state["tables_used"] = result["tables_used"]
+    # follow-ups may ask for columns the first prompt pruned away → keep the full table context
+    state["schema_str"] = result.get("schema_full_str") or result["schema_str"]
+    state["turns"].append({"question": question, "sql": result["sql_query"], "mode": "DB"})
+    _save(state)
+
+
+def record_first_turn(session_id: str, question: str, result: dict):
+    """Used by /api/ask: a fused generate + execute run becomes the session's first turn."""
+    state = load_session(session_id)
+    if not state["turns"]:
+        _store_first_turn(state, question, result)
+
+
+def record_result(session_id: str, df: pd.DataFrame, sql_query: str):
+    """Keeps a result produced outside the session routes as the last result handle."""
+    state = load_session(session_id)
+    _cache_result(state, df, sql_query, source="db")
+    _save(state)
+
+
+def ask_in_session(session_id: str, question: str) -> dict:
+    """
+    First turn: full NL2SQL pipeline (schema + few-shot retrieval), context stored on the session.
+    Follow-ups: delta prompt over the stored context; refinements of the cached result are
+    answered locally without touching MySQL.
+    """
+    state = load_session(session_id)
+
+    if not state["turns"]:
+        result = generate_sql_from_nl(question, state["db_name"], state.get("table_name"))
+        if result.get("status") != "success":
+            return result
+        _store_first_turn(state, question, result)
+        return {"status": "success", "session_id": session_id, "mode": "DB", **result}
+
+    start = time.perf_counter()
+    response = llm.invoke(_build_followup_prompt(state, question), db_name=state["db_name"], purpose="followup")
+    mode, sql_query = _parse_followup_response(response.content, can_run_local=bool(state.get("last_result")))
+    llm_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    payload = {
+        "status": "success",
+        "session_id": session_id,
+        "mode": mode,
+        "question": question,
+        "tables_used": state["tables_used"],
+        "llm_ms": llm_ms,
+    }
+
+    if mode == "LOCAL":
+        try:
+            df = _run_local(state, sql_query)
+            state["turns"].append({"question": question, "sql": sql_query, "mode": mode})
+            _cache_result(state, df, sql_query, source="local")
+            _save(state)
+            print(f"[Session] ⚡ {session_id}: follow-up answered locally over cached result ({len(df)} rows)")
+            return {**payload, "sql_query": sql_query, **dataframe_to_response(df)}
+        except Exception as e:
+            print(f"[Session] ⚠️ Local evaluation failed, asking for a DB query instead: {e}")
+            response = llm.invoke(_build_followup_prompt({**state, "last_result": None}, question),
+                                  db_name=state["db_name"], purpose="followup")
+            mode, sql_query = _parse_followup_response(response.content, can_run_local=False)
+            payload["mode"] = mode
+
+    # Escape % for pandas/pymysql (same as the main NL2SQL path)
+    if "%" in sql_query:
+        sql_query = sql_query.replace("%", "%%")
+    state["turns"].append({"question": question, "sql": sql_query, "mode": mode})
+    _save(state)
+    return {**payload, "sql_query": sql_query}
+
+
+def execute_in_session(session_id: str, sql_query: str) -> dict:
+    """Run SQL on MySQL and keep the result as the session's last result handle."""
+    state = load_session(session_id)
+    try:
+        df, info = governed_read(sql_query, state["db_name"])
+
+        _cache_result(state, df, sql_query, source="db")
+        _save(state)
+        return {
+            "status": "success",
+            "session_id": session_id,
+            **dataframe_to_response(df),
+            "truncated": info["truncated"],
+            "engine": info["engine"],
+        }
+
+    except QueryRejected as e:
+        return {"status": "error", "detail": str(e), "governor": {"explain": e.explain}}
+    except Overloaded:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "detail": describe_error(e)}
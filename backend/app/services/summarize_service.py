@@ -1,61 +1,158 @@
-from sqlalchemy import text
-from utils.db import get_engine_for_db
-from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.query_governor import governed_read
+from utils.llm_gateway import get_llm_gateway
+from utils import result_cache
+from utils.scheduler import Overloaded
 import pandas as pd
 import json
 import traceback
 import plotly.express as px
 
-# Initialize your internal / Gemini LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
+# Shared LLM gateway (same limits / single-flight as NL2SQL)
+llm = get_llm_gateway()
 
-def summarize_sql_result(sql_query: str, db_name: str):
+PROFILE_TOP_VALUES = 3
+CHART_MAX_CATEGORIES = 50
+# Bump when build_summary_prompt / suggest_chart change: old cache entries then simply stop matching
+SUMMARY_PROMPT_VERSION = "2"
+CHART_VERSION = "1"
+
+
+def profile_result(df: pd.DataFrame) -> dict:
     """
-    Run a SQL query, summarize its meaning, and suggest a chart if relevant.
+    Cheap, vectorized profile of a query result over ALL its rows (the prompt only sees 50):
+    per column kind, nulls, distinct count, numeric min/max/mean/sum, top text values.
     """
-    try:
-        engine = get_engine_for_db(db_name)
-        df = pd.read_sql(text(sql_query), con=engine)
-
-        if df.empty:
-            return {"summary": "No data returned for this query.", "chart_json": None}
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        entry = {"nulls": int(s.isna().sum())}
+        if pd.api.types.is_bool_dtype(s):
+            entry["kind"] = "bool"
+        elif pd.api.types.is_numeric_dtype(s):
+            vals = s.dropna()
+            entry["kind"] = "numeric"
+            if len(vals):
+                entry.update(min=float(vals.min()), max=float(vals.max()), mean=round(float(vals.mean()), 4),
+                             sum=float(vals.sum()))
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            vals = s.dropna()
+            entry["kind"] = "datetime"
+            if len(vals):
+                entry.update(min=str(vals.min()), max=str(vals.max()))
+        else:
+            entry["kind"] = "text"
+            counts = s.astype(str).where(s.notna()).value_counts()
+            entry["top_values"] = {str(k): int(v) for k, v in counts.head(PROFILE_TOP_VALUES).items()}
+        entry["distinct"] = int(s.nunique(dropna=True))
+        columns[str(col)] = entry
+    return {"rows": len(df), "columns": columns}
 
-        # Limit size for LLM input
-        sample_df = df.head(50)
 
-        # Build summarization prompt
-        prompt = f"""
+def build_summary_prompt(sql_query: str, df: pd.DataFrame, profile: dict = None) -> str:
+    # Limit size for LLM input
+    sample_df = df.head(50)
+    profile_block = ""
+    if profile and profile["rows"] > len(sample_df):
+        profile_block = f"""
+        Column profile over all {profile['rows']} rows (JSON format):
+        {json.dumps(profile['columns'], default=str)}
+        """
+    return f"""
         You are a data analyst. A SQL query was executed:
 
         {sql_query}
 
         Here are the first 50 rows of the result (JSON format):
         {sample_df.to_json(orient='records')}
-
+        {profile_block}
         Summarize the key trends, patterns, and insights in plain English.
         Be concise and clear.
         """
 
-        response = llm.invoke(prompt)
-        summary_text = response.content.strip()
 
-        # Auto chart suggestion (basic heuristic)
-        chart_json = None
-        if len(df.columns) >= 2:
-            x_col, y_col = df.columns[0], df.columns[1]
-            try:
-                fig = px.line(df, x=x_col, y=y_col, title=f"{y_col} vs {x_col}")
-                chart_json = fig.to_json()
-            except Exception:
-                pass
+def suggest_chart(df: pd.DataFrame, profile: dict = None):
+    """
+    Plotly JSON for the result, or None. With a profile: temporal x → line, low-cardinality
+    text x → bar, against the first numeric column; otherwise the first two columns as a line.
+    """
+    if len(df.columns) < 2:
+        return None
+    x_col, y_col, kind = df.columns[0], df.columns[1], "line"
+    if profile:
+        cols = profile["columns"]
+        numeric = [c for c in df.columns if cols[str(c)]["kind"] == "numeric"]
+        temporal = [c for c in df.columns if cols[str(c)]["kind"] == "datetime" or
+                    (str(c).lower() in ("year", "month", "date") and c in numeric)]
+        categorical = [c for c in df.columns if cols[str(c)]["kind"] == "text"
+                       and cols[str(c)]["distinct"] <= CHART_MAX_CATEGORIES]
+        x = (temporal or categorical or [None])[0]
+        y = next((c for c in numeric if c != x), None)
+        if x is not None and y is not None:
+            x_col, y_col, kind = x, y, "line" if x in temporal else "bar"
+    try:
+        plot = px.line if kind == "line" else px.bar
+        fig = plot(df, x=x_col, y=y_col, title=f"{y_col} vs {x_col}")
+        return fig.to_json()
+    except Exception:
+        return None
+
+
+def summary_for(sql_query: str, df: pd.DataFrame, db_name: str, profile: dict = None, digest: str = None) -> tuple:
+    """(summary text, served_from_cache) — keyed on the result content + SQL + prompt version + LLM backend/model."""
+    digest = digest or result_cache.frame_digest(df)
+    key = result_cache.cache_key("summary", digest, " ".join(sql_query.split()), SUMMARY_PROMPT_VERSION,
+                                 llm.backend_name)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached, True
+    prompt = build_summary_prompt(sql_query, df, profile or profile_result(df))
+    summary_text = llm.invoke(prompt, db_name=db_name, purpose="summarize").content.strip()
+    result_cache.put(key, summary_text)
+    return summary_text, False
+
+
+def chart_for(df: pd.DataFrame, profile: dict = None, digest: str = None) -> tuple:
+    """(plotly JSON or None, served_from_cache) — the chart depends on the result content only."""
+    digest = digest or result_cache.frame_digest(df)
+    key = result_cache.cache_key("chart", digest, CHART_VERSION)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached["chart_json"], True
+    chart_json = suggest_chart(df, profile or profile_result(df))
+    result_cache.put(key, {"chart_json": chart_json})
+    return chart_json, False
+
+
+def summarize_sql_result(sql_query: str, db_name: str):
+    """
+    Run a SQL query, summarize its meaning, and suggest a chart if relevant.
+    """
+    try:
+        df, info = governed_read(sql_query, db_name)
+        route = info["engine"]
+
+        if df.empty:
+            return {"summary": "No data returned for this query.", "chart_json": None, "engine": route}
+
+        # Same result content → cached summary / chart, no LLM call or figure rebuild
+        digest = result_cache.frame_digest(df)
+        summary_text, summary_cached = summary_for(sql_query, df, db_name, digest=digest)
+
+        # Auto chart suggestion (profile-based heuristic)
+        chart_json, chart_cached = chart_for(df, digest=digest)
 
         return {
             "summary": summary_text,
             "chart_json": chart_json,
             "rows": len(df),
             "columns": list(df.columns),
+            "engine": route,
+            "truncated": info["truncated"],
+            "cached": {"summary": summary_cached, "chart": chart_cached},
         }
 
+    except Overloaded:
+        raise
     except Exception as e:
         traceback.print_exc()
         return {"error": str(e)}
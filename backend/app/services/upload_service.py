@@ -2,19 +2,126 @@ import tempfile
 import os
 import pandas as pd
 from fastapi import UploadFile
-from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text, inspect
 from utils.db import get_engine_for_db, root_engine
-from utils.db_utils import sanitize_name, clean_dataframe, infer_sql_type
+from utils.db_utils import sanitize_name, infer_sql_type, upsert_dataframe, add_missing_columns, refresh_schema_cache
+from utils.cleaning import clean_frame
+from utils.columnar import write_table_parquet, read_manifest, drop_table_parquet
+from utils.partitioning import partition_new_table, maintain_partitions
+from utils.pdf_extract import extract_pdf, map_columns_to_tables
+from utils.schema_index import get_schema_snapshot
+from utils.embeddings import get_embedding_model
 
 
-async def ingest_file_to_db(file: UploadFile, db_name: str, table_name: str = None, if_exists: str = "replace"):
+def _prepare_dataframe(df: pd.DataFrame):
+    """Cleaning (in place, with anomaly flags) + column-name sanitizing shared by every file type."""
+    quality = clean_frame(df)
+    df.columns = [sanitize_name(c) for c in df.columns]
+    quality["columns"] = dict(zip(df.columns, quality["columns"].values()))
+    return df, quality
+
+
+def _ensure_database(db_name: str):
+    with root_engine.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE IF NOT EXISTS `{db_name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;"))
+
+
+def _remirror_from_mysql(engine, db_name: str, table_name: str) -> dict:
+    with engine.connect() as conn:
+        df = pd.read_sql(text(f"SELECT * FROM `{table_name}`"), conn)
+    return write_table_parquet(df, db_name, table_name, if_exists="replace")
+
+
+def _write_table(df: pd.DataFrame, db_name: str, table_name: str, if_exists: str, key_columns: list = None) -> dict:
     """
-    Ingests an uploaded CSV/XLSX into the selected database and creates/overwrites a table.
-    - Auto-creates the database if missing
-    - Cleans data and column names
-    - Returns clean JSON always (never HTML)
+    Writes one cleaned DataFrame to MySQL (+ Parquet mirror) and reports what happened.
+    - append / upsert add columns the existing table does not have yet
+    """
+    # --- Step 6: Get engine for that DB
+    engine = get_engine_for_db(db_name)
+
+    # --- Step 7: Infer SQL column types
+    dtype_map = {col: infer_sql_type(dtype) for col, dtype in df.dtypes.items()}
+
+    # --- Step 8: Write to SQL with error handling
+    upsert, partitioning = None, None
+    try:
+        table_exists = inspect(engine).has_table(table_name)
+        if table_exists and if_exists in ("append", "upsert"):
+            # new years in this upload get their own partitions before the rows land
+            with engine.begin() as conn:
+                total_rows = conn.execute(text(f"SELECT COUNT(*) FROM `{table_name}`")).scalar() or 0
+                partitioning = maintain_partitions(conn, db_name, table_name, df, total_rows=total_rows)
+
+        if if_exists == "upsert":
+            keys = [sanitize_name(k) for k in key_columns] if key_columns else None
+            upsert = upsert_dataframe(df, engine, table_name, key_columns=keys, dtype_map=dtype_map)
+        elif table_exists and if_exists == "append":
+            with engine.begin() as conn:
+                add_missing_columns(conn, table_name, list(df.columns), dtype_map)
+            df.to_sql(table_name, con=engine, if_exists="append", index=False, dtype=dtype_map)
+        else:
+            # create the (empty) table first so large temporal tables are partitioned before loading
+            df.head(0).to_sql(table_name, con=engine, if_exists=if_exists, index=False, dtype=dtype_map)
+            with engine.begin() as conn:
+                partitioning = partition_new_table(conn, db_name, table_name, df)
+            df.to_sql(table_name, con=engine, if_exists="append", index=False, dtype=dtype_map)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Failed to write table '{table_name}' to database '{db_name}': {e}")
+
+    # --- Step 9: Mirror as partitioned Parquet for the DuckDB analytics path
+    columnar = None
+    try:
+        appending = if_exists in ("append", "upsert")
+        if appending and read_manifest(db_name, table_name) is None:
+            # no mirror yet (table older than the mirror, or a failed write): appending only the
+            # new rows would give DuckDB a partial table → mirror the whole table instead
+            manifest = _remirror_from_mysql(engine, db_name, table_name)
+        elif upsert is None:
+            manifest = write_table_parquet(df, db_name, table_name, if_exists=if_exists)
+        elif upsert["updated"] == 0:
+            # pure inserts → append only the new rows (incremental reports stay incremental)
+            manifest = write_table_parquet(upsert["inserted_rows"], db_name, table_name, if_exists="append") \
+                if len(upsert["inserted_rows"]) else read_manifest(db_name, table_name)
+        else:
+            # rows changed in place → re-mirror the whole table from MySQL
+            manifest = _remirror_from_mysql(engine, db_name, table_name)
+        columnar = {"partition_column": manifest.get("partition_column"), "rows": manifest.get("rows")} if manifest else None
+    except Exception as e:
+        # MySQL stays the source of truth: drop the (possibly half-written) mirror so queries on
+        # this table route to MySQL, and the next write mirrors it in full
+        drop_table_parquet(db_name, table_name)
+        print(f"[Columnar] ⚠️ Could not mirror '{table_name}' as Parquet, mirror dropped: {e}")
+
+    # --- Step 10: Verify row count
+    with engine.connect() as conn:
+        result = conn.execute(text(f"SELECT COUNT(*) AS cnt FROM `{table_name}`;"))
+        cnt = result.scalar() or 0
+
+    return {
+        "table_name": table_name,
+        "rows_written": (upsert["inserted"] + upsert["updated"]) if upsert else len(df),
+        "rows_in_db": int(cnt),
+        "columns": list(df.columns),
+        "columnar": columnar,
+        "partitioning": partitioning,
+        "upsert": {k: v for k, v in upsert.items() if k != "inserted_rows"} if upsert else None
+    }
+
+
+
+async def ingest_file_to_db(file: UploadFile, db_name: str, table_name: str = None, if_exists: str = "replace",
+                            key_columns: list = None):
     """
-    suffix = ".csv" if file.filename.lower().endswith(".csv") else ".xlsx"
+    Ingests an uploaded CSV/XLSX/PDF into the selected database and creates/overwrites a table.
+    Spools the upload to a temp file, then see ingest_path_to_db (in the threadpool: the
+    sync writes and the row-count verification must not block the event loop).
+    """
+    filename = file.filename.lower()
+    suffix = ".csv" if filename.endswith(".csv") else ".pdf" if filename.endswith(".pdf") else ".xlsx"
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
 
     try:
@@ -23,63 +130,117 @@ async def ingest_file_to_db(file: UploadFile, db_name: str, table_name: str = No
         tmp.write(content)
         tmp.flush()
         tmp.close()
-        tmp_path = tmp.name
+        return await run_in_threadpool(ingest_path_to_db, tmp.name, file.filename, db_name, table_name, if_exists,
+                                       key_columns)
+
+    finally:
+        try:
+            os.remove(tmp.name)
+        except Exception:
+            pass
+
+
+def ingest_path_to_db(path: str, filename: str, db_name: str, table_name: str = None, if_exists: str = "replace",
+                      key_columns: list = None, df: pd.DataFrame = None) -> dict:
+    """
+    Ingests a CSV/XLSX/PDF file already on the server (`df` = frame parsed ahead of time, e.g. by the
+    chunked upload while chunks were still arriving).
+    - Auto-creates the database if missing
+    - Cleans data and column names in one vectorized pass; per-column anomaly flags under "quality"
+    - if_exists="upsert": keyed append (natural key detected or given), reports inserted/updated/skipped
+    - Large tables with a year/date column are RANGE-partitioned by year (see utils/partitioning.py)
+    - PDFs: every extracted table / timeline becomes its own table, or is appended to the
+      existing table whose columns match (see _ingest_pdf)
+    - Returns clean JSON always (never HTML); invalid requests (ValueError, e.g. an upsert key a
+      partitioned table cannot have) are raised so the route answers 400
+    """
+    try:
+        lower = filename.lower()
+        if lower.endswith(".pdf"):
+            return _ingest_pdf(path, filename, db_name, table_name, if_exists, key_columns)
 
         # --- Step 2: Read CSV/XLSX into DataFrame
-        if file.filename.lower().endswith(".csv"):
-            df = pd.read_csv(tmp_path)
-        else:
-            df = pd.read_excel(tmp_path, engine="openpyxl")
+        if df is None:
+            if lower.endswith(".csv"):
+                df = pd.read_csv(path)
+            else:
+                df = pd.read_excel(path, engine="openpyxl")
 
         # --- Step 3: Basic cleaning
-        df = clean_dataframe(df)
-        df = df.where(pd.notnull(df), None)  # replace NaN with None
-        df.columns = [sanitize_name(c) for c in df.columns]
+        df, quality = _prepare_dataframe(df)
 
         # --- Step 4: Determine table name
         if table_name:
             table_name = sanitize_name(table_name)
         else:
-            base = os.path.splitext(file.filename)[0]
+            base = os.path.splitext(filename)[0]
             table_name = sanitize_name(base)
 
         # --- Step 5: Make sure database exists
-        with root_engine.connect() as conn:
-            conn.execute(text(f"CREATE DATABASE IF NOT EXISTS `{db_name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;"))
+        _ensure_database(db_name)
 
-        # --- Step 6: Get engine for that DB
-        engine = get_engine_for_db(db_name)
-
-        # --- Step 7: Infer SQL column types
-        dtype_map = {col: infer_sql_type(dtype) for col, dtype in df.dtypes.items()}
-
-        # --- Step 8: Write to SQL with error handling
-        try:
-            df.to_sql(table_name, con=engine, if_exists=if_exists, index=False, dtype=dtype_map)
-        except Exception as e:
-            raise Exception(f"Failed to write table '{table_name}' to database '{db_name}': {e}")
-
-        # --- Step 9: Verify row count
-        with engine.connect() as conn:
-            result = conn.execute(text(f"SELECT COUNT(*) AS cnt FROM `{table_name}`;"))
-            cnt = result.scalar() or 0
-
-        return {
-            "status": "success",
-            "db_name": db_name,
-            "table_name": table_name,
-            "rows_written": len(df),
-            "rows_in_db": int(cnt),
-            "columns": list(df.columns)
-        }
+        return {"status": "success", "db_name": db_name,
+                **_write_table(df, db_name, table_name, if_exists, key_columns), "quality": quality}
 
+    except ValueError:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         return {"status": "error", "error": str(e)}
 
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+
+def _ingest_pdf(path: str, filename: str, db_name: str, table_name: str = None, if_exists: str = "replace",
+                key_columns: list = None) -> dict:
+    """
+    PDF path: page-parallel extraction → same cleaning/typing as CSV → column mapping → write.
+    - Without an explicit table_name, each extracted table is matched against the DB's existing
+      tables (one batched embedding call); a match is appended to (or upserted into) that table
+      with its columns renamed, anything else becomes a new table named after the file
+    - If a later table fails, the tables already written stay (MySQL DDL is not transactional) but
+      are re-indexed, and the error names them
+    """
+    extracted = extract_pdf(path)
+    if not extracted["tables"]:
+        raise ValueError("No tables or timeline entries could be extracted from the PDF.")
+    frames, qualities = zip(*(_prepare_dataframe(t["frame"]) for t in extracted["tables"]))
+
+    _ensure_database(db_name)
+    if table_name:
+        mapping = [{"table": None, "score": None, "rename": {}} for _ in frames]
+    else:
+        mapping = map_columns_to_tables(get_schema_snapshot(db_name), frames, get_embedding_model())
+
+    base = sanitize_name(table_name or os.path.splitext(filename)[0])
+    results = []
+    try:
+        for i, (df, match) in enumerate(zip(frames, mapping)):
+            if match["table"]:
+                # never replace an existing table just because a PDF looked like it
+                target, mode = match["table"], ("upsert" if if_exists == "upsert" else "append")
+                df = df.rename(columns=match["rename"])
+            else:
+                target, mode = (base if i == 0 else f"{base}_{i + 1}"), if_exists
+            written = _write_table(df, db_name, target, mode, key_columns)
+            written["source"] = {k: extracted["tables"][i][k] for k in ("source", "pages", "header")}
+            written["mapping"] = {"matched_table": match["table"], "score": match["score"], "renamed": match["rename"]}
+            written["quality"] = qualities[i]
+            results.append(written)
+    except Exception as e:
+        if not results:
+            raise
+        # the route only re-indexes on success: keep the index in step with what is in MySQL now
+        done = [r["table_name"] for r in results]
+        refresh_schema_cache(db_name, tables=done)
+        print(f"[Upload] ⚠️ PDF '{filename}' failed after writing {done}: {e}")
+        message = f"{e} (tables already written from this PDF: {', '.join(done)})"
+        raise (ValueError if isinstance(e, ValueError) else Exception)(message) from e
+
+    return {
+        "status": "success",
+        "db_name": db_name,
+        "table_name": results[0]["table_name"],
+        "tables": results,
+        "rows_written": sum(r["rows_written"] for r in results),
+        "pdf": extracted["stats"],
+    }
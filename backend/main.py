@@ -1,11 +1,21 @@
 from fastapi import FastAPI
 from app.routes import upload_excel
+from app.routes import upload_chunked
 from app.routes import nl2sql
 from app.routes import execute_query
 from app.routes import db_meta
 from app.routes import debug_chroma
 from app.routes import refresh_schema
 from app.routes import summarize
+from app.routes import session
+from app.routes import batch
+from app.routes import reports
+from app.routes import ask
+from app.routes import export
+from app.services.report_service import start_report_scheduler
+from utils.db_router import get_table_router
+from utils.scheduler import Overloaded, scheduler_middleware, overloaded_handler
+from utils.profiling import profiling_middleware
 
 
 
@@ -15,14 +25,32 @@ app = FastAPI(
     description="API backend for natural language to SQL query execution"
 )
 
+# Fair per-database scheduling of DB / LLM work: request context + 429 on load shedding
+app.middleware("http")(scheduler_middleware)
+app.add_exception_handler(Overloaded, overloaded_handler)
+# Opt-in request profiling (PROFILE_ENABLED=1): X-Profile header or sampled, see /api/debug/profiles
+app.middleware("http")(profiling_middleware)
+
+app.include_router(upload_chunked.router, prefix="/api/upload/chunked", tags=["upload"])
 app.include_router(upload_excel.router, prefix="/api/upload", tags=["upload"])
 app.include_router(nl2sql.router, prefix="/api/nl2sql", tags=["NL2SQL"])
 app.include_router(execute_query.router, prefix="/api/execute", tags=["Execute"])
+app.include_router(ask.router, prefix="/api/ask", tags=["Ask"])
+app.include_router(export.router, prefix="/api/export", tags=["Export"])
 app.include_router(db_meta.router, prefix="/api", tags=["DB Meta"])
 app.include_router(debug_chroma.router, prefix="/api/debug", tags=["Debug"])
 app.include_router(refresh_schema.router, prefix="/api/refresh", tags=["Schema Refresh"])
 
 app.include_router(summarize.router, prefix="/api/summarize", tags=["summarization"])
+app.include_router(session.router, prefix="/api/session", tags=["Session"])
+app.include_router(batch.router, prefix="/api/batch", tags=["Batch"])
+app.include_router(reports.router, prefix="/api/reports", tags=["Reports"])
+
+
+@app.on_event("startup")
+def start_background_jobs():
+    start_report_scheduler()
+    get_table_router().warm_up()  # schema indexes for databases that have none yet
 
 
 # Health check route
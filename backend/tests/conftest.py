@@ -0,0 +1,28 @@
+# backend/tests/conftest.py
+"""
+Unit tests for the pure parts of the backend (no MySQL, no LLM):
+
+    python -m pytest backend/tests
+
+utils.db connects to MySQL as soon as it is imported, so it is replaced here by a module
+whose engines refuse to connect: a test that reaches the database fails loudly instead.
+"""
+import os
+import sys
+import types
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)  # same imports as the app: `from utils.x import ...`
+
+
+def _no_database(*args, **kwargs):
+    raise RuntimeError("unit tests do not connect to MySQL")
+
+
+_db = types.ModuleType("utils.db")
+_db.get_engine_for_db = _db.get_async_engine_for_db = _no_database
+_db.root_engine = None
+_db.async_driver_available = lambda: False
+_db.ASYNC_DB_DRIVER, _db.ASYNC_DB_POOL_SIZE, _db.ASYNC_DB_MAX_OVERFLOW = "aiomysql", 1, 0
+sys.modules["utils.db"] = _db
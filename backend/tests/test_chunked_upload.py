@@ -0,0 +1,77 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.services import chunked_upload_service as uploads
+from app.services.chunked_upload_service import UploadConflict, _complete_records_end, _infer_types
+
+CSV = (
+    b'id,name,score,active,note\n'
+    b'1,alpha,1.5,True,\n'
+    b'2,"beta, inc",2,False,"two\nlines"\n'
+    b'3,gamma,,true,x\n'
+    b'4,"say ""hi""",4.25,FALSE,\n'
+)
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("block, end", [
+    (b"a,b\n1,2\n", 8),
+    (b"a,b\n1,2", 4),
+    (b"no newline yet", 0),
+    (b'a,b\n1,"open\nquote', 4),
+    (b'a,b\n1,"closed\nquote"\n2', 21),
+])
+def test_complete_records_end_stops_at_a_record_boundary(block, end):
+    assert _complete_records_end(block) == end
+
+
+def test_infer_types_matches_read_csv_over_the_whole_file():
+    text_only = pd.read_csv(io.BytesIO(CSV), dtype=str)
+    pd.testing.assert_frame_equal(_infer_types(text_only), pd.read_csv(io.BytesIO(CSV)))
+
+
+def test_infer_types_keeps_mixed_columns_as_text():
+    df = _infer_types(pd.DataFrame({"code": ["001", "A2", None], "flag": ["True", "maybe", None]}))
+    assert df["code"].tolist()[:2] == ["001", "A2"]
+    assert df["flag"].tolist()[:2] == ["True", "maybe"]
+
+
+def test_chunks_split_anywhere_commit_the_same_frame_as_read_csv(upload_dir, monkeypatch):
+    ingested = {}
+
+    def fake_ingest(path, filename, db_name, table_name, if_exists, key_columns, df=None):
+        ingested["df"] = df
+        return {"status": "success", "table_name": table_name}
+
+    monkeypatch.setattr(uploads, "ingest_path_to_db", fake_ingest)
+    meta = uploads.init_upload("scores.csv", "demo", len(CSV), table_name="scores")
+    upload_id = meta["upload_id"]
+    for offset in range(0, len(CSV), 7):  # cuts through records and the quoted newline
+        uploads.append_chunk(upload_id, offset, CSV[offset:offset + 7])
+        uploads._parse_available(upload_id)
+
+    result = uploads.commit_upload(upload_id)
+    assert result["upload"]["parsed_while_receiving"]
+    pd.testing.assert_frame_equal(ingested["df"], pd.read_csv(io.BytesIO(CSV)))
+    with pytest.raises(KeyError):
+        uploads.load_upload(upload_id)  # cleaned up after a successful ingest
+
+
+def test_append_chunk_offsets(upload_dir):
+    upload_id = uploads.init_upload("scores.csv", "demo", len(CSV))["upload_id"]
+    uploads.append_chunk(upload_id, 0, CSV[:10])
+    assert uploads.append_chunk(upload_id, 0, CSV[:10])["duplicate"]  # lost ack → resent chunk
+    with pytest.raises(UploadConflict) as gap:
+        uploads.append_chunk(upload_id, 20, CSV[20:30])
+    assert gap.value.received == 10
+    with pytest.raises(UploadConflict):
+        uploads.commit_upload(upload_id)  # incomplete
+    with pytest.raises(KeyError):
+        uploads.append_chunk("../etc", 0, b"x")
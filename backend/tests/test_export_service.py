@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from app.services import export_service as exports
+from app.services.export_service import parse_range, follow_file
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-10", None),
+    ("bytes=0-99,200-299", None),  # multi-range: whole file
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-100", "bytes=-0", "bytes=a-b", "bytes=-"])
+def test_unsatisfiable_or_invalid_range_raises(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.fixture
+def running_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_DIR", str(tmp_path))
+    meta = {"export_id": "abc123", "status": "running", "format": "csv", "suffix": ".csv"}
+    os.makedirs(tmp_path / "abc123")
+    exports._save(meta)
+    with open(exports.artifact_path(meta), "wb") as f:
+        f.write(b"a,b\n1,2\n")
+    return meta
+
+
+def _finish(meta, status, tail=b"", **extra):
+    with open(exports.artifact_path(meta), "ab") as f:
+        f.write(tail)
+    exports._save({**meta, "status": status, **extra})
+
+
+def test_following_a_csv_export_streams_it_to_the_end(running_csv):
+    stream = follow_file("abc123", poll_s=0)
+    assert next(stream) == b"a,b\n1,2\n"
+    _finish(running_csv, "done", b"3,4\n")
+    assert b"".join(stream) == b"3,4\n"
+
+
+@pytest.mark.parametrize("status", ["error", "cancelled"])
+def test_following_a_failed_export_aborts_the_download(running_csv, status):
+    stream = follow_file("abc123", poll_s=0)
+    next(stream)
+    _finish(running_csv, status, b"3,", error="Lost connection to MySQL")
+    with pytest.raises(RuntimeError, match=status):
+        b"".join(stream)
@@ -0,0 +1,26 @@
+import pytest
+
+from utils.query_governor import apply_limit
+
+
+@pytest.mark.parametrize("sql, expected, cap", [
+    ("SELECT * FROM sales", "SELECT * FROM sales\nLIMIT 101", 101),
+    ("SELECT * FROM sales;", "SELECT * FROM sales\nLIMIT 101", 101),
+    ("WITH t AS (SELECT 1) SELECT * FROM t", "WITH t AS (SELECT 1) SELECT * FROM t\nLIMIT 101", 101),
+    ("SELECT * FROM sales LIMIT 10", "SELECT * FROM sales LIMIT 10", 10),
+    ("SELECT * FROM sales LIMIT 5000", "SELECT * FROM sales LIMIT 101", 101),
+    ("SELECT * FROM sales LIMIT 5000 OFFSET 20", "SELECT * FROM sales LIMIT 101 OFFSET 20", 101),
+    ("SELECT * FROM sales LIMIT 20, 5000", "SELECT * FROM sales LIMIT 20, 101", 101),
+])
+def test_top_level_result_is_capped(sql, expected, cap):
+    assert apply_limit(sql, 100) == (expected, cap)
+
+
+def test_subquery_limit_does_not_count_as_the_outer_one():
+    sql, cap = apply_limit("SELECT * FROM (SELECT * FROM sales LIMIT 5) t", 100)
+    assert sql.endswith("\nLIMIT 101") and cap == 101
+
+
+@pytest.mark.parametrize("sql", ["SHOW TABLES", "DESCRIBE sales", "EXPLAIN SELECT * FROM sales"])
+def test_statements_without_limit_are_untouched(sql):
+    assert apply_limit(sql, 100) == (sql, None)
@@ -0,0 +1,78 @@
+import pytest
+
+from utils import scheduler
+from utils.scheduler import FairScheduler, Overloaded, _Ticket
+
+
+def _queue(sched, tenants, granted):
+    """Queue one background ticket per entry of `tenants`; grants are appended to `granted`."""
+    for i, tenant in enumerate(tenants):
+        ticket = _Ticket(on_grant=lambda t=tenant, i=i: granted.append((t, i)))
+        assert not sched._enqueue(ticket, tenant, interactive=False)
+
+
+@pytest.fixture
+def in_request():
+    token = scheduler._request.set({"api_key": None})  # what scheduler_middleware sets per HTTP request
+    yield
+    scheduler._request.reset(token)
+
+
+def test_quiet_tenant_is_served_before_a_flooding_one():
+    sched = FairScheduler("db", capacity=1, weights={})
+    assert sched._enqueue(_Ticket(), "flood", interactive=False)
+    granted = []
+    _queue(sched, ["flood"] * 3 + ["quiet"], granted)
+    for _ in range(4):
+        sched._release(granted[-1][0] if granted else "flood", 1.0)
+    assert [t for t, _ in granted] == ["quiet", "flood", "flood", "flood"]
+
+
+def test_slots_are_shared_by_weight():
+    sched = FairScheduler("db", capacity=1, weights={"gold": 2.0})
+    assert sched._enqueue(_Ticket(), "gold", interactive=False)
+    granted = []
+    _queue(sched, ["gold", "bronze"] * 30, granted)
+    for _ in range(30):
+        sched._release(granted[-1][0] if granted else "gold", 1.0)
+    share = [t for t, _ in granted].count("gold")
+    assert 19 <= share <= 21
+
+
+def test_per_tenant_cap_leaves_room_for_others():
+    sched = FairScheduler("db", capacity=2, per_tenant=1, weights={})
+    assert sched._enqueue(_Ticket(), "a", interactive=False)
+    assert not sched._enqueue(_Ticket(), "a", interactive=False)
+    assert sched._enqueue(_Ticket(), "b", interactive=False)
+    assert sched.stats()["tenants"]["a"]["queued"] == 1
+
+
+def test_full_queue_sheds_requests_but_not_background_work():
+    sched = FairScheduler("db", capacity=1, max_queue=1, weights={})
+    assert sched._enqueue(_Ticket(), "a", interactive=True)
+    assert not sched._enqueue(_Ticket(), "a", interactive=True)
+    with pytest.raises(Overloaded) as shed:
+        sched._enqueue(_Ticket(), "a", interactive=True)
+    assert shed.value.retry_after >= 1 and shed.value.tenant == "a" and shed.value.resource == "db"
+    assert not sched._enqueue(_Ticket(), "a", interactive=False)  # batch jobs wait their turn
+    assert sched.stats()["tenants"]["a"]["shed"] == 1
+
+
+def test_long_estimated_wait_sheds_before_the_queue_is_full():
+    sched = FairScheduler("db", capacity=1, max_queue=100, max_wait_s=2, weights={})
+    assert sched._enqueue(_Ticket(), "a", interactive=True)
+    sched._release("a", 5000.0)  # one job took 5 s
+    assert sched._enqueue(_Ticket(), "a", interactive=True)
+    with pytest.raises(Overloaded) as shed:
+        sched._enqueue(_Ticket(), "a", interactive=True)
+    assert shed.value.retry_after >= 5
+
+
+def test_slot_in_a_request_raises_overloaded(in_request):
+    sched = FairScheduler("db", capacity=1, max_queue=0, weights={})
+    with sched.slot("sales") as ticket:
+        assert ticket.queue_ms == 0.0
+        with pytest.raises(Overloaded):
+            with sched.slot("sales"):
+                pass
+    assert sched.running == 0
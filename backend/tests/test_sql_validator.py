@@ -0,0 +1,52 @@
+import pytest
+
+from utils.sql_validator import validate_sql, build_repair_prompt
+
+CATALOG = {
+    "Sales": ["id", "region", "amount", "year"],
+    "regions": ["id", "name"],
+}
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT region, SUM(amount) FROM Sales GROUP BY region",
+    "select REGION from sales where YEAR = 2020",  # MySQL identifiers are case-insensitive here
+    "SELECT s.amount, r.name FROM Sales s JOIN regions r ON r.id = s.region",
+    "SELECT region, SUM(amount) AS total FROM Sales GROUP BY region ORDER BY total DESC",
+    "WITH t AS (SELECT region AS reg FROM Sales) SELECT reg FROM t",
+    "SELECT * FROM Sales WHERE region LIKE 'n%%'",
+])
+def test_valid_sql_passes(sql):
+    result = validate_sql(sql, CATALOG)
+    assert result["valid"], result["issues"]
+
+
+def test_unknown_table_is_reported_with_suggestions():
+    result = validate_sql("SELECT amount FROM sale", CATALOG)
+    assert not result["valid"]
+    issue = result["issues"][0]
+    assert issue["kind"] == "table" and issue["identifier"] == "sale"
+    assert "Sales" in issue["suggestions"]
+
+
+def test_unknown_column_is_reported_once_per_table():
+    result = validate_sql("SELECT amout, SUM(amout) FROM Sales s WHERE s.amout > 0", CATALOG)
+    assert [(i["kind"], i["identifier"]) for i in result["issues"]] == [("column", "amout")]
+    assert result["issues"][0]["suggestions"][0] == "amount"
+
+
+def test_qualified_column_is_checked_against_its_own_table():
+    result = validate_sql("SELECT r.amount FROM Sales s JOIN regions r ON r.id = s.region", CATALOG)
+    assert [(i["identifier"], i["table"]) for i in result["issues"]] == [("amount", "regions")]
+
+
+def test_unparseable_sql_is_left_to_mysql():
+    result = validate_sql("SELECT FROM WHERE (", CATALOG)
+    assert result["valid"] and "skipped" in result
+
+
+def test_repair_prompt_names_only_the_offending_identifiers():
+    issues = validate_sql("SELECT amout FROM Sales", CATALOG)["issues"]
+    prompt = build_repair_prompt("SELECT amout FROM Sales", issues)
+    assert "amout" in prompt and "amount" in prompt
+    assert "regions" not in prompt
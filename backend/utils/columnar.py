@@ -0,0 +1,143 @@
+# utils/columnar.py
+"""
+Columnar mirror of ingested tables: ./columnar/{db}/{table}/{year_col}=YYYY/part-*.parquet
+
+Written next to the MySQL table at ingest time so scan-heavy aggregate queries can be served
+by an embedded DuckDB engine (see utils/query_router.py). The manifest records every append
+batch (files + row count) so consumers can tell exactly which files are new.
+"""
+import os, re, json, time, uuid, shutil
+import pandas as pd
+
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", "./columnar")
+MANIFEST_NAME = "_manifest.json"
+YEAR_MIN, YEAR_MAX = 1900, 2100
+DATE_PARTITION_COL = "_year"
+DUCKDB_COLLATION = "nocase.noaccent"  # ≈ utf8mb4_*_ci
+
+_COLLATION_RE = re.compile(r"\b(like|rlike|regexp|distinct)\b", re.I)
+
+
+def duckdb_connect():
+    """In-memory DuckDB connection that compares / groups strings like MySQL's _ci collations."""
+    import duckdb
+
+    con = duckdb.connect(database=":memory:")
+    con.execute(f"SET default_collation = '{DUCKDB_COLLATION}'")
+    return con
+
+
+def collation_dependency(sql: str):
+    """Reason a query's result depends on MySQL's collation beyond what DuckDB emulates, or None."""
+    m = _COLLATION_RE.search(sql)
+    return f"{m.group(1).upper()} depends on MySQL's case-insensitive collation" if m else None
+
+
+def table_dir(db_name: str, table_name: str) -> str:
+    return os.path.join(COLUMNAR_DIR, db_name, table_name)
+
+
+def read_manifest(db_name: str, table_name: str):
+    path = os.path.join(table_dir(db_name, table_name), MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(db_name: str, table_name: str, manifest: dict):
+    path = os.path.join(table_dir(db_name, table_name), MANIFEST_NAME)
+    tmp = path + f".tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def detect_year_column(df: pd.DataFrame):
+    """
+    Returns (column, kind) for the best temporal partition key, or (None, None).
+    kind="year" → integer year column used as-is; kind="date" → year derived from a datetime column.
+    """
+    candidates = []
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_integer_dtype(s) or pd.api.types.is_float_dtype(s):
+            vals = s.dropna()
+            if len(vals) and (vals % 1 == 0).all() and vals.between(YEAR_MIN, YEAR_MAX).all():
+                score = 2 if "year" in str(col).lower() else 1
+                if score == 2 or vals.nunique() > 1:
+                    candidates.append((score, col, "year"))
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            candidates.append((1.5 if "date" in str(col).lower() else 1.2, col, "date"))
+    if not candidates:
+        return None, None
+    _, col, kind = max(candidates, key=lambda c: c[0])
+    return col, kind
+
+
+def write_table_parquet(df: pd.DataFrame, db_name: str, table_name: str, if_exists: str = "replace") -> dict:
+    """
+    Mirror an ingested DataFrame as hive-partitioned Parquet.
+    - replace: drop the previous mirror first
+    - append: add a new batch of part files next to the existing ones. Raises LookupError
+      when there is no mirror to append to: the batch alone would be a partial copy of the
+      table (mirror it in full with replace instead)
+    Returns the updated manifest.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    base = table_dir(db_name, table_name)
+    manifest = read_manifest(db_name, table_name)
+    if if_exists == "append" and manifest is None:
+        raise LookupError(f"No Parquet mirror of {db_name}.{table_name} to append to.")
+    if if_exists != "append":
+        shutil.rmtree(base, ignore_errors=True)
+        manifest = None
+    os.makedirs(base, exist_ok=True)
+
+    if manifest is None:
+        part_col, kind = detect_year_column(df)
+        manifest = {"db_name": db_name, "table_name": table_name, "partition_column": part_col,
+                    "partition_kind": kind, "rows": 0, "batches": []}
+    part_col, kind = manifest.get("partition_column"), manifest.get("partition_kind")
+
+    frame = df
+    partition_by = None
+    if part_col and part_col in df.columns:
+        if kind == "date":
+            frame = df.assign(**{DATE_PARTITION_COL: pd.to_datetime(df[part_col], errors="coerce").dt.year.astype("Int64")})
+            partition_by = DATE_PARTITION_COL
+        else:
+            frame = df.assign(**{part_col: df[part_col].astype("Int64")})
+            partition_by = part_col
+
+    batch_id = uuid.uuid4().hex[:12]
+    written = []
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    ds.write_dataset(
+        table,
+        base,
+        format="parquet",
+        partitioning=[partition_by] if partition_by else None,
+        partitioning_flavor="hive" if partition_by else None,
+        basename_template=f"part-{batch_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda f: written.append(os.path.relpath(f.path, base)),
+    )
+
+    manifest["rows"] += len(df)
+    manifest["batches"].append({"batch_id": batch_id, "files": written, "rows": len(df), "written_at": time.time()})
+    manifest["updated_at"] = time.time()
+    _write_manifest(db_name, table_name, manifest)
+    print(f"[Columnar] ✅ Mirrored {db_name}.{table_name} → {len(written)} parquet file(s), partitioned by {partition_by}")
+    return manifest
+
+
+def drop_table_parquet(db_name: str, table_name: str):
+    shutil.rmtree(table_dir(db_name, table_name), ignore_errors=True)
+
+
+def parquet_glob(db_name: str, table_name: str) -> str:
+    return os.path.join(table_dir(db_name, table_name), "**", "*.parquet")
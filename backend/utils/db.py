@@ -64,3 +64,38 @@ def get_engine_for_db(db_name: str):
         url = f"mysql+pymysql://{DB_USER}:{DB_PASS_QUOTED}@{DB_HOST}:{DB_PORT}/{db_name}"
         _engine_cache[db_name] = create_engine(url, pool_pre_ping=True, pool_recycle=3600)
     return _engine_cache[db_name]
+
+
+# --- async engines (SQLAlchemy asyncio) for the read-only request handlers, see utils/db_async.py ---
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "1") == "1"
+ASYNC_DB_DRIVER = os.getenv("ASYNC_DB_DRIVER", "aiomysql").lower()  # aiomysql | asyncmy
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+_async_engine_cache = {}
+
+
+def async_driver_available() -> bool:
+    import importlib.util
+    return ASYNC_DB_ENABLED and importlib.util.find_spec(ASYNC_DB_DRIVER) is not None \
+        and importlib.util.find_spec("greenlet") is not None
+
+
+def get_async_engine_for_db(db_name: str = None, root: bool = False):
+    """
+    AsyncEngine for `db_name` (the server itself with root=True), or None when the async
+    path is disabled / its driver is not installed — callers then use the sync engine.
+    Pools belong to the event loop that opened them, so engines are cached per loop.
+    """
+    if not async_driver_available():
+        return None
+    import asyncio
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    key = ("" if root else db_name or DB_NAME, asyncio.get_running_loop())
+    if key not in _async_engine_cache:
+        for stale in [k for k in _async_engine_cache if k[1].is_closed()]:
+            del _async_engine_cache[stale]  # engines of a finished asyncio.run() (benchmarks, scripts)
+        url = f"mysql+{ASYNC_DB_DRIVER}://{DB_USER}:{DB_PASS_QUOTED}@{DB_HOST}:{DB_PORT}/{key[0]}"
+        _async_engine_cache[key] = create_async_engine(url, pool_pre_ping=True, pool_recycle=3600,
+                                                       pool_size=ASYNC_DB_POOL_SIZE, max_overflow=ASYNC_DB_MAX_OVERFLOW)
+    return _async_engine_cache[key]
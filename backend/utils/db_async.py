@@ -0,0 +1,205 @@
+# utils/db_async.py
+"""
+Async MySQL path for the read-only request handlers (database / table lists, previews,
+/api/execute).
+- SQLAlchemy asyncio engines (aiomysql or asyncmy, see utils/db.py): while MySQL works,
+  the event loop awaits the socket instead of parking a threadpool worker on the query,
+  so slow queries no longer starve every other sync endpoint of threads
+- Only the round trips are awaited on the loop: rows are fetched in batches (yielding to other
+  requests in between) and the DataFrame is built in the threadpool, like pd.read_sql would
+- Sync fallback: with ASYNC_DB_ENABLED=0 or the driver missing, the same query runs on the
+  PyMySQL engine in the threadpool (the previous behaviour)
+- benchmark_async_db(): request concurrency vs latency, sync-in-threadpool vs async
+  (`python -m utils.db_async` from backend/, or /api/debug/db/benchmark)
+"""
+import time, asyncio, threading
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+from utils.db import (get_engine_for_db, get_async_engine_for_db, root_engine, async_driver_available,
+                      ASYNC_DB_DRIVER, ASYNC_DB_POOL_SIZE, ASYNC_DB_MAX_OVERFLOW)
+
+
+def driver_name() -> str:
+    return ASYNC_DB_DRIVER if async_driver_available() else "pymysql"
+
+
+FETCH_BATCH_ROWS = 1000
+
+
+def _execute_sync(conn, sql):
+    return conn.exec_driver_sql(sql) if isinstance(sql, str) else conn.execute(sql)
+
+
+def _fetch_sync(db_name: str, sql, root: bool):
+    engine = root_engine if root else get_engine_for_db(db_name)
+    with engine.connect() as conn:
+        result = _execute_sync(conn, sql)
+        return list(result.keys()), result.fetchall()
+
+
+async def fetch_on(conn, sql):
+    """
+    (columns, rows) of `sql` on an open AsyncConnection. Rows are taken from the result in
+    batches of FETCH_BATCH_ROWS with a yield to the loop in between, so a large result does
+    not hold up other requests while it is converted.
+    """
+    result = await (conn.exec_driver_sql(sql) if isinstance(sql, str) else conn.execute(sql))
+    columns, rows = list(result.keys()), []
+    while True:
+        batch = result.fetchmany(FETCH_BATCH_ROWS)
+        if not batch:
+            return columns, rows
+        rows.extend(batch)
+        await asyncio.sleep(0)
+
+
+async def fetch(sql, db_name: str = None, root: bool = False):
+    """(columns, rows) of `sql` on a pooled connection of `db_name` (the server with root=True)."""
+    engine = get_async_engine_for_db(db_name, root=root)
+    if engine is None:
+        return await run_in_threadpool(_fetch_sync, db_name, sql, root)
+    async with engine.connect() as conn:
+        return await fetch_on(conn, sql)
+
+
+def to_frame(columns: list, rows: list) -> pd.DataFrame:
+    """What pd.read_sql builds from a result (CPU work: call it via run_in_threadpool)."""
+    return pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns, coerce_float=True)
+
+
+async def read_frame(sql, db_name: str = None, root: bool = False) -> pd.DataFrame:
+    """pd.read_sql for async handlers: the query is awaited, the DataFrame is built off the loop."""
+    columns, rows = await fetch(sql, db_name, root=root)
+    return await run_in_threadpool(to_frame, columns, rows)
+
+
+async def fetch_column(sql: str, db_name: str = None, root: bool = False) -> list:
+    """First column of every row, e.g. SHOW DATABASES / SHOW TABLES."""
+    _, rows = await fetch(sql, db_name, root=root)
+    return [row[0] for row in rows]
+
+
+# --- benchmark: concurrency vs latency ---
+def _pct(values, q: float):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+
+
+async def _measure(call, concurrency: int, n_requests: int, limiter) -> dict:
+    """
+    n_requests calls of `call`, at most `concurrency` in flight. Meanwhile a probe keeps
+    submitting a no-op to the shared threadpool: its latency is what every other sync
+    endpoint would see while this load runs.
+    """
+    import anyio
+
+    gate = asyncio.Semaphore(concurrency)
+    latencies, probes = [], []
+    done = asyncio.Event()
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await anyio.to_thread.run_sync(lambda: None, limiter=limiter)
+            probes.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.005)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return {
+        "p50_ms": _pct(latencies, 0.5),
+        "p95_ms": _pct(latencies, 0.95),
+        "req_per_sec": round(n_requests / elapsed, 1),
+        "threadpool_probe_p95_ms": _pct(probes, 0.95),
+    }
+
+
+async def benchmark_async_db(concurrency: tuple = (1, 8, 32, 64, 128), sleep_ms: int = 50, db_name: str = None,
+                             threads: int = 40, stand_in: bool = False) -> dict:
+    """
+    Per concurrency level: latency / throughput of a query that waits `sleep_ms` in MySQL
+    (SELECT SLEEP), once through a sync engine on a `threads`-sized threadpool (Starlette's
+    default is 40) and once through the async engine; both with the same connection pool size.
+    stand_in=True needs no MySQL: the wait is time.sleep in a thread vs asyncio.sleep.
+    """
+    import anyio
+    from sqlalchemy import create_engine
+
+    pool = ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW
+    limiter = anyio.CapacityLimiter(threads)
+    sql = f"SELECT SLEEP({sleep_ms / 1000})"
+    sync_engine, async_engine = None, None
+
+    if stand_in:
+        connections = threading.BoundedSemaphore(pool)
+        async_connections = asyncio.Semaphore(pool)
+
+        def sync_query():
+            with connections:
+                time.sleep(sleep_ms / 1000)
+
+        async def async_call():
+            async with async_connections:
+                await asyncio.sleep(sleep_ms / 1000)
+    else:
+        async_engine = get_async_engine_for_db(db_name)
+        if async_engine is None:
+            raise RuntimeError(f"Async driver '{ASYNC_DB_DRIVER}' is not installed (or ASYNC_DB_ENABLED=0).")
+        sync_engine = create_engine(get_engine_for_db(db_name).url, pool_size=ASYNC_DB_POOL_SIZE,
+                                    max_overflow=ASYNC_DB_MAX_OVERFLOW)
+
+        def sync_query():
+            with sync_engine.connect() as conn:
+                conn.exec_driver_sql(sql).fetchall()
+
+        async def async_call():
+            async with async_engine.connect() as conn:
+                (await conn.exec_driver_sql(sql)).fetchall()
+
+    async def sync_call():
+        await anyio.to_thread.run_sync(sync_query, limiter=limiter)
+
+    levels = []
+    try:
+        await sync_call()  # warm-up: open the first pooled connections
+        await async_call()
+        for c in concurrency:
+            n_requests = max(32, c * 4)
+            levels.append({
+                "concurrency": c,
+                "requests": n_requests,
+                "sync": await _measure(sync_call, c, n_requests, limiter),
+                "async": await _measure(async_call, c, n_requests, limiter),
+            })
+    finally:
+        if sync_engine is not None:
+            sync_engine.dispose()
+    result = {"mode": "stand-in" if stand_in else "mysql", "driver": ASYNC_DB_DRIVER, "sleep_ms": sleep_ms,
+              "threads": threads, "pool": pool, "levels": levels}
+    print(f"[DB async] 📊 Benchmark ({result['mode']}): " + ", ".join(
+        f"c={l['concurrency']} sync p95={l['sync']['p95_ms']}ms async p95={l['async']['p95_ms']}ms" for l in levels))
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    async def _main():
+        try:
+            return await benchmark_async_db(stand_in="--stand-in" in sys.argv)
+        finally:
+            engine = get_async_engine_for_db(None)
+            if engine is not None:
+                await engine.dispose()  # close the pool before asyncio.run() closes the loop
+
+    print(asyncio.run(_main()))
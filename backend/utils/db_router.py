@@ -0,0 +1,124 @@
+# utils/db_router.py
+"""
+Cross-database table router: one vectorized search over the table rows of every
+per-database schema snapshot, so a question can be answered without preselecting a DB.
+- Shards are the existing `schema_<db>` snapshots, mapped lazily on the first routing call
+- The stacked table matrix is rebuilt only when some shard publishes a new version
+- Databases that were never indexed are synced once in the background (at startup, or the
+  first time they are seen); routing uses the shards that exist meanwhile
+"""
+import os, time, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sqlalchemy import text
+from utils.db import root_engine
+from utils.vector_snapshots import get_reader, list_indexes
+from utils.schema_index import schema_index_name, get_schema_snapshot, table_rows
+
+SYSTEM_DATABASES = {"information_schema", "mysql", "performance_schema", "sys"}
+ROUTER_DB_LIST_TTL = float(os.getenv("ROUTER_DB_LIST_TTL", "60"))
+ROUTER_CANDIDATES = int(os.getenv("ROUTER_CANDIDATES", "5"))
+
+
+def list_user_databases() -> list:
+    with root_engine.connect() as conn:
+        dbs = [row[0] for row in conn.execute(text("SHOW DATABASES;")).fetchall()]
+    return [d for d in dbs if d.lower() not in SYSTEM_DATABASES]
+
+
+class GlobalTableRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dbs, self._dbs_at = None, 0.0
+        # (shard versions, stacked table vectors, (db_name, table) per row) — swapped as one tuple
+        self._state = (None, np.zeros((0, 0), dtype=np.float32), [])
+        self._sync_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="router-sync")
+        self._sync_submitted = set()
+
+    def _sync_in_background(self, db: str):
+        """One-time schema index build for a database that has none; never on the request path."""
+        with self._lock:
+            if db in self._sync_submitted:
+                return
+            self._sync_submitted.add(db)
+
+        def build():
+            try:
+                get_schema_snapshot(db)
+                print(f"[DB Router] ✅ Indexed '{db}' in the background")
+            except Exception:
+                traceback.print_exc()
+
+        self._sync_pool.submit(build)
+
+    def warm_up(self):
+        """At startup: index every database that has no schema snapshot yet (in the background)."""
+        self._sync_pool.submit(self._shards)
+
+    def _databases(self) -> list:
+        now = time.monotonic()
+        if self._dbs is None or now - self._dbs_at > ROUTER_DB_LIST_TTL:
+            try:
+                self._dbs = list_user_databases()
+            except Exception as e:
+                # MySQL unreachable → route over whatever is already indexed
+                print(f"[DB Router] ⚠️ Could not list databases, using indexed shards only: {e}")
+                self._dbs = [n[len("schema_"):] for n in list_indexes("schema_")]
+            self._dbs_at = now
+            with self._lock:
+                self._sync_submitted.clear()  # failed background builds get another try
+        return self._dbs
+
+    def _shards(self) -> dict:
+        shards = {}
+        for db in self._databases():
+            snapshot = get_reader(schema_index_name(db)).get()
+            if snapshot is None:
+                self._sync_in_background(db)  # first sighting → routed to once its index is published
+            elif len(snapshot):
+                shards[db] = snapshot
+        return shards
+
+    def _refresh(self):
+        shards = self._shards()
+        key = tuple(sorted((db, s.version) for db, s in shards.items()))
+        if key == self._state[0]:
+            return
+        with self._lock:
+            if key == self._state[0]:
+                return
+            blocks, labels = [], []
+            for db, snapshot in sorted(shards.items()):
+                rows = table_rows(snapshot)
+                blocks.append(np.asarray(snapshot.vectors)[rows])
+                labels += [(db, snapshot.records[i]["table"]) for i in rows]
+            matrix = np.vstack(blocks).astype(np.float32) if blocks else np.zeros((0, 0), dtype=np.float32)
+            self._state = (key, matrix, labels)
+            print(f"[DB Router] ✅ Routing index over {len(shards)} databases / {len(labels)} tables")
+
+    def route(self, question_vector, k: int = ROUTER_CANDIDATES) -> list:
+        """Top-k (db, table) candidates → [(score, db_name, table), ...] best first."""
+        self._refresh()
+        _, matrix, labels = self._state
+        if not labels or k <= 0:
+            return []
+        q = np.asarray(question_vector, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        scores = matrix @ q
+        k = min(k, len(labels))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), labels[i][0], labels[i][1]) for i in top]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_table_router() -> GlobalTableRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = GlobalTableRouter()
+    return _router
@@ -1,17 +1,14 @@
 # backend/utils/db_utils.py
-import re
+import re, json
+import numpy as np
 import pandas as pd
 from sqlalchemy import Integer, Float, DateTime, String
 from sqlalchemy.inspection import inspect
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
 from utils.db import get_engine_for_db
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-import shutil, os, chromadb
-from utils.chroma_utils import sync_chroma_schema_embeddings
-
-
-from chromadb.config import Settings
+import shutil, os, uuid
+from utils.schema_index import sync_schema_index
+from utils.partitioning import partition_column
 
 
 
@@ -26,14 +23,6 @@ def sanitize_name(name: str) -> str:
         name = 'col'
     return name
 
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].astype(str).str.strip()
-        # convert empty string to None
-        df[col] = df[col].replace({'': None})
-    return df
-
 def infer_sql_type(dtype):
     # return SQLAlchemy column types
     if pd.api.types.is_integer_dtype(dtype):
@@ -45,19 +34,196 @@ def infer_sql_type(dtype):
     else:
         return String(255)
 
-def refresh_schema_cache(db_name: str):
+def dataframe_to_response(df: pd.DataFrame) -> dict:
     """
-    Refreshes SQLAlchemy metadata and synchronizes Chroma embeddings incrementally.
-    This version no longer deletes directories — it safely updates embeddings.
+    Converts a query result DataFrame into a JSON-safe {rows, columns, row_count} payload.
     """
-    # 1️⃣ Refresh SQLAlchemy cache
-    engine = get_engine_for_db(db_name)
-    engine.dispose()
-    print(f"[Schema Refresh] ✅ Cleared SQLAlchemy cache for database '{db_name}'")
+    # --- Step 1: Clean numeric edge cases ---
+    df = df.replace([np.inf, -np.inf], None)
+    df = df.where(pd.notnull(df), None)
+
+    # --- Step 2: Convert all timestamps/dates to strings ---
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype(str)
+
+    # --- Step 3: Convert to plain Python objects ---
+    df = df.astype(object)
+
+    response = {
+        "rows": df.to_dict(orient="records"),
+        "columns": list(df.columns),
+        "row_count": len(df)
+    }
+
+    # --- Step 4: Validate JSON safety ---
+    try:
+        json.dumps(response, allow_nan=False)
+    except (TypeError, ValueError):
+        def clean_for_json(obj):
+            if isinstance(obj, float):
+                if np.isnan(obj) or np.isinf(obj):
+                    return None
+            elif isinstance(obj, dict):
+                return {k: clean_for_json(v) for k, v in obj.items()}
+            elif isinstance(obj, list):
+                return [clean_for_json(x) for x in obj]
+            elif hasattr(obj, "isoformat"):  # Handle datetime objects
+                return obj.isoformat()
+            return obj
+
+        response = clean_for_json(response)
 
-    # 2️⃣ Incremental Chroma sync
+    return response
+
+def refresh_schema_cache(db_name: str, tables: list = None):
+    """
+    Synchronizes the schema index incrementally — once, and only for `tables` when given.
+    The engine is not disposed: inspect() reads fresh metadata on every call, so pooled
+    connections can be kept across uploads.
+    """
     try:
-        sync_chroma_schema_embeddings(db_name)
-        print(f"[Chroma Refresh] ✅ Synced embeddings incrementally for '{db_name}'")
+        sync_schema_index(db_name, tables=tables)
+        print(f"[Index Refresh] ✅ Synced embeddings incrementally for '{db_name}'" + (f" ({', '.join(tables)})" if tables else ""))
     except Exception as e:
-        print(f"[Chroma Refresh] ⚠️ Failed to sync embeddings for '{db_name}': {e}")
\ No newline at end of file
+        print(f"[Index Refresh] ⚠️ Failed to sync embeddings for '{db_name}': {e}")
+
+
+# --- keyed append (upsert) ---
+_KEY_NAME_RE = re.compile(r"(^id$|_id$|^code$|_code$|_key$|_no$|_number$|^sku$|^email$)")
+
+
+def detect_natural_key(df: pd.DataFrame, engine=None, table_name: str = None) -> list:
+    """
+    Natural key for an upsert, in order of preference:
+    1. the existing table's primary key / first unique index
+    2. a single non-null unique column (id-like names first)
+    3. a non-null unique pair of columns
+    Returns [] when nothing qualifies.
+    """
+    if engine is not None and table_name:
+        inspector = inspect(engine)
+        if inspector.has_table(table_name):
+            pk = inspector.get_pk_constraint(table_name).get("constrained_columns") or []
+            if pk and all(c in df.columns for c in pk):
+                return pk
+            for idx in inspector.get_indexes(table_name):
+                if idx.get("unique") and all(c in df.columns for c in idx["column_names"]):
+                    return list(idx["column_names"])
+
+    candidates = [c for c in df.columns if df[c].notna().all() and not pd.api.types.is_float_dtype(df[c])]
+    singles = [c for c in candidates if df[c].is_unique]
+    if singles:
+        return [sorted(singles, key=lambda c: (not _KEY_NAME_RE.search(str(c)), list(df.columns).index(c)))[0]]
+    for i, a in enumerate(candidates[:12]):
+        for b in candidates[i + 1:12]:
+            if not df.duplicated(subset=[a, b]).any():
+                return [a, b]
+    return []
+
+
+def _ensure_unique_key(conn, table_name: str, key_columns: list):
+    """
+    ON DUPLICATE KEY UPDATE needs a unique index on the key; add one if the table has none.
+    MySQL requires every unique key of a partitioned table to include the partitioning column,
+    so such tables can only be upserted on keys that contain it.
+    """
+    part_col = partition_column(conn, table_name)
+    if part_col and part_col not in key_columns:
+        raise ValueError(f"Table '{table_name}' is partitioned by '{part_col}'; an upsert key must include it "
+                         f"(got {key_columns}). Pass key_columns with '{part_col}' or use append.")
+    insp = inspect(conn)
+    pk = insp.get_pk_constraint(table_name).get("constrained_columns") or []
+    uniques = [idx["column_names"] for idx in insp.get_indexes(table_name) if idx.get("unique")]
+    if pk == key_columns or key_columns in uniques:
+        return
+    cols = ", ".join(f"`{c}`" for c in key_columns)
+    dupes = conn.execute(text(
+        f"SELECT COUNT(*) - COUNT(DISTINCT {cols}) FROM `{table_name}`"
+    )).scalar() if len(key_columns) == 1 else conn.execute(text(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM `{table_name}` GROUP BY {cols} HAVING COUNT(*) > 1) d"
+    )).scalar()
+    if dupes:
+        raise ValueError(f"Table '{table_name}' already has duplicate rows for key {key_columns}; "
+                         f"deduplicate it or choose other key columns.")
+    conn.execute(text(f"ALTER TABLE `{table_name}` ADD UNIQUE KEY `uq_upsert_key` ({cols})"))
+    print(f"[Upsert] 🔑 Added unique key {key_columns} on '{table_name}'")
+
+
+def add_missing_columns(conn, table_name: str, columns: list, dtype_map: dict) -> list:
+    """Adds upload columns the existing table does not have yet (nullable). Returns the added names."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    added = []
+    for c in columns:
+        if c not in existing:
+            type_sql = dtype_map[c].compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE `{table_name}` ADD COLUMN `{c}` {type_sql} NULL"))
+            print(f"[Ingest] ➕ Added column '{c}' to '{table_name}'")
+            added.append(c)
+    return added
+
+
+def upsert_dataframe(df: pd.DataFrame, engine, table_name: str, key_columns: list = None,
+                     dtype_map: dict = None, chunksize: int = 5000) -> dict:
+    """
+    Keyed append: rows whose key already exists are updated, new keys inserted, identical rows skipped.
+    - Loads the upload into a staging table (batched), then one INSERT … SELECT … ON DUPLICATE KEY UPDATE
+    - New columns in the upload are added to the target table first
+    Returns {key_columns, inserted, updated, skipped, inserted_rows (DataFrame)}.
+    """
+    key_columns = list(key_columns or detect_natural_key(df, engine, table_name))
+    if not key_columns:
+        raise ValueError("No natural key found in the upload; pass key_columns explicitly.")
+    missing = [c for c in key_columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Key columns {missing} are not in the uploaded file.")
+
+    total = len(df)
+    df = df.drop_duplicates(subset=key_columns, keep="last")  # last occurrence in the file wins
+    skipped_in_file = total - len(df)
+    dtype_map = dtype_map or {col: infer_sql_type(dtype) for col, dtype in df.dtypes.items()}
+
+    if not inspect(engine).has_table(table_name):
+        df.to_sql(table_name, con=engine, if_exists="fail", index=False, dtype=dtype_map, chunksize=chunksize)
+        with engine.begin() as conn:
+            _ensure_unique_key(conn, table_name, key_columns)
+        return {"key_columns": key_columns, "inserted": len(df), "updated": 0,
+                "skipped": skipped_in_file, "inserted_rows": df}
+
+    # unique per call: concurrent upserts into one table (threads or workers) never share staging rows
+    staging = f"_stg_{uuid.uuid4().hex[:12]}_{table_name}"[:64]
+    cols = list(df.columns)
+    col_list = ", ".join(f"`{c}`" for c in cols)
+    join_on = " AND ".join(f"t.`{k}` <=> s.`{k}`" for k in key_columns)
+    value_cols = [c for c in cols if c not in key_columns]
+    same_values = " AND ".join(f"t.`{c}` <=> s.`{c}`" for c in value_cols) or "1"
+    try:
+        with engine.begin() as conn:
+            add_missing_columns(conn, table_name, cols, dtype_map)
+            _ensure_unique_key(conn, table_name, key_columns)
+
+        df.to_sql(staging, con=engine, if_exists="replace", index=False, dtype=dtype_map,
+                  chunksize=chunksize, method="multi")
+
+        with engine.begin() as conn:
+            matched, unchanged = conn.execute(text(
+                f"SELECT COUNT(*), COALESCE(SUM({same_values}), 0) FROM `{staging}` s JOIN `{table_name}` t ON {join_on}"
+            )).one()
+            inserted_rows = pd.read_sql(
+                text(f"SELECT s.* FROM `{staging}` s LEFT JOIN `{table_name}` t ON {join_on} WHERE t.`{key_columns[0]}` IS NULL"),
+                conn,
+            )
+            updates = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in value_cols) or f"`{key_columns[0]}` = `{key_columns[0]}`"
+            conn.execute(text(
+                f"INSERT INTO `{table_name}` ({col_list}) SELECT {col_list} FROM `{staging}` "
+                f"ON DUPLICATE KEY UPDATE {updates}"
+            ))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+
+    matched, unchanged = int(matched), int(unchanged)
+    result = {"key_columns": key_columns, "inserted": len(df) - matched, "updated": matched - unchanged,
+              "skipped": unchanged + skipped_in_file, "inserted_rows": inserted_rows}
+    print(f"[Upsert] ✅ '{table_name}': inserted={result['inserted']}, updated={result['updated']}, skipped={result['skipped']}")
+    return result
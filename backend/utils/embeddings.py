@@ -0,0 +1,205 @@
+# utils/embeddings.py
+"""
+Pluggable sentence-embedding backend for all-MiniLM-L6-v2.
+
+EMBEDDING_BACKEND=torch  → langchain HuggingFaceEmbeddings (sentence-transformers on torch)
+EMBEDDING_BACKEND=onnx   → the same model exported to ONNX (optionally int8-quantized)
+                           and run on onnxruntime with a tuned thread count
+
+Run `python -m utils.embeddings` from backend/ for the parity check + benchmark.
+"""
+import os, time, threading, traceback
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "1") == "1"
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./onnx_models/all-MiniLM-L6-v2")
+EMBEDDING_MAX_LENGTH = 256  # max_seq_length of all-MiniLM-L6-v2
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+
+def _default_thread_count() -> int:
+    """Physical cores are the sweet spot for ORT intra-op threads; hyperthreads rarely help."""
+    env = os.getenv("EMBEDDING_THREADS")
+    if env:
+        return max(1, int(env))
+    try:
+        import psutil
+        return max(1, psutil.cpu_count(logical=False) or 1)
+    except Exception:
+        return max(1, (os.cpu_count() or 2) // 2)
+
+
+def export_onnx_model(onnx_dir: str = EMBEDDING_ONNX_DIR, quantize: bool = EMBEDDING_ONNX_QUANTIZE) -> str:
+    """
+    Export all-MiniLM-L6-v2 to ONNX once (and int8-quantize the weights if requested).
+    Returns the path of the model file to load.
+    """
+    fp32_path = os.path.join(onnx_dir, "model.onnx")
+    int8_path = os.path.join(onnx_dir, "model.int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "token_type_ids": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=14,
+        )
+        tokenizer.save_pretrained(onnx_dir)
+        print(f"[Embeddings] ✅ Exported ONNX model to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"[Embeddings] ✅ Quantized ONNX model (int8) to {int8_path}")
+
+    return target
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 on onnxruntime: tokenizer → ONNX encoder → mean pooling → L2 normalize
+    (the same pipeline sentence-transformers runs on torch).
+    """
+
+    def __init__(self, onnx_dir: str = EMBEDDING_ONNX_DIR, quantize: bool = EMBEDDING_ONNX_QUANTIZE,
+                 threads: int = None, batch_size: int = EMBEDDING_BATCH_SIZE):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = export_onnx_model(onnx_dir, quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir if os.path.exists(os.path.join(onnx_dir, "tokenizer.json")) else EMBEDDING_MODEL_NAME)
+        self.threads = threads or _default_thread_count()
+        self.batch_size = batch_size
+        self.quantized = quantize
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        print(f"[Embeddings] ✅ ONNX backend ready ({os.path.basename(model_path)}, threads={self.threads})")
+
+    def _encode(self, texts: list) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            enc = self.tokenizer(batch, padding=True, truncation=True, max_length=EMBEDDING_MAX_LENGTH, return_tensors="np")
+            feeds = {k: enc[k].astype(np.int64) for k in ("input_ids", "attention_mask", "token_type_ids") if k in self.input_names and k in enc}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        return np.vstack(out) if out else np.zeros((0, 384), dtype=np.float32)
+
+    def embed_documents(self, texts: list) -> list:
+        return self._encode([str(t) for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self._encode([str(text)])[0].tolist()
+
+
+def _build_torch_backend():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model() -> Embeddings:
+    """
+    Process-wide embedding model for the configured backend.
+    Falls back to torch if the ONNX export/session cannot be created.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_lock:
+            if _embedding_model is None:
+                if EMBEDDING_BACKEND == "onnx":
+                    try:
+                        _embedding_model = OnnxMiniLMEmbeddings()
+                    except Exception as e:
+                        print(f"[Embeddings] ⚠️ ONNX backend unavailable, falling back to torch: {e}")
+                        traceback.print_exc()
+                if _embedding_model is None:
+                    _embedding_model = _build_torch_backend()
+                    print("[Embeddings] ✅ Torch backend ready (sentence-transformers)")
+    return _embedding_model
+
+
+# --- Parity check + benchmark ---
+_SAMPLE_TEXTS = [
+    "Which staff member generated the highest total sales revenue?",
+    "Table: chrome_dataset\nColumns: year, key_achievement, adoption_usage\nTypes: INTEGER, VARCHAR(255), VARCHAR(255)",
+    "List all movies released after 2015 with a rating above 8.",
+    "2021 — Improved privacy controls and launched Manifest V3.",
+    "Show average price per brand after applying discounts.",
+    "For each year, show the technical challenges and business impact of Teams.",
+]
+
+
+def check_parity(texts: list = None, threshold: float = 0.99, quantize: bool = EMBEDDING_ONNX_QUANTIZE) -> dict:
+    """Cosine similarity between torch and ONNX embeddings of the same texts."""
+    texts = texts or _SAMPLE_TEXTS
+    ref = np.asarray(_build_torch_backend().embed_documents(texts), dtype=np.float32)
+    onnx = np.asarray(OnnxMiniLMEmbeddings(quantize=quantize).embed_documents(texts), dtype=np.float32)
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    onnx /= np.linalg.norm(onnx, axis=1, keepdims=True)
+    cos = (ref * onnx).sum(axis=1)
+    return {
+        "quantized": quantize,
+        "min_cosine": float(cos.min()),
+        "mean_cosine": float(cos.mean()),
+        "threshold": threshold,
+        "passed": bool(cos.min() >= threshold),
+    }
+
+
+def benchmark_backends(n_texts: int = 512, quantize: bool = EMBEDDING_ONNX_QUANTIZE) -> dict:
+    """Embeddings/sec for torch vs ONNX on the same corpus (one warm-up pass each)."""
+    texts = [_SAMPLE_TEXTS[i % len(_SAMPLE_TEXTS)] + f" #{i}" for i in range(n_texts)]
+    results = {}
+    for name, factory in (("torch", _build_torch_backend), ("onnx", lambda: OnnxMiniLMEmbeddings(quantize=quantize))):
+        model = factory()
+        model.embed_documents(texts[:8])  # warm-up
+        start = time.perf_counter()
+        model.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        results[name] = {"embeddings_per_sec": round(n_texts / elapsed, 1), "seconds": round(elapsed, 3)}
+    results["speedup"] = round(results["onnx"]["embeddings_per_sec"] / results["torch"]["embeddings_per_sec"], 2)
+    results["quantized"] = quantize
+    results["threads"] = _default_thread_count()
+    return results
+
+
+if __name__ == "__main__":
+    print("[Embeddings] Parity:", check_parity())
+    print("[Embeddings] Benchmark:", benchmark_backends())
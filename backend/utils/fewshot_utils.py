@@ -1,7 +1,8 @@
 # utils/fewshot_utils.py
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-import os, traceback
+import numpy as np
+import os, re, json, time, hashlib, threading, traceback
+from utils.vector_snapshots import get_reader, writer_lock, publish_snapshot
+from utils.lexical_index import tokenize
 
 # Predefined examples (you can add more later)
 FEWSHOT_EXAMPLES = [
@@ -114,31 +115,187 @@ FEWSHOT_EXAMPLES = [
 
 ]
 
-def build_fewshot_example_store():
-    """Build a persistent Chroma store of few-shot examples."""
-    persist_dir = "./chroma_examples/fewshot_examples"
-    os.makedirs(persist_dir, exist_ok=True)
-
-    embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-    store = Chroma(
-        collection_name="fewshot_examples",
-        embedding_function=embedding_model,
-        persist_directory=persist_dir
-    )
-
-    try:
-        # Only populate if empty
-        if len(store.get().get("documents", [])) == 0:
-            docs = [f"Q: {ex['input']}\nSQL: {ex['sql']}" for ex in FEWSHOT_EXAMPLES]
-            metadatas = [{"id": i} for i in range(len(docs))]
-            store.add_texts(docs, metadatas=metadatas)
-            print(f"[FewShot] ✅ Populated {len(docs)} examples into Chroma at {persist_dir}")
-        else:
-            print(f"[FewShot] ⚙️ Existing examples already found at {persist_dir}")
-
-    except Exception as e:
-        print(f"[FewShot] ❌ Error building example store: {e}")
-        traceback.print_exc()
-
-    return store
+FEWSHOT_INDEX_NAME = "fewshot"
+FEWSHOT_MAX_EXAMPLES = int(os.getenv("FEWSHOT_MAX_EXAMPLES", "500"))
+FEWSHOT_DEDUP_THRESHOLD = float(os.getenv("FEWSHOT_DEDUP_THRESHOLD", "0.95"))
+
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", str(question).strip().lower()).rstrip("?. ")
+
+
+def _static_examples_hash() -> str:
+    payload = json.dumps(FEWSHOT_EXAMPLES, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+class FewShotIndex:
+    """
+    Compact in-process few-shot selector.
+    - Vectors live in a float32 matrix (L2-normalized) memory-mapped from a shared snapshot
+    - Top-k is a single matrix-vector product + argpartition (no Chroma I/O)
+    - Grows from user-confirmed question → SQL pairs with dedup + size cap
+    - Writes publish a new snapshot version, so every worker sees learned examples
+    """
+
+    def __init__(self, embedding_model, index_name: str = FEWSHOT_INDEX_NAME, max_examples: int = FEWSHOT_MAX_EXAMPLES):
+        self.embedding_model = embedding_model
+        self.index_name = index_name
+        self.max_examples = max_examples
+        self.reader = get_reader(index_name)
+        self._hits = {}  # normalized question → hits seen by this worker since its last write
+        self._ensure_seeded()
+
+    @property
+    def examples(self) -> list:
+        snapshot = self.reader.get()
+        return snapshot.records if snapshot is not None else []
+
+    # ---------- persistence ----------
+    def _ensure_seeded(self):
+        snapshot = self.reader.get(force=True)
+        if snapshot is not None and snapshot.meta.get("static_hash") == _static_examples_hash():
+            print(f"[FewShot] ⚙️ Loaded {len(snapshot)} examples from {self.index_name}@{snapshot.version}")
+            return
+        with writer_lock(self.index_name):
+            snapshot = self.reader.get(force=True)  # another worker may have seeded meanwhile
+            if snapshot is not None and snapshot.meta.get("static_hash") == _static_examples_hash():
+                return
+            learned, learned_vecs = [], None
+            if snapshot is not None:
+                keep = [i for i, ex in enumerate(snapshot.records) if ex.get("source") != "static"]
+                learned = [snapshot.records[i] for i in keep]
+                learned_vecs = np.asarray(snapshot.vectors)[keep]
+            self._seed(learned, learned_vecs)
+
+    def _seed(self, learned: list, learned_vecs):
+        now = time.time()
+        static = [
+            {"input": ex["input"], "sql": ex["sql"], "source": "static", "db_name": None, "hits": 0, "added_at": now}
+            for ex in FEWSHOT_EXAMPLES
+        ]
+        static_vecs = self._embed([f"Q: {ex['input']}" for ex in static])
+        vecs = static_vecs if learned_vecs is None or len(learned) == 0 else np.vstack([static_vecs, learned_vecs])
+        self._publish(static + learned, vecs)
+        print(f"[FewShot] ✅ Indexed {len(static)} static + {len(learned)} learned examples into {self.index_name}")
+
+    def _publish(self, examples: list, vectors: np.ndarray):
+        publish_snapshot(self.index_name, vectors, examples, meta={"static_hash": _static_examples_hash()})
+        self.reader.get(force=True)
+
+    def _embed(self, texts: list) -> np.ndarray:
+        vecs = np.asarray(self.embedding_model.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.maximum(norms, 1e-12)
+
+    # ---------- selection ----------
+    def search(self, query_vector, k: int = 3) -> list:
+        """Vectorized cosine top-k. Returns [(score, example), ...] best first."""
+        snapshot = self.reader.get()
+        if snapshot is None:
+            return []
+        results = []
+        for score, i in snapshot.search(query_vector, k=k):
+            ex = snapshot.records[i]
+            key = _normalize_question(ex["input"])
+            self._hits[key] = self._hits.get(key, 0) + 1  # flushed on this worker's next write
+            results.append((score, ex))
+        return results
+
+    def search_lexical(self, question: str, k: int = 3) -> list:
+        """
+        Embedding-free top-k by token overlap (Jaccard) with the example questions.
+        Used when table retrieval was decided lexically and the question was never embedded.
+        """
+        snapshot = self.reader.get()
+        if snapshot is None:
+            return []
+        token_sets = getattr(snapshot, "_token_sets", None)
+        if token_sets is None:
+            token_sets = [set(tokenize(ex["input"])) for ex in snapshot.records]
+            snapshot._token_sets = token_sets  # once per published version
+        q = set(tokenize(question))
+        scored = []
+        for i, toks in enumerate(token_sets):
+            union = len(q | toks)
+            if union:
+                scored.append((len(q & toks) / union, i))
+        scored.sort(key=lambda x: -x[0])
+        results = []
+        for score, i in scored[:k]:
+            ex = snapshot.records[i]
+            key = _normalize_question(ex["input"])
+            self._hits[key] = self._hits.get(key, 0) + 1
+            results.append((score, ex))
+        return results
+
+    # ---------- learning ----------
+    def add_example(self, question: str, sql: str, db_name: str = None) -> dict:
+        """
+        Add a user-confirmed question → SQL pair.
+        - Exact (normalized) or near-duplicate questions update the existing entry
+        - When over the cap, the least-used learned example is evicted (static ones are kept)
+        """
+        question = str(question).strip()
+        sql = str(sql).strip().replace("%%", "%")  # store the unescaped form that goes into prompts
+        if not question or not sql:
+            raise ValueError("Both question and sql are required.")
+
+        vec = self._embed([f"Q: {question}"])[0]
+        with writer_lock(self.index_name):
+            snapshot = self.reader.get(force=True)  # latest version, whichever worker wrote it
+            examples = [dict(ex) for ex in snapshot.records] if snapshot is not None else []
+            vectors = np.array(snapshot.vectors, dtype=np.float32) if snapshot is not None else np.zeros((0, len(vec)), dtype=np.float32)
+            hits, self._hits = self._hits, {}
+            for ex in examples:
+                ex["hits"] = ex.get("hits", 0) + hits.get(_normalize_question(ex["input"]), 0)
+            now = time.time()
+
+            norm_q = _normalize_question(question)
+            dup_idx = next((i for i, ex in enumerate(examples) if _normalize_question(ex["input"]) == norm_q), None)
+            if dup_idx is None and len(examples):
+                scores = vectors @ vec
+                best = int(np.argmax(scores))
+                if scores[best] >= FEWSHOT_DEDUP_THRESHOLD:
+                    dup_idx = best
+
+            if dup_idx is not None:
+                if examples[dup_idx].get("source") == "static":
+                    print(f"[FewShot] ⚙️ Skipped duplicate of static example: '{question}'")
+                    return {"action": "skipped", "size": len(examples)}
+                examples[dup_idx].update({"input": question, "sql": sql, "db_name": db_name, "added_at": now})
+                vectors[dup_idx] = vec
+                self._publish(examples, vectors)
+                print(f"[FewShot] 🔁 Updated learned example: '{question}'")
+                return {"action": "updated", "size": len(examples)}
+
+            examples.append({"input": question, "sql": sql, "source": "learned", "db_name": db_name, "hits": 0, "added_at": now})
+            vectors = np.vstack([vectors, vec[None, :]])
+
+            evicted = 0
+            while len(examples) > self.max_examples:
+                learned = [i for i, ex in enumerate(examples) if ex.get("source") != "static"]
+                if not learned:
+                    break
+                victim = min(learned, key=lambda i: (examples[i].get("hits", 0), examples[i].get("added_at", 0)))
+                examples.pop(victim)
+                vectors = np.delete(vectors, victim, axis=0)
+                evicted += 1
+
+            self._publish(examples, vectors)
+            print(f"[FewShot] ✅ Learned new example (size={len(examples)}, evicted={evicted}): '{question}'")
+            return {"action": "added", "size": len(examples), "evicted": evicted}
+
+
+_fewshot_index = None
+_fewshot_index_lock = threading.Lock()
+
+
+def get_fewshot_index(embedding_model) -> FewShotIndex:
+    """Process-wide few-shot index (seeded once across workers, then reused by every request)."""
+    global _fewshot_index
+    if _fewshot_index is None:
+        with _fewshot_index_lock:
+            if _fewshot_index is None:
+                _fewshot_index = FewShotIndex(embedding_model)
+    return _fewshot_index
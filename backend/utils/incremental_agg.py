@@ -0,0 +1,201 @@
+# utils/incremental_agg.py
+"""
+Incremental maintenance of decomposable aggregate queries over the Parquet mirrors.
+
+A query qualifies when it is a single-table SELECT whose outputs are built from group keys and
+SUM / COUNT / MIN / MAX / AVG (AVG is kept as SUM + COUNT). Its per-group partial state is stored;
+on refresh only the newly appended parquet batches are aggregated and merged into that state,
+then the final projection (ORDER BY / LIMIT included) is re-applied to the merged state.
+"""
+import os
+import re
+import pandas as pd
+from utils import columnar
+
+_NON_DETERMINISTIC_RE = re.compile(r"\b(now|curdate|curtime|current_date|current_time|current_timestamp|sysdate|rand|uuid)\b", re.I)
+
+
+def _agg_classes():
+    from sqlglot import exp
+    return {exp.Sum: "sum", exp.Count: "count", exp.Min: "min", exp.Max: "max", exp.Avg: "avg"}
+
+
+def plan_decomposable(sql: str):
+    """
+    Returns (plan, reason). plan is None when the query cannot be maintained incrementally.
+    plan = {table, partial_sql, merge_sql, final_sql, key_cols, agg_cols} (DuckDB dialect).
+    """
+    try:
+        import sqlglot
+        from sqlglot import exp
+    except ImportError:
+        return None, "sqlglot not installed"
+
+    sql = sql.replace("%%", "%").strip().rstrip(";")
+    if _NON_DETERMINISTIC_RE.search(sql):
+        return None, "query depends on the current time / randomness"
+    collation = columnar.collation_dependency(sql)
+    if collation:
+        return None, collation  # same rule as the DuckDB router: the result must match MySQL's
+    try:
+        tree = sqlglot.parse_one(sql, read="mysql")
+    except Exception as e:
+        return None, f"unparseable: {e}"
+
+    if not isinstance(tree, exp.Select):
+        return None, "not a plain SELECT"
+    if tree.args.get("with") or len(list(tree.find_all(exp.Select))) > 1:
+        return None, "subqueries / CTEs are recomputed in full"
+    if tree.args.get("joins"):
+        return None, "joins are recomputed in full"
+    if tree.args.get("having") or tree.args.get("distinct") or tree.find(exp.Window):
+        return None, "HAVING / DISTINCT / window functions are recomputed in full"
+    source = tree.args.get("from") or tree.args.get("from_")  # key renamed in newer sqlglot
+    table = source.this if source is not None else None
+    if not isinstance(table, exp.Table):
+        return None, "no single source table"
+
+    aggs = _agg_classes()
+    selects = tree.expressions
+    # unaliased expressions keep the name MySQL would give them, e.g. `COUNT(amount)`
+    outputs = [(e.alias_or_name or e.sql(dialect="mysql"), e.unalias()) for e in selects]
+    by_alias = {alias.lower(): expr for alias, expr in outputs if alias}
+
+    # group keys (MySQL allows GROUP BY alias and GROUP BY position)
+    group = tree.args.get("group")
+    keys = []
+    for g in (group.expressions if group else []):
+        if isinstance(g, exp.Literal) and g.is_int and 1 <= int(g.this) <= len(outputs):
+            g = outputs[int(g.this) - 1][1]
+        elif isinstance(g, exp.Column) and not g.table and g.name.lower() in by_alias \
+                and not any(isinstance(n, tuple(aggs)) for n in by_alias[g.name.lower()].walk()):
+            g = by_alias[g.name.lower()]
+        keys.append(g)
+    key_cols = {k.sql(dialect="mysql"): f"k{i}" for i, k in enumerate(keys)}
+
+    # aggregates → partial columns
+    partials, agg_cols = {}, {}
+    for _, expr in outputs:
+        for node in expr.find_all(*aggs):
+            kind = aggs[type(node)]
+            if node.find(exp.Distinct):
+                return None, "COUNT(DISTINCT …) is not decomposable"
+            key = node.sql(dialect="mysql")
+            if key in agg_cols:
+                continue
+            i = len(agg_cols)
+            arg = node.this
+            if kind in ("sum", "avg"):
+                partials[f"a{i}_sum"] = exp.Sum(this=arg.copy())
+            if kind in ("count", "avg"):
+                partials[f"a{i}_cnt"] = exp.Count(this=arg.copy())
+            if kind in ("min", "max"):
+                partials[f"a{i}_{kind}"] = type(node)(this=arg.copy())
+            agg_cols[key] = (i, kind)
+    if not agg_cols:
+        return None, "no aggregate"
+
+    def to_state(node):
+        key = node.sql(dialect="mysql")
+        if key in key_cols:
+            return exp.column(key_cols[key])
+        if isinstance(node, tuple(aggs)) and key in agg_cols:
+            i, kind = agg_cols[key]
+            if kind == "sum":
+                return exp.column(f"a{i}_sum")
+            if kind == "count":
+                return exp.column(f"a{i}_cnt")
+            if kind in ("min", "max"):
+                return exp.column(f"a{i}_{kind}")
+            return sqlglot.parse_one(f"(a{i}_sum / NULLIF(a{i}_cnt, 0))", read="duckdb")
+        return node
+
+    state_names = set(key_cols.values()) | set(partials)
+    final_selects = []
+    for alias, expr in outputs:
+        rewritten = expr.transform(to_state)
+        if any(c.name not in state_names for c in rewritten.find_all(exp.Column)):
+            return None, f"output '{alias}' uses a column that is neither grouped nor aggregated"
+        final_selects.append(exp.alias_(rewritten, alias, quoted=True))
+
+    output_aliases = {alias.lower() for alias, _ in outputs}
+    order_sql = ""
+    order = tree.args.get("order")
+    if order:
+        parts = []
+        for o in order.expressions:
+            rewritten = o.transform(to_state)
+            if any(c.name not in state_names and c.name.lower() not in output_aliases
+                   for c in rewritten.find_all(exp.Column)):
+                return None, "ORDER BY uses a column that is neither grouped nor aggregated"
+            parts.append(rewritten.sql(dialect="duckdb"))
+        order_sql = " ORDER BY " + ", ".join(parts)
+    limit = tree.args.get("limit")
+    limit_sql = f" {limit.sql(dialect='duckdb')}" if limit else ""
+
+    where = tree.args.get("where")
+    key_select = [f"{k.sql(dialect='duckdb')} AS {name}" for k, name in zip(keys, key_cols.values())]
+    partial_select = [f"{p.sql(dialect='duckdb')} AS {name}" for name, p in partials.items()]
+    group_sql = f" GROUP BY {', '.join(k.sql(dialect='duckdb') for k in keys)}" if keys else ""
+    partial_sql = (f"SELECT {', '.join(key_select + partial_select)} FROM \"{table.name}\""
+                   f"{' ' + where.sql(dialect='duckdb') if where else ''}{group_sql}")
+
+    merge_aggs = []
+    for name in partials:
+        if name.endswith("_cnt"):
+            merge_aggs.append(f"CAST(SUM({name}) AS BIGINT) AS {name}")
+        else:
+            fn = "MIN" if name.endswith("_min") else "MAX" if name.endswith("_max") else "SUM"
+            merge_aggs.append(f"{fn}({name}) AS {name}")
+    merge_group = f" GROUP BY {', '.join(key_cols.values())}" if key_cols else ""
+    merge_sql = f"SELECT {', '.join(list(key_cols.values()) + merge_aggs)} FROM combined{merge_group}"
+
+    final_sql = f"SELECT {', '.join(s.sql(dialect='duckdb') for s in final_selects)} FROM state{order_sql}{limit_sql}"
+    return {
+        "table": table.name,
+        "partial_sql": partial_sql,
+        "merge_sql": merge_sql,
+        "final_sql": final_sql,
+        "key_cols": list(key_cols.values()),
+        "agg_cols": list(partials),
+    }, "decomposable aggregate"
+
+
+def _source_view(con, db_name: str, table: str, files: list):
+    manifest = columnar.read_manifest(db_name, table) or {}
+    base = columnar.table_dir(db_name, table)
+    paths = ", ".join("'" + os.path.join(base, f).replace("'", "''") + "'" for f in files)
+    select = f"SELECT * EXCLUDE ({columnar.DATE_PARTITION_COL})" if manifest.get("partition_kind") == "date" else "SELECT *"
+    con.execute(f"CREATE VIEW \"{table}\" AS {select} FROM read_parquet([{paths}], hive_partitioning = true, union_by_name = true)")
+
+
+def compute_partial(plan: dict, db_name: str, batches: list) -> pd.DataFrame:
+    """Aggregate only the given manifest batches into partial state rows."""
+    files = [f for b in batches for f in b["files"]]
+    if not files:
+        return None
+    con = columnar.duckdb_connect()
+    try:
+        _source_view(con, db_name, plan["table"], files)
+        return con.execute(plan["partial_sql"]).df()
+    finally:
+        con.close()
+
+
+def merge_and_finalize(plan: dict, old_state: pd.DataFrame, new_partial: pd.DataFrame):
+    """Merge new partial rows into the stored state → (state, final result)."""
+    con = columnar.duckdb_connect()
+    try:
+        frames = [f for f in (old_state, new_partial) if f is not None]
+        con.register("combined_0", frames[0])
+        union = "SELECT * FROM combined_0"
+        if len(frames) > 1:
+            con.register("combined_1", frames[1])
+            union += " UNION ALL BY NAME SELECT * FROM combined_1"
+        con.execute(f"CREATE VIEW combined AS {union}")
+        state = con.execute(plan["merge_sql"]).df()
+        con.register("state", state)
+        result = con.execute(plan["final_sql"]).df()
+        return state, result
+    finally:
+        con.close()
@@ -0,0 +1,116 @@
+# utils/lexical_index.py
+"""
+In-memory BM25 over table names, column names and their sanitized sub-tokens.
+Built from the schema snapshot (so it always matches the published catalog version) and
+fused with vector scores; a decisive literal match lets nl2sql skip the embedding entirely.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TABLE_NAME_WEIGHT = 3          # table-name tokens count this many times in the table's doc
+RRF_K = 60                     # reciprocal-rank-fusion constant
+DECISIVE_MARGIN = float(os.getenv("LEXICAL_DECISIVE_MARGIN", "2.0"))
+
+
+def _stem(tok: str) -> str:
+    if len(tok) > 4 and tok.endswith("ies"):
+        return tok[:-3] + "y"
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+        return tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> list:
+    """Identifiers stay whole (pct_discount) and are also split into parts (pct, discount)."""
+    out = []
+    for ident in re.findall(r"[a-z0-9_]+", str(text).lower()):
+        ident = ident.strip("_")
+        if not ident:
+            continue
+        out.append(_stem(ident))
+        parts = [p for p in ident.split("_") if p]
+        if len(parts) > 1:
+            out.extend(_stem(p) for p in parts)
+    return out
+
+
+class LexicalIndex:
+    def __init__(self, table_records: dict):
+        self.tables = list(table_records)
+        self.table_idents = {t: _stem(t.lower()) for t in self.tables}
+        self.column_owners = {}
+        docs = []
+        for t, rec in table_records.items():
+            tokens = tokenize(t) * TABLE_NAME_WEIGHT
+            for c in rec["columns"]:
+                tokens += tokenize(c)
+                self.column_owners.setdefault(_stem(c.lower()), set()).add(t)
+            docs.append(Counter(tokens))
+        self.docs = docs
+        self.doc_len = [sum(d.values()) for d in docs]
+        self.avg_len = (sum(self.doc_len) / len(docs)) if docs else 0.0
+        df = Counter()
+        for d in docs:
+            df.update(d.keys())
+        n = len(docs)
+        self.idf = {tok: math.log(1 + (n - f + 0.5) / (f + 0.5)) for tok, f in df.items()}
+
+    def score(self, question: str) -> dict:
+        """BM25 score per table (only tables with a non-zero score)."""
+        q = tokenize(question)
+        scores = {}
+        for i, doc in enumerate(self.docs):
+            s = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[i] / (self.avg_len or 1))
+            for tok in q:
+                tf = doc.get(tok)
+                if tf:
+                    s += self.idf[tok] * tf * (BM25_K1 + 1) / (tf + norm)
+            if s > 0:
+                scores[self.tables[i]] = s
+        return scores
+
+    def literal_matches(self, question: str) -> set:
+        """Tables named in the question, or owning a column named in it that no other table has."""
+        idents = set(tokenize(question))
+        matched = {t for t, ident in self.table_idents.items() if ident in idents}
+        for col, owners in self.column_owners.items():
+            if col in idents and len(owners) == 1:
+                matched |= owners
+        return matched
+
+    def decisive_tables(self, question: str, scores: dict, k: int):
+        """
+        Returns the table list when the lexical evidence is decisive, else None:
+        1..k literal matches and every other table scoring below matched_min / DECISIVE_MARGIN.
+        """
+        matched = self.literal_matches(question)
+        if not matched or len(matched) > k:
+            return None
+        matched_min = min(scores.get(t, 0.0) for t in matched)
+        others_max = max((s for t, s in scores.items() if t not in matched), default=0.0)
+        if matched_min <= 0 or others_max * DECISIVE_MARGIN > matched_min:
+            return None
+        return sorted(matched, key=lambda t: -scores.get(t, 0.0))
+
+
+def rrf_fuse(*rankings: list, k: int = RRF_K) -> list:
+    """Reciprocal rank fusion of several best-first table lists → fused best-first list."""
+    fused = Counter()
+    for ranking in rankings:
+        for rank, table in enumerate(ranking):
+            fused[table] += 1.0 / (k + rank + 1)
+    return [t for t, _ in fused.most_common()]
+
+
+def get_lexical_index(snapshot, table_records: dict) -> LexicalIndex:
+    """One BM25 index per published schema version (rebuilt only when the catalog changes)."""
+    idx = getattr(snapshot, "_lexical_index", None)
+    if idx is None:
+        idx = LexicalIndex(table_records)
+        snapshot._lexical_index = idx
+    return idx
@@ -0,0 +1,239 @@
+# utils/llm_gateway.py
+"""
+Shared LLM gateway used by every service instead of calling the chat model directly:
+- Single-flight: identical prompts already in flight share one backend call
+- Concurrency: weighted-fair "llm" scheduler (global budget, per-database cap, 429 shedding)
+- Jittered exponential retry on rate-limit / transient errors (429, 503, deadline)
+- Per-call token and latency accounting (by purpose), exposed at /api/debug/llm
+- Pluggable backend (LLM_BACKEND=gemini | stub); the stub needs no network or API key
+"""
+import os, time, random, hashlib, threading
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from utils.scheduler import FairScheduler, Overloaded, register_scheduler
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_PER_DB_CONCURRENCY = int(os.getenv("LLM_PER_DB_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))   # seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8.0"))
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "50"))
+
+_RETRYABLE_MARKERS = ("429", "resource_exhausted", "rate limit", "quota", "503", "unavailable",
+                      "deadline", "timed out", "timeout", "500 internal", "502", "504")
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+    attempts: int = 1
+    coalesced: bool = False
+    queue_ms: float = 0.0
+
+    @property
+    def usage(self) -> dict:
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                "latency_ms": self.latency_ms, "attempts": self.attempts, "coalesced": self.coalesced,
+                "queue_ms": self.queue_ms}
+
+
+# --- backends ---
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, model: str = LLM_MODEL):
+        self.model = model
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        # retries are owned by the gateway (jittered, semaphore released while backing off)
+        self.chat = ChatGoogleGenerativeAI(model=model, temperature=0, max_retries=1,
+                                           google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+    def invoke(self, prompt: str) -> LLMResponse:
+        msg = self.chat.invoke(prompt)
+        usage = getattr(msg, "usage_metadata", None) or {}
+        return LLMResponse(content=msg.content, prompt_tokens=int(usage.get("input_tokens") or 0),
+                           completion_tokens=int(usage.get("output_tokens") or 0))
+
+
+class StubBackend:
+    """Local stand-in for tests and benchmarks: fixed latency, deterministic answer."""
+    name = "stub"
+
+    def __init__(self, responder=None, latency_ms: float = LLM_STUB_LATENCY_MS):
+        self.responder = responder or (lambda prompt: "SELECT 1;")
+        self.latency_ms = latency_ms
+
+    def invoke(self, prompt: str) -> LLMResponse:
+        time.sleep(self.latency_ms / 1000.0)
+        content = self.responder(prompt)
+        return LLMResponse(content=content, prompt_tokens=max(1, len(prompt) // 4),
+                           completion_tokens=max(1, len(content) // 4))
+
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, Overloaded):
+        return False  # shed by our own scheduler: the client gets the 429, retrying here would just queue again
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(code, int) and (code == 429 or code >= 500):
+        return True
+    text_ = f"{type(e).__name__} {e}".lower()
+    return any(m in text_ for m in _RETRYABLE_MARKERS)
+
+
+def _estimate_tokens(text_: str) -> int:
+    from utils.schema_index import count_tokens  # lazy: keeps the stub usable without the DB stack
+    return count_tokens(text_)
+
+
+# --- gateway ---
+class LLMGateway:
+    def __init__(self, backend=None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 per_db_concurrency: int = LLM_PER_DB_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES):
+        self.backend = backend if backend is not None else BACKENDS[LLM_BACKEND]()
+        self.max_retries = max_retries
+        self.per_db_concurrency = per_db_concurrency
+        self.scheduler = FairScheduler("llm", max_concurrency, per_db_concurrency)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "backend_calls": 0, "coalesced": 0, "retries": 0, "errors": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0, "latency_ms_total": 0.0, "by_purpose": {}}
+
+    def _record(self, purpose: str, resp: LLMResponse = None, error: bool = False):
+        with self._lock:
+            s = self._stats
+            p = s["by_purpose"].setdefault(purpose, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                     "latency_ms_total": 0.0, "errors": 0})
+            s["calls"] += 1
+            p["calls"] += 1
+            if error:
+                s["errors"] += 1
+                p["errors"] += 1
+                return
+            if resp.coalesced:
+                s["coalesced"] += 1
+                return  # tokens and latency were paid (and counted) by the leader
+            s["backend_calls"] += resp.attempts
+            s["retries"] += resp.attempts - 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                s[key] += getattr(resp, key)
+                p[key] += getattr(resp, key)
+            s["latency_ms_total"] += resp.latency_ms
+            p["latency_ms_total"] += resp.latency_ms
+
+    def _call_backend(self, prompt: str, db_name: str) -> LLMResponse:
+        start = time.perf_counter()
+        attempt, queue_ms = 0, 0.0
+        while True:
+            attempt += 1
+            try:
+                with self.scheduler.slot(db_name) as ticket:  # fair share per database, global budget
+                    queue_ms += ticket.queue_ms
+                    resp = self.backend.invoke(prompt)
+                break
+            except Exception as e:
+                if attempt > self.max_retries or not _is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+                print(f"[LLM] ⚠️ {type(e).__name__} on attempt {attempt}, retrying in {delay:.2f}s: {str(e)[:200]}")
+            time.sleep(delay)  # backing off outside the slot so others can proceed
+
+        resp.attempts = attempt
+        resp.queue_ms = round(queue_ms, 1)
+        resp.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        if not resp.prompt_tokens:
+            resp.prompt_tokens = _estimate_tokens(prompt)
+        if not resp.completion_tokens:
+            resp.completion_tokens = _estimate_tokens(resp.content or "")
+        return resp
+
+    def invoke(self, prompt: str, db_name: str = None, purpose: str = "default") -> LLMResponse:
+        """
+        Returns an LLMResponse (`.content` like a chat message, plus `.usage`).
+        Concurrent identical prompts are coalesced onto one backend call.
+        """
+        key = hashlib.sha256(f"{getattr(self.backend, 'name', '')}\0{prompt}".encode("utf-8")).hexdigest()
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            try:
+                resp = replace(future.result(), coalesced=True)
+            except Exception:
+                self._record(purpose, error=True)
+                raise
+            self._record(purpose, resp)
+            return resp
+
+        try:
+            resp = self._call_backend(prompt, db_name)
+            future.set_result(resp)
+        except Exception as e:
+            future.set_exception(e)
+            self._record(purpose, error=True)
+            print(f"[LLM] ❌ {purpose} call failed: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        self._record(purpose, resp)
+        print(f"[LLM] ✅ {purpose} db={db_name} {resp.latency_ms} ms, tokens={resp.prompt_tokens}+{resp.completion_tokens}, attempts={resp.attempts}")
+        return resp
+
+    @property
+    def backend_name(self) -> str:
+        """Backend + model, e.g. "gemini:gemini-2.5-flash" or "stub": what produced an answer."""
+        name = getattr(self.backend, "name", type(self.backend).__name__)
+        model = getattr(self.backend, "model", None)
+        return f"{name}:{model}" if model else name
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = {k: v for k, v in self._stats.items() if k != "by_purpose"}
+            s["by_purpose"] = {k: dict(v) for k, v in self._stats["by_purpose"].items()}
+            s["inflight"] = len(self._inflight)
+        s["backend"] = self.backend_name
+        s["scheduler"] = self.scheduler.stats()
+        s["avg_latency_ms"] = round(s["latency_ms_total"] / s["backend_calls"], 1) if s["backend_calls"] else None
+        return s
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Process-wide gateway (limits and single-flight only work if every caller shares it)."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+                register_scheduler(_gateway.scheduler)
+    return _gateway
+
+
+def benchmark_gateway(n_requests: int = 64, distinct_prompts: int = 8, threads: int = 32, latency_ms: float = 50) -> dict:
+    """Burst of n_requests over a few distinct prompts against the stub: shows coalescing + limits."""
+    from concurrent.futures import ThreadPoolExecutor
+    gw = LLMGateway(backend=StubBackend(latency_ms=latency_ms))
+    prompts = [f"benchmark prompt {i % distinct_prompts}" for i in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda p: gw.invoke(p, db_name="bench", purpose="benchmark"), prompts))
+    elapsed = time.perf_counter() - start
+    return {"requests": n_requests, "elapsed_s": round(elapsed, 3), **gw.stats()}
+
+
+if __name__ == "__main__":
+    print(benchmark_gateway())
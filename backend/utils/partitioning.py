@@ -0,0 +1,249 @@
+# utils/partitioning.py
+"""
+MySQL RANGE partitioning of large temporal tables (one partition per year).
+- Uses the same year/date detection as the Parquet mirror (columnar.detect_year_column)
+- Integer year columns → RANGE (col); DATE/DATETIME columns → RANGE (YEAR(col))
+- Appends split the MAXVALUE (or lowest) partition when a new year shows up
+- Recent generated queries are kept so /api/debug/partitions can show EXPLAIN pruning
+"""
+import os, json, time
+import pandas as pd
+from sqlalchemy import text, inspect
+from utils.columnar import detect_year_column
+
+PARTITION_MIN_ROWS = int(os.getenv("PARTITION_MIN_ROWS", "100000"))
+RECENT_QUERIES_PATH = os.getenv("RECENT_QUERIES_PATH", "./governor/recent_queries.jsonl")
+RECENT_QUERIES_KEEP = 200
+FUTURE_PARTITION = "p_future"
+
+
+_INTEGER_TYPES = {"tinyint", "smallint", "mediumint", "int", "bigint", "year"}
+_DATE_TYPES = {"date", "datetime"}  # YEAR() of a TIMESTAMP is not allowed as a partitioning function
+
+
+def _partition_expr(conn, db_name: str, table: str, df: pd.DataFrame):
+    """
+    (column, SQL expression) to partition on, or (None, reason). The column is found in the
+    upload, but its type is the MySQL column's: an earlier upload may have made it a FLOAT.
+    """
+    col, kind = detect_year_column(df)
+    if col is None:
+        return None, "no year/date column"
+    data_type = conn.execute(text(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :t AND COLUMN_NAME = :c"
+    ), {"db": db_name, "t": table, "c": col}).scalar()
+    data_type = (data_type or "").lower()
+    if kind == "year":
+        if data_type not in _INTEGER_TYPES:
+            return None, f"year column '{col}' is stored as {data_type or 'unknown'}, not as an integer"
+        return col, f"`{col}`"
+    if data_type not in _DATE_TYPES:
+        return None, f"date column '{col}' is stored as {data_type or 'unknown'}, not as DATE/DATETIME"
+    return col, f"YEAR(`{col}`)"
+
+
+def _years(df: pd.DataFrame, col: str) -> list:
+    s = df[col]
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.year
+    return sorted({int(y) for y in s.dropna().unique()})
+
+
+def _span(years) -> list:
+    """Contiguous years, so every partition p{y} holds exactly year y."""
+    return list(range(min(years), max(years) + 1)) if years else []
+
+
+def _partition_clause(years: list) -> str:
+    parts = [f"PARTITION p{y} VALUES LESS THAN ({y + 1})" for y in _span(years)]
+    parts.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return ",\n    ".join(parts)
+
+
+def existing_partitions(conn, db_name: str, table: str) -> list:
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, PARTITION_EXPRESSION, TABLE_ROWS "
+        "FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :t "
+        "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"db": db_name, "t": table}).fetchall()
+    return [{"name": r[0], "less_than": r[1], "expression": r[2], "rows": r[3]} for r in rows]
+
+
+def _expression_column(expr: str) -> str:
+    return expr.replace("year(", "").replace("YEAR(", "").strip("`() ")
+
+
+def partition_column(conn, table: str):
+    """Column a RANGE-partitioned table is partitioned on (None when it is not partitioned)."""
+    db_name = conn.execute(text("SELECT DATABASE()")).scalar()
+    parts = existing_partitions(conn, db_name, table)
+    return _expression_column(parts[0]["expression"]) if parts else None
+
+
+def _unique_keys_block(conn, table: str, col: str):
+    """MySQL requires every unique key to contain the partitioning column."""
+    insp = inspect(conn)
+    keys = [insp.get_pk_constraint(table).get("constrained_columns") or []]
+    keys += [idx["column_names"] for idx in insp.get_indexes(table) if idx.get("unique")]
+    bad = [k for k in keys if k and col not in k]
+    return f"unique key {bad[0]} does not include '{col}'" if bad else None
+
+
+def partition_new_table(conn, db_name: str, table: str, df: pd.DataFrame) -> dict:
+    """
+    Partition a freshly created (ideally still empty) table when the upload is large enough.
+    Partitioning is an optimization: a failure is reported, never raised, so the rows still land.
+    """
+    try:
+        return _partition_new_table(conn, db_name, table, df)
+    except Exception as e:
+        print(f"[Partitioning] ⚠️ {db_name}.{table} left unpartitioned: {e}")
+        return {"partitioned": False, "reason": str(e)}
+
+
+def _partition_new_table(conn, db_name: str, table: str, df: pd.DataFrame) -> dict:
+    if len(df) < PARTITION_MIN_ROWS:
+        return {"partitioned": False, "reason": f"{len(df)} rows < PARTITION_MIN_ROWS={PARTITION_MIN_ROWS}"}
+    col, expr = _partition_expr(conn, db_name, table, df)
+    if col is None:
+        return {"partitioned": False, "reason": expr}
+    blocked = _unique_keys_block(conn, table, col)
+    if blocked:
+        return {"partitioned": False, "reason": blocked}
+    years = _span(_years(df, col))
+    conn.execute(text(f"ALTER TABLE `{table}` PARTITION BY RANGE ({expr}) (\n    {_partition_clause(years)}\n)"))
+    print(f"[Partitioning] ✅ {db_name}.{table} partitioned by {expr} into {len(years) + 1} partitions")
+    return {"partitioned": True, "column": col, "expression": expr, "partitions": len(years) + 1}
+
+
+def maintain_partitions(conn, db_name: str, table: str, df: pd.DataFrame, total_rows: int = None) -> dict:
+    """
+    Before appending `df`: add partitions for years not covered yet (split p_future / the lowest
+    partition). An unpartitioned table that has grown past the threshold is partitioned now.
+    A failure is reported, never raised: rows of uncovered years still land in p_future.
+    """
+    try:
+        return _maintain_partitions(conn, db_name, table, df, total_rows)
+    except Exception as e:
+        print(f"[Partitioning] ⚠️ {db_name}.{table}: partition maintenance skipped: {e}")
+        return {"partitioned": False, "reason": str(e)}
+
+
+def _maintain_partitions(conn, db_name: str, table: str, df: pd.DataFrame, total_rows: int = None) -> dict:
+    parts = existing_partitions(conn, db_name, table)
+    if not parts:
+        if total_rows is not None and total_rows + len(df) >= PARTITION_MIN_ROWS:
+            col, expr = _partition_expr(conn, db_name, table, df)
+            if col is None:
+                return {"partitioned": False, "reason": expr}
+            blocked = _unique_keys_block(conn, table, col)
+            if blocked:
+                return {"partitioned": False, "reason": blocked}
+            existing_years = [int(r[0]) for r in conn.execute(text(
+                f"SELECT DISTINCT {expr} FROM `{table}` WHERE `{col}` IS NOT NULL")).fetchall()]
+            years = _span(set(existing_years) | set(_years(df, col)))
+            conn.execute(text(f"ALTER TABLE `{table}` PARTITION BY RANGE ({expr}) (\n    {_partition_clause(years)}\n)"))
+            print(f"[Partitioning] ✅ {db_name}.{table} grew past {PARTITION_MIN_ROWS} rows → partitioned by {expr}")
+            return {"partitioned": True, "column": col, "expression": expr, "partitions": len(years) + 1, "action": "created"}
+        return {"partitioned": False, "reason": "table is not partitioned"}
+
+    col = _expression_column(parts[0]["expression"])
+    if col not in df.columns:
+        return {"partitioned": True, "action": "none", "reason": f"partition column '{col}' not in upload"}
+    bounds = [int(p["less_than"]) for p in parts if p["less_than"] not in (None, "MAXVALUE")]
+    new_years = [y for y in _years(df, col) if f"p{y}" not in {p["name"] for p in parts}]
+    added = []
+
+    high = [y for y in new_years if not bounds or y >= max(bounds)]
+    if high and parts[-1]["less_than"] == "MAXVALUE":
+        high = _span(high + ([max(bounds)] if bounds else []))
+        conn.execute(text(
+            f"ALTER TABLE `{table}` REORGANIZE PARTITION {parts[-1]['name']} INTO (\n    {_partition_clause(high)}\n)"
+        ))
+        added += high
+
+    low = [y for y in new_years if bounds and y < min(bounds) - 1]
+    if low:
+        low = list(range(min(low), min(bounds) - 1))
+        first = parts[0]
+        clause = ",\n    ".join([f"PARTITION p{y} VALUES LESS THAN ({y + 1})" for y in low] +
+                               [f"PARTITION {first['name']} VALUES LESS THAN ({first['less_than']})"])
+        conn.execute(text(f"ALTER TABLE `{table}` REORGANIZE PARTITION {first['name']} INTO (\n    {clause}\n)"))
+        added += low
+
+    if added:
+        print(f"[Partitioning] ➕ {db_name}.{table}: added partitions for {sorted(added)}")
+    return {"partitioned": True, "action": "extended" if added else "none", "added_years": sorted(added)}
+
+
+# --- recent generated queries + EXPLAIN pruning report ---
+def record_generated_query(db_name: str, sql: str):
+    """Append-only log shared by workers (one JSON line per generated query)."""
+    try:
+        os.makedirs(os.path.dirname(RECENT_QUERIES_PATH) or ".", exist_ok=True)
+        with open(RECENT_QUERIES_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"db_name": db_name, "sql": sql, "at": time.time()}) + "\n")
+        if os.path.getsize(RECENT_QUERIES_PATH) > 1_000_000:
+            _trim_recent()
+    except OSError as e:
+        print(f"[Partitioning] ⚠️ Could not record generated query: {e}")
+
+
+def _trim_recent():
+    with open(RECENT_QUERIES_PATH, "r", encoding="utf-8") as f:
+        lines = f.readlines()[-RECENT_QUERIES_KEEP:]
+    tmp = RECENT_QUERIES_PATH + f".tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp, RECENT_QUERIES_PATH)
+
+
+def recent_queries(db_name: str, limit: int = 20) -> list:
+    try:
+        with open(RECENT_QUERIES_PATH, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    out = []
+    for line in reversed(lines):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if rec.get("db_name") == db_name:
+            out.append(rec)
+            if len(out) >= limit:
+                break
+    return out
+
+
+def explain_partitions(engine, db_name: str, limit: int = 20) -> dict:
+    """EXPLAIN each recent generated query: partitions read vs. total, per partitioned table."""
+    with engine.connect() as conn:
+        tables = {}
+        for r in conn.execute(text(
+            "SELECT TABLE_NAME, COUNT(*), MAX(PARTITION_EXPRESSION) FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = :db AND PARTITION_NAME IS NOT NULL GROUP BY TABLE_NAME"
+        ), {"db": db_name}).fetchall():
+            tables[r[0]] = {"partitions": int(r[1]), "expression": r[2]}
+
+        queries = []
+        for rec in recent_queries(db_name, limit):
+            entry = {"sql": rec["sql"], "at": rec["at"]}
+            try:
+                plan = pd.read_sql("EXPLAIN " + rec["sql"].strip().rstrip(";"), conn)
+                plan.columns = [str(c).lower() for c in plan.columns]
+                steps = []
+                for row in plan.to_dict(orient="records"):
+                    table, used = row.get("table"), row.get("partitions")
+                    step = {"table": table, "type": row.get("type"), "rows": row.get("rows"), "partitions": used}
+                    if table in tables:
+                        read = len(str(used).split(",")) if used else tables[table]["partitions"]
+                        step["pruning"] = f"{read}/{tables[table]['partitions']}"
+                        step["pruned"] = read < tables[table]["partitions"]
+                    steps.append(step)
+                entry["plan"] = steps
+            except Exception as e:
+                entry["error"] = str(e)
+            queries.append(entry)
+    return {"partitioned_tables": tables, "queries": queries}
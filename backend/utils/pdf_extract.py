@@ -0,0 +1,277 @@
+# utils/pdf_extract.py
+"""
+PDF ingestion: page-parallel extraction of tables and timeline text.
+
+- Pages are split into small ranges and parsed with pdfplumber on a process pool
+  (parsing is pure-Python and CPU bound, so processes — not threads — scale with cores)
+- Results are consumed in page order as they complete and streamed, row by row, into
+  per-table CSV buffers that are then parsed by pandas exactly like an uploaded CSV
+- Pages without ruled tables are scanned for timeline lines ("2008 — …", "Mar 2012: …");
+  wrapped lines and entries spanning a page break are joined to their entry
+- Extracted column sets are matched to the existing tables of the target DB with one
+  batched embedding call against the schema snapshot's column vectors
+"""
+import os, io, re, csv, time, threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or (os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+PDF_COLUMN_MATCH_THRESHOLD = float(os.getenv("PDF_COLUMN_MATCH_THRESHOLD", "0.75"))
+
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_TIMELINE_RE = re.compile(
+    r"^\s*(?P<when>(?:\d{4}-\d{1,2}-\d{1,2})|(?:\d{1,2}[/.-]\d{1,2}[/.-](?:19|20)\d{2})|"
+    rf"(?:{_MONTH}\s+(?:\d{{1,2}},?\s+)?(?:19|20)\d{{2}})|(?:Q[1-4]\s+(?:19|20)\d{{2}})|(?:(?:19|20)\d{{2}}))"
+    r"\s*(?:[:|–—-]|\s-\s)\s*(?P<event>\S.*)$",
+    re.I,
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    """'spawn' keeps children free of the server's threads and sockets."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    One shared pool of PDF_WORKERS processes per worker process, created once and never replaced:
+    concurrent uploads submit to it side by side (a smaller file just uses fewer of its processes).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(PDF_WORKERS)
+        return _pool
+
+
+# --- worker side (runs in the pool; must stay importable without the rest of the backend) ---
+def _clean_cell(v):
+    if v is None:
+        return ""
+    return re.sub(r"\s+", " ", str(v)).strip()
+
+
+def _timeline(text_: str) -> dict:
+    """{'lead': [lines before the first entry], 'entries': [[when, event], ...]}"""
+    lead, entries = [], []
+    for line in (text_ or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = _TIMELINE_RE.match(line)
+        if m:
+            entries.append([m.group("when").strip(), m.group("event").strip()])
+        elif entries:
+            entries[-1][1] += " " + line
+        else:
+            lead.append(line)
+    return {"lead": lead, "entries": entries}
+
+
+def _extract_page_range(path: str, page_numbers: list) -> list:
+    import pdfplumber
+    out = []
+    with pdfplumber.open(path) as pdf:
+        for n in page_numbers:
+            page = pdf.pages[n]
+            tables = [[[_clean_cell(c) for c in row] for row in t if any(row)] for t in page.extract_tables()]
+            tables = [t for t in tables if len(t) >= 1 and len(t[0]) >= 2]
+            out.append({
+                "page": n,
+                "tables": tables,
+                "timeline": None if tables else _timeline(page.extract_text()),
+            })
+            page.flush_cache()
+    return out
+
+
+# --- parent side ---
+def page_count(path: str) -> int:
+    try:
+        import pdfplumber
+    except ImportError:
+        raise ValueError("PDF ingestion needs pdfplumber (pip install pdfplumber).")
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pages(path: str, workers: int = None, pages_per_task: int = PDF_PAGES_PER_TASK, pool=None):
+    """
+    Yields per-page extraction results in page order while later ranges are still being parsed.
+    Runs on the shared pool unless `pool` (sized `workers`) is given, e.g. by the benchmark.
+    """
+    total = page_count(path)
+    workers = max(1, min(workers or PDF_WORKERS, -(-total // pages_per_task)))
+    ranges = [list(range(i, min(i + pages_per_task, total))) for i in range(0, total, pages_per_task)]
+    if workers == 1:
+        for r in ranges:
+            yield from _extract_page_range(path, r)
+        return
+    pool = pool or _get_pool()
+    futures = [pool.submit(_extract_page_range, path, r) for r in ranges]
+    for f in futures:  # in order; the pool keeps working ahead on the remaining ranges
+        yield from f.result()
+
+
+def _looks_like_header(row: list) -> bool:
+    return all(c and not re.fullmatch(r"[-+]?[\d.,%$€£ ]+", c) for c in row)
+
+
+class _TableSink:
+    """Streams the rows of one logical table (same header, possibly across pages) into a CSV buffer."""
+
+    def __init__(self, header: list, source: str):
+        self.header, self.source = header, source
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow(header)
+        self.rows, self.pages = 0, set()
+
+    def write(self, row: list, page: int):
+        row = (row + [""] * len(self.header))[:len(self.header)]
+        self.writer.writerow(row)
+        self.rows += 1
+        self.pages.add(page + 1)
+
+    def frame(self) -> pd.DataFrame:
+        self.buffer.seek(0)
+        return pd.read_csv(self.buffer)  # same parsing / type inference as an uploaded CSV
+
+
+def extract_pdf(path: str, workers: int = None, pool=None) -> dict:
+    """
+    Returns {"tables": [{"header", "source", "pages", "frame"}], "stats": {...pages/sec...}}.
+    Consecutive tables with the same header (or header-less continuations of the previous
+    table's width) are merged; timeline text becomes a (year|date, event) table.
+    """
+    start = time.perf_counter()
+    workers = workers or PDF_WORKERS
+    if pool is None:
+        workers = min(workers, PDF_WORKERS)  # the shared pool has PDF_WORKERS processes
+    sinks, by_header, last = [], {}, None
+    tl_sink, tl_pending = None, None  # last timeline entry stays pending: it may continue on the next page
+    pages = 0
+    for page in iter_pages(path, workers, pool=pool):
+        pages += 1
+        for table in page["tables"]:
+            first = table[0]
+            if _looks_like_header(first):
+                key = tuple(c.lower() for c in first)
+                sink = by_header.get(key)
+                if sink is None:
+                    sink = by_header[key] = _TableSink(first, "table")
+                    sinks.append(sink)
+                body = table[1:]
+            elif last is not None and len(first) == len(last.header):
+                sink, body = last, table  # header-less continuation on the next page
+            else:
+                sink = _TableSink([f"col_{i + 1}" for i in range(len(first))], "table")
+                sinks.append(sink)
+                body = table
+            for row in body:
+                sink.write(row, page["page"])
+            last = sink
+        tl = page["timeline"]
+        if tl:
+            if tl_pending and tl["lead"]:
+                tl_pending[1] += " " + " ".join(tl["lead"])
+            for when, event in tl["entries"]:
+                if tl_sink is None:
+                    name = "year" if re.fullmatch(r"(19|20)\d{2}", when) else "date"
+                    tl_sink = _TableSink([name, "event"], "timeline")
+                    sinks.append(tl_sink)
+                if tl_pending:
+                    tl_sink.write(tl_pending[:2], tl_pending[2])
+                tl_pending = [when, event, page["page"]]
+    if tl_pending:
+        tl_sink.write(tl_pending[:2], tl_pending[2])
+
+    elapsed = time.perf_counter() - start
+    tables = [{"header": s.header, "source": s.source, "pages": sorted(s.pages), "frame": s.frame()}
+              for s in sinks if s.rows]
+    stats = {
+        "pages": pages,
+        "workers": min(workers, max(1, -(-pages // PDF_PAGES_PER_TASK))),
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else None,
+        "tables_found": len(tables),
+    }
+    print(f"[PDF] ✅ {os.path.basename(path)}: {pages} pages, {len(tables)} table(s) "
+          f"in {stats['elapsed_s']}s ({stats['pages_per_sec']} pages/s, {stats['workers']} workers)")
+    return {"tables": tables, "stats": stats}
+
+
+def map_columns_to_tables(snapshot, frames: list, embedding_model, threshold: float = PDF_COLUMN_MATCH_THRESHOLD) -> list:
+    """
+    For each extracted DataFrame: the best existing table and a column rename map.
+    All extracted columns of all frames are embedded in ONE batch and compared with the
+    snapshot's column vectors. A table is chosen when the per-column match scores average
+    ≥ threshold (columns left unmatched score 0), otherwise the frame becomes a new table.
+    Returns [{"table": str | None, "score": float, "rename": {src: dst}}] aligned with `frames`.
+    """
+    empty = [{"table": None, "score": 0.0, "rename": {}} for _ in frames]
+    if snapshot is None or not len(snapshot) or not frames:
+        return empty
+    col_rows = [i for i, r in enumerate(snapshot.records) if r.get("kind") == "column"]
+    if not col_rows:
+        return empty
+
+    docs, owners = [], []
+    for fi, df in enumerate(frames):
+        for col in df.columns:
+            samples = [str(v)[:40] for v in df[col].dropna().astype(str).unique()[:3]]
+            docs.append(f"Column: {col}" + (f" e.g. {', '.join(samples)}" if samples else ""))
+            owners.append((fi, col))
+    vecs = np.asarray(embedding_model.embed_documents(docs), dtype=np.float32)
+    vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+    sims = vecs @ np.asarray(snapshot.vectors)[col_rows].T      # (extracted cols, existing cols)
+    targets = [(snapshot.records[i]["table"], snapshot.records[i]["column"]) for i in col_rows]
+    tables = sorted({t for t, _ in targets})
+
+    results = []
+    for fi, df in enumerate(frames):
+        rows = [j for j, (owner, _) in enumerate(owners) if owner == fi]
+        best = {"table": None, "score": 0.0, "rename": {}}
+        for table in tables:
+            cand = [k for k, (t, _) in enumerate(targets) if t == table]
+            # greedy one-to-one assignment, exact name matches first
+            pairs = sorted(((1.0 if owners[j][1] == targets[k][1] else float(sims[j, k]), j, k)
+                            for j in rows for k in cand), reverse=True)
+            used_src, used_dst, rename, scores = set(), set(), {}, []
+            for s, j, k in pairs:
+                if s < threshold or j in used_src or k in used_dst:
+                    continue
+                used_src.add(j), used_dst.add(k)
+                rename[owners[j][1]] = targets[k][1]
+                scores.append(s)
+            score = sum(scores) / len(rows) if rows else 0.0  # unmatched columns count as 0
+            if score > best["score"]:
+                best = {"table": table, "score": round(score, 3), "rename": rename}
+        if best["score"] < threshold:
+            best = {"table": None, "score": best["score"], "rename": {}}
+        results.append(best)
+    return results
+
+
+def benchmark_pdf_extraction(path: str, worker_counts: list = None) -> dict:
+    """
+    pages/sec of the extraction stage for increasing pool sizes (parse only, no DB writes).
+    Each size gets its own pool: the shared one keeps serving uploads meanwhile.
+    """
+    worker_counts = worker_counts or sorted({1, 2, 4, PDF_WORKERS})
+    runs = []
+    for w in worker_counts:
+        with _new_pool(w) as pool:
+            stats = extract_pdf(path, workers=w, pool=pool)["stats"]
+        runs.append({"workers": w, "pages": stats["pages"], "elapsed_s": stats["elapsed_s"],
+                     "pages_per_sec": stats["pages_per_sec"]})
+    base = runs[0]["pages_per_sec"] or 0
+    for r in runs:
+        r["speedup"] = round(r["pages_per_sec"] / base, 2) if base and r["pages_per_sec"] else None
+    return {"file": os.path.basename(path), "cpu_count": os.cpu_count(), "runs": runs}
@@ -0,0 +1,389 @@
+# utils/profiling.py
+"""
+Opt-in per-request profiling (PROFILE_ENABLED=1).
+
+- A request is profiled when it carries `X-Profile: 1`, or at random with
+  PROFILE_SAMPLE_RATE for paths under PROFILE_PATHS (default /api/nl2sql, /api/execute)
+- Sampling profiler: a thread reads sys._current_frames() every PROFILE_INTERVAL_MS
+  while the request runs (body included, so streamed responses are covered). cProfile
+  would only see the event loop thread, while sync handlers, summaries and the LLM run
+  in pool threads; the sampler sees every thread. Stacks are rooted at the thread name.
+  Idle threads (pool workers waiting for their next task, the event loop in select) are
+  skipped; a thread blocked *inside* work (a scheduler slot, Future.result()) is kept, since
+  that wait is part of the request. Other requests in flight at the same time do show up
+  (see `concurrent_requests`)
+- tracemalloc runs for the duration of the request: the peak traced memory seen by this
+  profile's sampler, top allocation sites near that peak (the sampler snapshots when traced
+  memory grows by half) and of what is still allocated at the end (PROFILE_TRACEMALLOC=0
+  turns it off, it roughly doubles allocation cost and the snapshots pause the process briefly)
+- Stored under PROFILE_DIR as {request_id}.json (+ .folded collapsed stacks for
+  flamegraph.pl / speedscope); the response carries the id in X-Request-ID.
+  See /api/debug/profiles
+"""
+import os, re, sys, json, time, uuid, random, threading, tracemalloc
+from collections import Counter
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = [p.strip() for p in os.getenv("PROFILE_PATHS", "/api/nl2sql,/api/execute").split(",") if p.strip()]
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "1") == "1"
+PROFILE_TOP_ALLOCS = int(os.getenv("PROFILE_TOP_ALLOCS", "25"))
+PEAK_SNAPSHOT_GROWTH = 1.5
+PEAK_SNAPSHOT_MIN_BYTES = 4 * 1024 * 1024
+PEAK_SNAPSHOT_MAX = 4
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_IGNORE_THREADS = {t.strip() for t in os.getenv("PROFILE_IGNORE_THREADS", "report-scheduler").split(",") if t.strip()}
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9_-]{8,64}")
+# (file suffix, function) of a thread's innermost Python frame while it waits for work
+_IDLE_TOPS = {
+    ("selectors.py", "select"),
+    ("concurrent/futures/thread.py", "_worker"),  # SimpleQueue.get is C: the loop itself is on top
+}
+# pool loops that block in queue.Queue.get() between tasks
+_WORKER_LOOPS = {
+    ("anyio/_backends/_asyncio.py", "run"),
+    ("concurrent/futures/thread.py", "_worker"),
+}
+
+_lock = threading.Lock()
+_active = 0            # profiles currently running
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_in_flight = 0         # requests being served by this worker (event loop only)
+_labels = {}
+
+
+def _short_path(path: str) -> str:
+    path = path.replace("\\", "/")
+    for marker in ("site-packages/", "dist-packages/", _BACKEND_DIR.replace("\\", "/")):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    return os.path.basename(path)
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{_short_path(code.co_filename)}:{code.co_name}".replace(";", ",").replace(" ", "_")
+    return label
+
+
+def _matches(frame, sites) -> bool:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/")
+    return any(path.endswith(suffix) and code.co_name == name for suffix, name in sites)
+
+
+def _is_idle(frame) -> bool:
+    """
+    Waiting for work, not waiting inside it: a threading.py wait counts as idle only under a
+    pool loop's queue.get() (or with nothing but threading.py below it, e.g. a Timer).
+    """
+    if _matches(frame, _IDLE_TOPS):
+        return True
+    queued = False
+    while frame is not None:
+        path = frame.f_code.co_filename.replace("\\", "/")
+        if path.endswith("/threading.py"):
+            frame = frame.f_back
+        elif path.endswith("/queue.py") and frame.f_code.co_name == "get":
+            queued, frame = True, frame.f_back
+        else:
+            return queued and _matches(frame, _WORKER_LOOPS)
+    return True
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval_s: float, track_memory: bool):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self.samples = 0
+        self.track_memory = track_memory
+        self.peak_bytes = tracemalloc.get_traced_memory()[0] if track_memory else 0
+        self.peak_snapshot, self.peak_snapshot_bytes, self.peak_snapshots = None, PEAK_SNAPSHOT_MIN_BYTES, 0
+        self._stop_event = threading.Event()
+
+    def _check_memory(self):
+        # tracemalloc's own peak is process-wide (and reset_peak() would reset it for overlapping
+        # profiles too): each profile keeps the highest value its sampler saw
+        current, _ = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, current)
+        if current > self.peak_snapshot_bytes * PEAK_SNAPSHOT_GROWTH and self.peak_snapshots < PEAK_SNAPSHOT_MAX:
+            self.peak_snapshot, self.peak_snapshot_bytes = tracemalloc.take_snapshot(), current
+            self.peak_snapshots += 1
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "thread")
+                if ident == me or name in PROFILE_IGNORE_THREADS or name.startswith("profile-sampler") or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(re.sub(r"[_-]?\d+$", "", name).replace(" ", "_") or "thread")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            if self.track_memory:
+                self._check_memory()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+# --- tracemalloc, shared by overlapping profiles ---
+def _tracemalloc_start():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _top_allocations(snapshot, baseline) -> list:
+    """Allocation sites (file:line) that grew the most between `baseline` and `snapshot`."""
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+    diff = snapshot.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), "lineno")
+    return [
+        {
+            "site": f"{_short_path(d.traceback[0].filename)}:{d.traceback[0].lineno}",
+            "size_kb": round(d.size_diff / 1024, 1),
+            "blocks": d.count_diff,
+        }
+        for d in diff if d.size_diff > 0
+    ][:PROFILE_TOP_ALLOCS]
+
+
+def _tracemalloc_stop(baseline, peak_snapshot, peak: int) -> dict:
+    global _tracemalloc_users, _tracemalloc_owned
+    snapshot = tracemalloc.take_snapshot()
+    peak = max(peak, tracemalloc.get_traced_memory()[0])
+    with _lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+    return {
+        "peak_kb": round(peak / 1024, 1),  # sampled every PROFILE_INTERVAL_MS
+        "top_allocations_at_peak": _top_allocations(peak_snapshot, baseline) if peak_snapshot else [],
+        "top_allocations_retained": _top_allocations(snapshot, baseline),
+    }
+
+
+# --- one profiled request ---
+class RequestProfile:
+    def __init__(self, request_id: str, method: str, path: str, trigger: str):
+        self.meta = {"request_id": request_id, "method": method, "path": path, "trigger": trigger,
+                     "started_at": time.time(), "interval_ms": PROFILE_INTERVAL_MS,
+                     "concurrent_requests": _in_flight}
+        self._baseline, self._sampler = None, None
+        self._finished = False
+
+    def start(self):
+        """Baseline snapshot + sampler thread (the snapshot walks every traced block: call it off the loop)."""
+        self._baseline = _tracemalloc_start() if PROFILE_TRACEMALLOC else None
+        self._sampler = _Sampler(PROFILE_INTERVAL_MS / 1000, track_memory=self._baseline is not None)
+        self._start = time.perf_counter()
+        self._sampler.start()
+
+    def seen_requests(self, n: int):
+        self.meta["concurrent_requests"] = max(self.meta["concurrent_requests"], n)
+
+    def finish(self, status_code: int = None):
+        global _active
+        with _lock:
+            if self._finished:
+                return
+            self._finished = True
+            _active -= 1
+        if self._sampler is None:  # never started
+            if self._baseline is not None:
+                _tracemalloc_stop(self._baseline, None, 0)
+            return
+        self._sampler.stop()
+        self.meta["duration_ms"] = round((time.perf_counter() - self._start) * 1000, 1)
+        self.meta["status_code"] = status_code
+        self.meta["samples"] = self._sampler.samples
+        stacks = self._sampler.stacks
+        leaves = Counter()
+        for stack, n in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        self.meta["top_self"] = [{"frame": f, "samples": n} for f, n in leaves.most_common(15)]
+        if self._baseline is not None:
+            try:
+                self.meta["memory"] = _tracemalloc_stop(self._baseline, self._sampler.peak_snapshot,
+                                                        self._sampler.peak_bytes)
+            except Exception as e:
+                self.meta["memory"] = {"error": str(e)}
+        try:
+            _save(self.meta, stacks)
+        except OSError as e:
+            print(f"[Profile] ⚠️ Could not store profile {self.meta['request_id']}: {e}")
+            return
+        print(f"[Profile] 🔥 {self.meta['method']} {self.meta['path']} ({self.meta['duration_ms']} ms, "
+              f"{self.meta['samples']} samples) → /api/debug/profiles/{self.meta['request_id']}")
+
+
+def _should_profile(request):
+    if request.headers.get("x-profile", "").lower() in ("1", "true", "yes"):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and any(request.url.path.startswith(p) for p in PROFILE_PATHS) \
+            and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def start_profile(request):
+    """A RequestProfile when this request should be profiled (and a profiling slot is free), else None."""
+    global _active
+    trigger = _should_profile(request)
+    if trigger is None:
+        return None
+    with _lock:
+        if _active >= PROFILE_MAX_CONCURRENT:
+            print(f"[Profile] ⚠️ {PROFILE_MAX_CONCURRENT} profiles already running, not profiling {request.url.path}")
+            return None
+        _active += 1
+    incoming = request.headers.get("x-request-id", "")
+    request_id = incoming if _REQUEST_ID_RE.fullmatch(incoming) else uuid.uuid4().hex
+    return RequestProfile(request_id, request.method, request.url.path, trigger)
+
+
+# --- storage ---
+def _path(request_id: str, ext: str) -> str:
+    if not _REQUEST_ID_RE.fullmatch(request_id or ""):
+        raise KeyError(f"Unknown profile '{request_id}'.")
+    return os.path.join(PROFILE_DIR, f"{request_id}{ext}")
+
+
+def _write(path: str, body: str):
+    tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def _save(meta: dict, stacks: Counter):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    _write(_path(meta["request_id"], ".folded"), "".join(f"{s} {n}\n" for s, n in stacks.most_common()))
+    _write(_path(meta["request_id"], ".json"), json.dumps(meta))
+    profiles = sorted((os.path.getmtime(os.path.join(PROFILE_DIR, f)), f[:-5])
+                      for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for _, request_id in profiles[:max(0, len(profiles) - PROFILE_KEEP)]:
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(_path(request_id, ext))
+            except OSError:
+                pass
+
+
+def load_profile(request_id: str) -> dict:
+    try:
+        with open(_path(request_id, ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise KeyError(f"Unknown profile '{request_id}'.")
+
+
+def load_collapsed(request_id: str) -> str:
+    """Collapsed stacks ("thread;frame;…;leaf count" per line), input of flamegraph.pl / speedscope."""
+    try:
+        with open(_path(request_id, ".folded"), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise KeyError(f"Unknown profile '{request_id}'.")
+
+
+def list_profiles(limit: int = 50) -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                meta = load_profile(name[:-5])
+            except (KeyError, ValueError, OSError):
+                continue
+            out.append({k: meta.get(k) for k in ("request_id", "method", "path", "trigger", "started_at",
+                                                 "duration_ms", "status_code", "samples", "concurrent_requests")})
+    return sorted(out, key=lambda p: p["started_at"] or 0, reverse=True)[:limit]
+
+
+# --- FastAPI glue ---
+async def _finish(profile: RequestProfile, status_code: int):
+    try:
+        await run_in_threadpool(profile.finish, status_code)  # snapshot + file writes: off the loop
+    except BaseException:
+        profile.finish(status_code)  # cancelled (client went away): finish here
+        raise
+
+
+def _leave(response, on_done):
+    """Runs on_done once the response body has been sent (or the client went away)."""
+    body = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await on_done()
+
+    response.body_iterator = tracked_body()
+    return response
+
+
+async def profiling_middleware(request, call_next):
+    """Profiles the request (handler + response body) when asked to; otherwise only counts requests in flight."""
+    global _in_flight
+    if not PROFILE_ENABLED:
+        return await call_next(request)
+    _in_flight += 1
+
+    async def done():
+        global _in_flight
+        _in_flight -= 1
+
+    profile = start_profile(request)
+    if profile is None:
+        try:
+            response = await call_next(request)
+        except BaseException:
+            await done()
+            raise
+        return _leave(response, done)  # streamed bodies still count as in flight
+
+    try:
+        await run_in_threadpool(profile.start)
+        response = await call_next(request)
+    except BaseException:
+        await done()
+        await _finish(profile, 500)
+        raise
+    body = response.body_iterator
+
+    async def profiled_body():
+        async for chunk in body:
+            profile.seen_requests(_in_flight)
+            yield chunk
+
+    async def profiled_done():
+        await done()
+        await _finish(profile, response.status_code)
+
+    response.body_iterator = profiled_body()
+    response.headers["X-Request-ID"] = profile.meta["request_id"]
+    return _leave(response, profiled_done)
@@ -0,0 +1,353 @@
+# utils/query_governor.py
+"""
+Query governor around every read query the API runs on behalf of a user / the LLM:
+- EXPLAIN pre-check: warn on (or reject) full scans whose estimated rows exceed a threshold
+- Per-query MAX_EXECUTION_TIME on MySQL (DuckDB is interrupted by a timer)
+- Automatic LIMIT injection (max_rows + 1) and a `truncated` flag
+- Query ids registered on disk so any worker can `KILL QUERY` them via the cancel endpoint
+- Runs inside a slot of the fair "db" scheduler (per-database queues, 429 when over budget)
+- governed_read_async(): the same for async handlers, MySQL awaited on the async engine
+"""
+import os, re, json, time, uuid, threading
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+from utils.db import get_engine_for_db, root_engine
+from utils import query_router
+from utils.scheduler import get_scheduler
+from utils import db_async
+
+GOVERNOR_MAX_ROWS = int(os.getenv("GOVERNOR_MAX_ROWS", "10000"))
+GOVERNOR_TIMEOUT_MS = int(os.getenv("GOVERNOR_TIMEOUT_MS", "30000"))
+GOVERNOR_SCAN_ROW_THRESHOLD = int(os.getenv("GOVERNOR_SCAN_ROW_THRESHOLD", "1000000"))
+GOVERNOR_SCAN_POLICY = os.getenv("GOVERNOR_SCAN_POLICY", "warn").lower()  # warn | reject
+GOVERNOR_RUNNING_DIR = os.getenv("GOVERNOR_RUNNING_DIR", "./governor/running")
+
+_LIMIT_RE = re.compile(r"\blimit\s+(\d+)(?:\s*(,|offset)\s*(\d+))?\s*;?\s*$", re.I)
+
+
+class QueryRejected(Exception):
+    """Raised when the EXPLAIN pre-check blocks a query."""
+
+    def __init__(self, message: str, explain: dict):
+        super().__init__(message)
+        self.explain = explain
+
+
+# --- LIMIT injection ---
+def apply_limit(sql: str, max_rows: int):
+    """
+    Caps the top-level result at max_rows + 1 rows (the extra row detects truncation).
+    Returns (sql, cap) — an existing smaller LIMIT is left alone.
+    """
+    body = sql.strip().rstrip(";").rstrip()
+    cap = max_rows + 1
+    if not re.match(r"^\(?\s*(select|with)\b", body, re.I):
+        return sql, None  # SHOW / DESCRIBE / EXPLAIN take no LIMIT
+    m = _LIMIT_RE.search(body)
+    if m:
+        if m.group(2) and m.group(2) == ",":  # LIMIT offset, count
+            offset, count = int(m.group(1)), int(m.group(3))
+            return body[:m.start()] + f"LIMIT {offset}, {min(count, cap)}", min(count, cap)
+        count = int(m.group(1))
+        tail = f" OFFSET {m.group(3)}" if m.group(3) else ""
+        return body[:m.start()] + f"LIMIT {min(count, cap)}{tail}", min(count, cap)
+    return f"{body}\nLIMIT {cap}", cap
+
+
+# --- EXPLAIN pre-check (MySQL) ---
+def explain_check(conn, sql: str, threshold: int = GOVERNOR_SCAN_ROW_THRESHOLD) -> dict:
+    return summarize_explain(pd.read_sql(_explain_sql(sql), conn), threshold)
+
+
+def _explain_sql(sql: str) -> str:
+    return "EXPLAIN " + sql.strip().rstrip(";")
+
+
+def summarize_explain(plan: pd.DataFrame, threshold: int = GOVERNOR_SCAN_ROW_THRESHOLD) -> dict:
+    plan.columns = [str(c).lower() for c in plan.columns]
+    full_scans, warnings, fanout = [], [], 1.0
+    for row in plan.to_dict(orient="records"):
+        est = float(row.get("rows") or 0)
+        filtered = float(row.get("filtered") or 100.0)
+        fanout *= max(est * filtered / 100.0, 1.0)
+        if str(row.get("type") or "").upper() == "ALL":
+            full_scans.append({"table": row.get("table"), "estimated_rows": int(est)})
+            if est > threshold:
+                warnings.append(f"full scan of '{row.get('table')}' (~{int(est):,} rows)")
+    if len(plan) > 1 and fanout > threshold and not warnings:
+        warnings.append(f"join fan-out of ~{int(fanout):,} rows")
+    return {"full_scans": full_scans, "estimated_rows": int(fanout), "warnings": warnings}
+
+
+# --- running-query registry (shared by workers) ---
+_duckdb_running = {}
+
+
+def _registry_path(query_id: str) -> str:
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", query_id or ""):
+        raise ValueError(f"Invalid query id '{query_id}'.")
+    return os.path.join(GOVERNOR_RUNNING_DIR, f"{query_id}.json")
+
+
+def _register(query_id: str, record: dict):
+    os.makedirs(GOVERNOR_RUNNING_DIR, exist_ok=True)
+    with open(_registry_path(query_id), "w", encoding="utf-8") as f:
+        json.dump({**record, "pid": os.getpid(), "started_at": time.time()}, f)
+
+
+def _unregister(query_id: str):
+    try:
+        os.remove(_registry_path(query_id))
+    except OSError:
+        pass
+
+
+def cancel_query(query_id: str) -> dict:
+    """Stops a running query: KILL QUERY on MySQL, interrupt() for in-process DuckDB."""
+    path = _registry_path(query_id)
+    if not os.path.exists(path):
+        return {"status": "not_found", "query_id": query_id}
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+
+    if record.get("engine") == "duckdb":
+        con = _duckdb_running.get(query_id)
+        if con is None:
+            return {"status": "not_cancellable", "query_id": query_id, "detail": f"DuckDB query runs in worker pid {record.get('pid')}"}
+        con.interrupt()
+    else:
+        with root_engine.connect() as conn:
+            conn.exec_driver_sql(f"KILL QUERY {int(record['connection_id'])}")
+    print(f"[Governor] 🛑 Cancelled query {query_id} ({record.get('engine')})")
+    return {"status": "cancelled", "query_id": query_id, "engine": record.get("engine")}
+
+
+# --- execution ---
+def _run_on_conn(conn, sql: str, db_name: str, query_id: str, timeout_ms: int, explain_policy: str):
+    """The MySQL part of a governed read on an open (sync) connection."""
+    connection_id = conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+    _register(query_id, {"engine": "mysql", "db_name": db_name, "connection_id": connection_id, "sql": sql[:2000]})
+    try:
+        explain = None
+        try:
+            explain = explain_check(conn, sql)
+        except Exception as e:
+            print(f"[Governor] ⚠️ EXPLAIN failed, running without cost check: {e}")
+        if explain and explain["warnings"] and explain_policy == "reject":
+            raise QueryRejected("Query rejected by cost guard: " + "; ".join(explain["warnings"]), explain)
+
+        conn.exec_driver_sql(f"SET SESSION max_execution_time = {int(timeout_ms)}")
+        try:
+            df = pd.read_sql(sql, conn)
+        finally:
+            conn.exec_driver_sql("SET SESSION max_execution_time = 0")  # connection goes back to the pool
+        return df, explain
+    finally:
+        _unregister(query_id)
+
+
+def _run_mysql(sql: str, db_name: str, query_id: str, timeout_ms: int, explain_policy: str):
+    with get_engine_for_db(db_name).connect() as conn:
+        return _run_on_conn(conn, sql, db_name, query_id, timeout_ms, explain_policy)
+
+
+def _run_duckdb(sql: str, db_name: str, tables: list, query_id: str, timeout_ms: int):
+    timer = None
+
+    def on_connect(con):
+        nonlocal timer
+        _duckdb_running[query_id] = con
+        _register(query_id, {"engine": "duckdb", "db_name": db_name, "sql": sql[:2000]})
+        timer = threading.Timer(timeout_ms / 1000.0, con.interrupt)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        return query_router.run_duckdb(sql, db_name, tables, on_connect=on_connect)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        _duckdb_running.pop(query_id, None)
+        _unregister(query_id)
+
+
+def governed_read(sql: str, db_name: str, query_id: str = None, max_rows: int = None,
+                  timeout_ms: int = None, explain_policy: str = None):
+    """
+    Run a read query under the governor, on DuckDB or MySQL as decided by the router.
+    Returns (DataFrame, info) with info = {query_id, engine, truncated, max_rows, explain, ...}.
+    Raises QueryRejected when the cost guard blocks the query, Overloaded when the DB scheduler sheds it.
+    """
+    plan = _plan(sql, db_name, query_id, max_rows, timeout_ms, explain_policy)
+    with get_scheduler("db").slot(db_name) as ticket:
+        df, explain = _execute_routed(plan["sql"], db_name, plan["tables"], plan["use_duckdb"], plan["route"],
+                                      plan["query_id"], plan["timeout_ms"], plan["explain_policy"])
+    return _finish(plan, ticket, df, explain)
+
+
+async def _run_mysql_async(sql: str, db_name: str, query_id: str, timeout_ms: int, explain_policy: str):
+    """
+    _run_on_conn for the async engine: only the round trips are awaited on the loop; the
+    registry file writes, the EXPLAIN evaluation and the DataFrame build run in the threadpool.
+    """
+    engine = db_async.get_async_engine_for_db(db_name)
+    if engine is None:
+        return await run_in_threadpool(_run_mysql, sql, db_name, query_id, timeout_ms, explain_policy)
+    async with engine.connect() as conn:
+        connection_id = (await conn.exec_driver_sql("SELECT CONNECTION_ID()")).scalar()
+        await run_in_threadpool(_register, query_id, {"engine": "mysql", "db_name": db_name,
+                                                      "connection_id": connection_id, "sql": sql[:2000]})
+        try:
+            explain = None
+            try:
+                columns, rows = await db_async.fetch_on(conn, _explain_sql(sql))
+                explain = await run_in_threadpool(lambda: summarize_explain(db_async.to_frame(columns, rows)))
+            except Exception as e:
+                print(f"[Governor] ⚠️ EXPLAIN failed, running without cost check: {e}")
+            if explain and explain["warnings"] and explain_policy == "reject":
+                raise QueryRejected("Query rejected by cost guard: " + "; ".join(explain["warnings"]), explain)
+
+            await conn.exec_driver_sql(f"SET SESSION max_execution_time = {int(timeout_ms)}")
+            try:
+                columns, rows = await db_async.fetch_on(conn, sql)
+            finally:
+                await conn.exec_driver_sql("SET SESSION max_execution_time = 0")  # connection goes back to the pool
+            return await run_in_threadpool(db_async.to_frame, columns, rows), explain
+        finally:
+            await run_in_threadpool(_unregister, query_id)
+
+
+async def governed_read_async(sql: str, db_name: str, query_id: str = None, max_rows: int = None,
+                              timeout_ms: int = None, explain_policy: str = None):
+    """
+    governed_read for async handlers: the scheduler slot and the MySQL round trips are awaited,
+    no threadpool worker is held while MySQL works. DuckDB routes (in-process, CPU-bound) still
+    run in the threadpool.
+    """
+    # routing reads manifests and checks mirror freshness on MySQL: off the loop
+    plan = await run_in_threadpool(_plan, sql, db_name, query_id, max_rows, timeout_ms, explain_policy)
+    route = plan["route"]
+    async with get_scheduler("db").aslot(db_name) as ticket:
+        if plan["use_duckdb"]:
+            df, explain = await run_in_threadpool(_execute_routed, plan["sql"], db_name, plan["tables"], True, route,
+                                                  plan["query_id"], plan["timeout_ms"], plan["explain_policy"])
+        else:
+            start = time.perf_counter()
+            df, explain = await _run_mysql_async(plan["sql"], db_name, plan["query_id"], plan["timeout_ms"],
+                                                 plan["explain_policy"])
+            route.update(elapsed_ms=round((time.perf_counter() - start) * 1000, 2), driver=db_async.driver_name())
+    return _finish(plan, ticket, df, explain)
+
+
+def _plan(sql, db_name, query_id, max_rows, timeout_ms, explain_policy) -> dict:
+    max_rows = max(1, min(int(max_rows or GOVERNOR_MAX_ROWS), GOVERNOR_MAX_ROWS))
+    limited_sql, _ = apply_limit(sql, max_rows)
+    use_duckdb, reason, tables = query_router.classify_query(sql, db_name)
+    return {
+        "query_id": query_id or uuid.uuid4().hex,
+        "sql": limited_sql,
+        "max_rows": max_rows,
+        "timeout_ms": int(timeout_ms or GOVERNOR_TIMEOUT_MS),
+        "explain_policy": (explain_policy or GOVERNOR_SCAN_POLICY).lower(),
+        "use_duckdb": use_duckdb,
+        "tables": tables,
+        "route": {"engine": "mysql", "reason": reason},
+    }
+
+
+def _finish(plan: dict, ticket, df, explain):
+    route, max_rows, query_id = plan["route"], plan["max_rows"], plan["query_id"]
+    route["queue_ms"] = round(ticket.queue_ms, 1)
+
+    truncated = len(df) > max_rows
+    if truncated:
+        df = df.head(max_rows)
+
+    print(f"[Governor] ✅ {query_id} on {route['engine']} ({route.get('elapsed_ms')} ms, queued {route['queue_ms']} ms, rows={len(df)}, truncated={truncated})")
+    return df, {
+        "query_id": query_id,
+        "engine": route,
+        "truncated": truncated,
+        "max_rows": max_rows,
+        "timeout_ms": plan["timeout_ms"],
+        "explain": explain,
+        "warnings": (explain or {}).get("warnings", []),
+    }
+
+
+def _execute_routed(limited_sql, db_name, tables, use_duckdb, route, query_id, timeout_ms, explain_policy):
+    """DuckDB first when the router chose it (MySQL fallback on failure); fills in `route`."""
+    explain = None
+    df = None
+    if use_duckdb:
+        start = time.perf_counter()
+        try:
+            df = _run_duckdb(limited_sql, db_name, tables, query_id, timeout_ms)
+            route.update(engine="duckdb", elapsed_ms=round((time.perf_counter() - start) * 1000, 2))
+        except Exception as e:
+            if "Interrupt" in type(e).__name__:
+                raise  # cancelled or timed out: do not silently re-run it on MySQL
+            route["fallback_error"] = str(e)
+            route["duckdb_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            route["reason"] = "duckdb failed, fell back to MySQL"
+            print(f"[Governor] ⚠️ DuckDB failed, falling back to MySQL: {e}")
+
+    if df is None:
+        start = time.perf_counter()
+        df, explain = _run_mysql(limited_sql, db_name, query_id, timeout_ms, explain_policy)
+        route["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return df, explain
+
+
+def governed_stream(sql: str, db_name: str, batch_rows: int, query_id: str = None, max_rows: int = None,
+                    timeout_ms: int = None, explain_policy: str = None):
+    """
+    Like governed_read, but yields DataFrame batches of `batch_rows` read from a server-side
+    (unbuffered) MySQL cursor, so memory stays flat however large the result is. For exports:
+    max_rows / timeout_ms are the caller's (not capped by GOVERNOR_MAX_ROWS); always on MySQL.
+    The DB scheduler slot, query id registration (cancel endpoint) and cost guard still apply.
+    """
+    query_id = query_id or uuid.uuid4().hex
+    timeout_ms = int(timeout_ms or GOVERNOR_TIMEOUT_MS)
+    explain_policy = (explain_policy or GOVERNOR_SCAN_POLICY).lower()
+    if max_rows:
+        sql, _ = apply_limit(sql, int(max_rows) - 1)  # apply_limit adds the +1 probe row; exports want exactly max_rows
+
+    with get_scheduler("db").slot(db_name):
+        with get_engine_for_db(db_name).connect() as conn:
+            conn = conn.execution_options(stream_results=True)  # PyMySQL SSCursor: rows are fetched as consumed
+            connection_id = conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+            _register(query_id, {"engine": "mysql", "db_name": db_name, "connection_id": connection_id, "sql": sql[:2000]})
+            try:
+                try:
+                    explain = explain_check(conn, sql)
+                    if explain["warnings"] and explain_policy == "reject":
+                        raise QueryRejected("Query rejected by cost guard: " + "; ".join(explain["warnings"]), explain)
+                except QueryRejected:
+                    raise
+                except Exception as e:
+                    print(f"[Governor] ⚠️ EXPLAIN failed, streaming without cost check: {e}")
+                conn.exec_driver_sql(f"SET SESSION max_execution_time = {int(timeout_ms)}")
+                finished = False
+                try:
+                    # nullable dtypes: an INT column keeps its type in batches that contain NULLs
+                    for batch in pd.read_sql(sql, conn, chunksize=batch_rows, dtype_backend="numpy_nullable"):
+                        yield batch
+                    finished = True
+                finally:
+                    if finished:
+                        conn.exec_driver_sql("SET SESSION max_execution_time = 0")
+                    else:
+                        conn.invalidate()  # unread streamed rows: never hand this connection back to the pool
+            finally:
+                _unregister(query_id)
+
+
+def describe_error(e: Exception) -> str:
+    """Human-readable message for governor-related MySQL errors (timeout / kill)."""
+    msg = str(e)
+    if "3024" in msg or "maximum statement execution time exceeded" in msg:
+        return f"Query exceeded the {GOVERNOR_TIMEOUT_MS} ms execution limit and was stopped."
+    if "1317" in msg or "Query execution was interrupted" in msg or "INTERRUPT" in msg.upper():
+        return "Query was cancelled."
+    return msg
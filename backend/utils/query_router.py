@@ -0,0 +1,145 @@
+# utils/query_router.py
+"""
+Execution router: read-only aggregate queries go to an embedded DuckDB engine over the
+Parquet mirrors (utils/columnar.py); everything else — and any DuckDB failure — goes to MySQL.
+Both engines must return the same rows, so a query only goes to DuckDB when:
+- every mirror is current: MySQL's information_schema UPDATE_TIME is not newer than the
+  mirror (read with information_schema_stats_expiry = 0: MySQL 8 otherwise serves table
+  statistics cached for up to a day, which hides recent writes), and when MySQL no longer knows (UPDATE_TIME is reset by a restart) an exact
+  COUNT(*) matches the mirror once per mirror version
+- it does no collation-dependent string matching: DuckDB runs with the case- and
+  accent-insensitive collation of MySQL's _ci collations, which covers = / IN / GROUP BY /
+  ORDER BY but not LIKE / REGEXP / DISTINCT, so those stay on MySQL
+Execution (with timeouts, row caps and cancellation) lives in utils/query_governor.py,
+which reports which engine ran each query, why, and how long it took.
+"""
+import os, re, time, threading
+import pandas as pd
+from sqlalchemy import text, bindparam
+from utils import columnar
+from utils.db import get_engine_for_db
+
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "auto").lower()  # auto | mysql
+MIRROR_CLOCK_TOLERANCE_S = 1.0        # UPDATE_TIME has second resolution
+
+_WRITE_RE = re.compile(r"\binto\b|\bfor\s+update\b|\block\s+in\s+share\s+mode\b", re.I)
+_AGG_RE = re.compile(r"\b(count|sum|avg|min|max|group_concat|stddev|variance)\s*\(|\bgroup\s+by\b", re.I)
+_TABLE_RE = re.compile(r"\b(?:from|join)\s+`?([A-Za-z0-9_]+)`?(?:\s*\.\s*`?([A-Za-z0-9_]+)`?)?", re.I)
+_CTE_RE = re.compile(r"(?:\bwith\b|,)\s*`?([A-Za-z0-9_]+)`?\s+as\s*\(", re.I)
+
+_verified_counts = {}  # (db, table, mirror updated_at) → True once COUNT(*) matched the mirror
+_verified_lock = threading.Lock()
+
+
+def referenced_tables(sql: str) -> list:
+    """Table names after FROM/JOIN (db-qualified names keep only the table part), minus CTE names."""
+    ctes = {m.lower() for m in _CTE_RE.findall(sql)}
+    tables = []
+    for first, second in _TABLE_RE.findall(sql):
+        name = second or first
+        if name.lower() not in ctes and name not in tables:
+            tables.append(name)
+    return tables
+
+
+def classify_query(sql: str, db_name: str):
+    """Returns (use_duckdb: bool, reason: str, tables: list)."""
+    if ANALYTICS_ENGINE == "mysql":
+        return False, "ANALYTICS_ENGINE=mysql", []
+    stripped = sql.strip().rstrip(";").strip()
+    head = stripped.lower().lstrip("(")
+    if not (head.startswith("select") or head.startswith("with")):
+        return False, "not a SELECT", []
+    if ";" in stripped or _WRITE_RE.search(stripped):
+        return False, "not read-only", []
+    if not _AGG_RE.search(stripped):
+        return False, "not an aggregate (row lookup stays on MySQL)", []
+    collation = columnar.collation_dependency(stripped)
+    if collation:
+        return False, collation, []
+    tables = referenced_tables(stripped)
+    if not tables:
+        return False, "no tables referenced", []
+    manifests = {t: columnar.read_manifest(db_name, t) for t in tables}
+    missing = [t for t, manifest in manifests.items() if manifest is None]
+    if missing:
+        return False, f"no parquet mirror for {missing}", tables
+    try:
+        stale = stale_mirrors(db_name, manifests)
+    except Exception as e:
+        return False, f"mirror freshness check failed: {e}", tables
+    if stale:
+        return False, f"parquet mirror out of date for {stale}", tables
+    return True, "read-only aggregate over current mirrors", tables
+
+
+def fresh_table_stats(conn):
+    """Make this session's information_schema.TABLES reads (UPDATE_TIME, TABLE_ROWS) uncached."""
+    try:
+        conn.exec_driver_sql("SET SESSION information_schema_stats_expiry = 0")
+    except Exception:
+        pass  # MySQL < 8.0 / MariaDB: no statistics cache, nothing to disable
+
+
+def stale_mirrors(db_name: str, manifests: dict) -> list:
+    """Tables whose MySQL data may have changed since their mirror was written (see module doc)."""
+    engine = get_engine_for_db(db_name)
+    query = text(
+        "SELECT TABLE_NAME, UNIX_TIMESTAMP(UPDATE_TIME) AS updated, UNIX_TIMESTAMP() AS now "
+        "FROM information_schema.TABLES WHERE TABLE_SCHEMA = :db AND TABLE_NAME IN :tables"
+    ).bindparams(bindparam("tables", expanding=True))
+    with engine.connect() as conn:
+        fresh_table_stats(conn)
+        rows = {r.TABLE_NAME: r for r in conn.execute(query, {"db": db_name, "tables": list(manifests)})}
+        now = float(next(iter(rows.values())).now) if rows else time.time()
+        skew = now - time.time()  # MySQL clock − our clock
+        started = None
+        if any(r.updated is None for r in rows.values()):
+            uptime = conn.exec_driver_sql("SHOW GLOBAL STATUS LIKE 'Uptime'").fetchone()
+            started = now - float(uptime[1]) if uptime else None
+        stale = []
+        for table, manifest in manifests.items():
+            row = rows.get(table)
+            if row is None:
+                stale.append(table)
+                continue
+            mirrored = float(manifest.get("updated_at") or 0) + skew  # on MySQL's clock
+            if row.updated is not None:
+                if float(row.updated) > mirrored + MIRROR_CLOCK_TOLERANCE_S:
+                    stale.append(table)
+            elif started is None or started > mirrored:
+                # restarted since the mirror was written: UPDATE_TIME cannot tell → compare row counts once
+                key = (db_name, table, manifest.get("updated_at"))
+                with _verified_lock:
+                    verified = _verified_counts.get(key)
+                if verified is None:
+                    count = conn.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar()
+                    verified = int(count or 0) == int(manifest.get("rows") or 0)
+                    with _verified_lock:
+                        _verified_counts[key] = verified
+                if not verified:
+                    stale.append(table)
+    return stale
+
+
+def _to_duckdb_sql(sql: str) -> str:
+    # MySQL → DuckDB: identifier quoting and the pymysql %-escaping added by nl2sql
+    return sql.replace("`", '"').replace("%%", "%").strip().rstrip(";")
+
+
+def run_duckdb(sql: str, db_name: str, tables: list, on_connect=None) -> pd.DataFrame:
+    """Run `sql` on a fresh in-memory DuckDB with one read_parquet view per mirrored table."""
+    con = columnar.duckdb_connect()
+    if on_connect is not None:
+        on_connect(con)  # lets the governor register the connection for interrupt()
+    try:
+        for t in tables:
+            manifest = columnar.read_manifest(db_name, t)
+            glob = columnar.parquet_glob(db_name, t).replace("'", "''")
+            select = f"SELECT * EXCLUDE ({columnar.DATE_PARTITION_COL})" if manifest.get("partition_kind") == "date" else "SELECT *"
+            con.execute(
+                f"CREATE VIEW \"{t}\" AS {select} FROM read_parquet('{glob}', hive_partitioning = true, union_by_name = true)"
+            )
+        return con.execute(_to_duckdb_sql(sql)).df()
+    finally:
+        con.close()
@@ -0,0 +1,156 @@
+# utils/result_cache.py
+"""
+Content-addressed disk cache for derived results (LLM summaries, chart JSON).
+
+- Key = sha256 over the result's CONTENT (column names, dtypes, row hashes) plus whatever
+  else shaped the output (SQL text, prompt version, model) — not over the query alone,
+  so a changed table yields a new key and an unchanged result is a hit for every user
+- One JSON file per key under RESULT_CACHE_DIR, written atomically (tmp + os.replace),
+  so all uvicorn workers share it and it survives restarts
+- Size-bounded: when the directory grows past RESULT_CACHE_MAX_BYTES the least recently
+  used files (mtime, bumped on every hit) are evicted down to 90% of the budget
+"""
+import os, json, time, hashlib, threading
+import pandas as pd
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "./result_cache")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+_EVICT_TARGET = 0.9
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0, "errors": 0}
+_written_since_scan = None  # bytes written by this process since the last directory scan (None → scan on first put)
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Hash of a DataFrame's content: columns, dtypes and every row (vectorized, no serialization)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    if len(df):
+        try:
+            h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        except TypeError:  # unhashable cells (lists / dicts): fall back to the serialized rows
+            h.update(df.to_json(orient="values", date_format="iso", default_handler=str).encode())
+    return h.hexdigest()
+
+
+def cache_key(kind: str, digest: str, *parts) -> str:
+    """`digest` is frame_digest() of the result; `parts` are the other inputs of the cached output."""
+    h = hashlib.sha256(kind.encode())
+    h.update(digest.encode())
+    for p in parts:
+        h.update(b"\x00" + str(p).encode())
+    return h.hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, key[:2], key + ".json")
+
+
+def get(key: str):
+    """Cached value or None; a hit refreshes the entry's LRU position."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    path = _path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)["value"]
+        os.utime(path)
+    except FileNotFoundError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[ResultCache] ⚠️ Unreadable entry {key[:12]}: {e}")
+        with _lock:
+            _stats["misses"] += 1
+            _stats["errors"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+    return value
+
+
+def put(key: str, value):
+    global _written_since_scan
+    if not RESULT_CACHE_ENABLED:
+        return
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = json.dumps({"value": value, "created_at": time.time()}, default=str)
+        tmp = path + f".tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[ResultCache] ⚠️ Could not write entry {key[:12]}: {e}")
+        with _lock:
+            _stats["errors"] += 1
+        return
+    with _lock:
+        _stats["writes"] += 1
+        # other workers write too: rescan after ~5% of the budget instead of on every put
+        due = _written_since_scan is None or _written_since_scan + len(body) > RESULT_CACHE_MAX_BYTES * 0.05
+        _written_since_scan = 0 if due else _written_since_scan + len(body)
+    if due:
+        evict()
+
+
+def _entries() -> list:
+    out = []
+    if not os.path.isdir(RESULT_CACHE_DIR):
+        return out
+    for shard in os.listdir(RESULT_CACHE_DIR):
+        shard_dir = os.path.join(RESULT_CACHE_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(shard_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # evicted by another worker meanwhile
+            out.append((st.st_mtime, st.st_size, path))
+    return out
+
+
+def evict(max_bytes: int = None) -> dict:
+    """Drop least recently used entries until the cache fits into 90% of max_bytes."""
+    max_bytes = RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        for _, size, path in sorted(entries):
+            if total <= max_bytes * _EVICT_TARGET:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with _lock:
+            _stats["evicted"] += removed
+        print(f"[ResultCache] 🧹 Evicted {removed} entries, {total} bytes left")
+    return {"entries": len(entries) - removed, "bytes": total, "evicted": removed}
+
+
+def stats() -> dict:
+    entries = _entries()
+    with _lock:
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "dir": RESULT_CACHE_DIR,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": RESULT_CACHE_MAX_BYTES,
+        "hit_rate": round(counters["hits"] / lookups, 3) if lookups else None,
+        **counters,  # this worker only
+    }
@@ -0,0 +1,299 @@
+# utils/scheduler.py
+"""
+Weighted-fair admission in front of DB and LLM work.
+
+- One scheduler per resource ("db" in the query governor, "llm" in the LLM gateway),
+  each with its own concurrency budget and a per-tenant running cap
+- Waiting work is queued per tenant (the db_name, or the X-API-Key caller with
+  SCHED_TENANT=api_key). A free slot goes to the tenant with the smallest virtual start
+  time, which advances by 1/weight per dispatched job (start-time fair queuing):
+  a tenant flooding the server only ever gets its weighted share, a quiet one is served next
+- Queue time and service time are recorded per tenant (p50/p95), see /api/debug/scheduler
+- Load shedding: an HTTP request whose tenant queue is full, or whose estimated wait is
+  longer than SCHED_MAX_WAIT_S, gets Overloaded → 429 with Retry-After. Background work
+  (batch jobs, scheduled reports) has no request context and simply waits its turn
+- slot() blocks the calling thread while queued; aslot() is the same queue for async
+  handlers, awaiting the grant on the event loop
+"""
+import os, math, time, asyncio, hashlib, threading, contextvars
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+SCHED_TENANT = os.getenv("SCHED_TENANT", "db").lower()                   # db | api_key
+SCHED_DB_CONCURRENCY = int(os.getenv("SCHED_DB_CONCURRENCY", "8"))
+SCHED_DB_PER_TENANT = int(os.getenv("SCHED_DB_PER_TENANT", "4"))
+SCHED_MAX_QUEUE = int(os.getenv("SCHED_MAX_QUEUE", "16"))               # waiting jobs per tenant and resource
+SCHED_MAX_WAIT_S = float(os.getenv("SCHED_MAX_WAIT_S", "20"))
+SCHED_WEIGHTS = os.getenv("SCHED_WEIGHTS", "")                           # e.g. "analytics=2,sandbox=0.5"
+METRIC_WINDOW = 200
+DEFAULT_TENANT = "_default"
+
+_request = contextvars.ContextVar("sched_request", default=None)
+
+
+class Overloaded(Exception):
+    """The tenant's queue for a resource is over budget; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int, resource: str, tenant: str):
+        super().__init__(message)
+        self.retry_after, self.resource, self.tenant = retry_after, resource, tenant
+
+
+def _parse_weights(spec: str) -> dict:
+    weights = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, w = part.partition("=")
+        try:
+            weights[name.strip()] = max(0.01, float(w))
+        except ValueError:
+            print(f"[Scheduler] ⚠️ Ignoring bad SCHED_WEIGHTS entry '{part}'")
+    return weights
+
+
+_WEIGHTS = _parse_weights(SCHED_WEIGHTS)
+
+
+def current_tenant(db_name: str = None) -> str:
+    req = _request.get()
+    if SCHED_TENANT == "api_key" and req and req.get("api_key"):
+        return "key:" + hashlib.sha256(req["api_key"].encode()).hexdigest()[:12]  # never keep the key itself
+    return db_name or DEFAULT_TENANT
+
+
+def _pct(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+class _Ticket:
+    __slots__ = ("event", "granted", "enqueued", "queue_ms", "on_grant")
+
+    def __init__(self, on_grant=None):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.perf_counter()
+        self.queue_ms = 0.0
+        self.on_grant = on_grant  # async waiters: wakes the event loop (called under the scheduler lock)
+
+
+class _Tenant:
+    def __init__(self, name: str, weight: float):
+        self.name, self.weight = name, weight
+        self.queue = deque()
+        self.running = 0
+        self.vtime = 0.0
+        self.waits = deque(maxlen=METRIC_WINDOW)      # ms spent queued (0 for immediate grants)
+        self.services = deque(maxlen=METRIC_WINDOW)   # ms holding the slot
+        self.admitted = self.shed = self.timeouts = 0
+
+
+class FairScheduler:
+    def __init__(self, name: str, capacity: int, per_tenant: int = None,
+                 max_queue: int = SCHED_MAX_QUEUE, max_wait_s: float = SCHED_MAX_WAIT_S, weights: dict = None):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.per_tenant = max(1, min(per_tenant or self.capacity, self.capacity))
+        self.max_queue, self.max_wait_s = max_queue, max_wait_s
+        self.weights = _WEIGHTS if weights is None else weights
+        self.running = 0
+        self._vclock = 0.0
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def _tenant(self, name: str) -> _Tenant:
+        t = self._tenants.get(name)
+        if t is None:
+            t = self._tenants[name] = _Tenant(name, self.weights.get(name, 1.0))
+        return t
+
+    def _start(self, t: _Tenant):
+        start = max(t.vtime, self._vclock)
+        self._vclock = start
+        t.vtime = start + 1.0 / t.weight
+        t.running += 1
+        t.admitted += 1
+        self.running += 1
+
+    def _dispatch(self):
+        while self.running < self.capacity:
+            ready = [t for t in self._tenants.values() if t.queue and t.running < self.per_tenant]
+            if not ready:
+                return
+            t = min(ready, key=lambda x: max(x.vtime, self._vclock))
+            ticket = t.queue.popleft()
+            ticket.granted = True
+            ticket.queue_ms = (time.perf_counter() - ticket.enqueued) * 1000
+            t.waits.append(ticket.queue_ms)
+            self._start(t)
+            ticket.event.set()
+            if ticket.on_grant:
+                ticket.on_grant()
+
+    def _estimated_wait_s(self, t: _Tenant) -> float:
+        """Jobs ahead of a new arrival / the tenant's fair share of the slots × its mean service time."""
+        services = t.services or [s for x in self._tenants.values() for s in x.services]
+        mean_s = (sum(services) / len(services) / 1000) if services else 1.0
+        active = [x for x in self._tenants.values() if x.queue or x.running] or [t]
+        weight_sum = sum(x.weight for x in active) + (0 if t in active else t.weight)
+        share = max(1.0, min(self.per_tenant, self.capacity * t.weight / weight_sum))
+        return (len(t.queue) + 1) / share * mean_s
+
+    def _enqueue(self, ticket: _Ticket, tenant: str, interactive: bool) -> bool:
+        """True when the ticket got a slot right away; otherwise it is queued (or Overloaded is raised)."""
+        with self._lock:
+            t = self._tenant(tenant)
+            if self.running < self.capacity and t.running < self.per_tenant and not t.queue:
+                t.waits.append(0.0)
+                self._start(t)
+                return True
+            if interactive:
+                wait_s = self._estimated_wait_s(t)
+                if len(t.queue) >= self.max_queue or wait_s > self.max_wait_s:
+                    t.shed += 1
+                    retry_after = max(1, math.ceil(wait_s))
+                    print(f"[Scheduler] 🚦 {self.name}: shedding request for '{tenant}' "
+                          f"(queued={len(t.queue)}, est. wait {wait_s:.1f}s)")
+                    raise Overloaded(f"Too much {self.name} work queued for '{tenant}'; retry in {retry_after}s.",
+                                     retry_after, self.name, tenant)
+            t.queue.append(ticket)
+            return False
+
+    def _abandon(self, ticket: _Ticket, tenant: str, timed_out: bool = True) -> bool:
+        """Takes a waiting ticket out of its queue; False when it was granted meanwhile (caller owns the slot)."""
+        with self._lock:
+            if ticket.granted:
+                return False
+            t = self._tenants[tenant]
+            t.queue.remove(ticket)
+            t.timeouts += timed_out
+            return True
+
+    def _timed_out(self, tenant: str) -> Overloaded:
+        return Overloaded(f"Waited more than {self.max_wait_s * 2:.0f}s for a {self.name} slot.",
+                          max(1, math.ceil(self.max_wait_s)), self.name, tenant)
+
+    def _acquire(self, tenant: str, interactive: bool) -> _Ticket:
+        ticket = _Ticket()
+        if self._enqueue(ticket, tenant, interactive):
+            return ticket
+        if ticket.event.wait(self.max_wait_s * 2 if interactive else None) or not self._abandon(ticket, tenant):
+            return ticket
+        raise self._timed_out(tenant)
+
+    async def _acquire_async(self, tenant: str, interactive: bool) -> _Ticket:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = _Ticket(on_grant=wake)
+        if self._enqueue(ticket, tenant, interactive):
+            return ticket
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait_s * 2 if interactive else None)
+            return ticket
+        except asyncio.TimeoutError:
+            if not self._abandon(ticket, tenant):
+                return ticket
+            raise self._timed_out(tenant)
+        except asyncio.CancelledError:  # client went away while queued
+            if not self._abandon(ticket, tenant, timed_out=False):
+                self._release(tenant, 0.0)
+            raise
+
+    def _release(self, tenant: str, service_ms: float):
+        with self._lock:
+            t = self._tenants[tenant]
+            t.running -= 1
+            t.services.append(service_ms)
+            self.running -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, db_name: str = None):
+        """Holds one unit of this resource's budget; yields the ticket (`.queue_ms`)."""
+        tenant = current_tenant(db_name)
+        ticket = self._acquire(tenant, interactive=_request.get() is not None)
+        start = time.perf_counter()
+        try:
+            yield ticket
+        finally:
+            self._release(tenant, (time.perf_counter() - start) * 1000)
+
+    @asynccontextmanager
+    async def aslot(self, db_name: str = None):
+        """slot() for async handlers: waiting for the grant does not hold a thread."""
+        tenant = current_tenant(db_name)
+        ticket = await self._acquire_async(tenant, interactive=_request.get() is not None)
+        start = time.perf_counter()
+        try:
+            yield ticket
+        finally:
+            self._release(tenant, (time.perf_counter() - start) * 1000)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tenants = {
+                t.name: {
+                    "weight": t.weight,
+                    "running": t.running,
+                    "queued": len(t.queue),
+                    "admitted": t.admitted,
+                    "shed": t.shed,
+                    "timeouts": t.timeouts,
+                    "queue_ms_p50": _pct(t.waits, 0.5),
+                    "queue_ms_p95": _pct(t.waits, 0.95),
+                    "queue_ms_max": round(max(t.waits), 1) if t.waits else None,
+                    "service_ms_avg": round(sum(t.services) / len(t.services), 1) if t.services else None,
+                }
+                for t in self._tenants.values()
+            }
+            return {"capacity": self.capacity, "per_tenant": self.per_tenant, "running": self.running,
+                    "queued": sum(t["queued"] for t in tenants.values()), "tenants": tenants}
+
+
+# --- process-wide schedulers ---
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def register_scheduler(scheduler: FairScheduler):
+    with _schedulers_lock:
+        _schedulers[scheduler.name] = scheduler
+
+
+def get_scheduler(name: str = "db") -> FairScheduler:
+    """The "db" scheduler is created here; "llm" is registered by the shared LLM gateway."""
+    with _schedulers_lock:
+        if name not in _schedulers and name == "db":
+            _schedulers[name] = FairScheduler("db", SCHED_DB_CONCURRENCY, SCHED_DB_PER_TENANT)
+        return _schedulers[name]
+
+
+def scheduler_stats() -> dict:
+    get_scheduler("db")
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {"tenant_by": SCHED_TENANT, **{name: s.stats() for name, s in schedulers.items()}}
+
+
+# --- FastAPI glue ---
+async def scheduler_middleware(request, call_next):
+    """Marks work done on behalf of an HTTP request (sheddable) and carries the caller's API key."""
+    token = _request.set({"api_key": request.headers.get("x-api-key")})
+    try:
+        return await call_next(request)
+    finally:
+        _request.reset(token)
+
+
+async def overloaded_handler(request, exc: Overloaded):
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={"status": "error", "detail": str(exc), "resource": exc.resource, "retry_after": exc.retry_after},
+    )
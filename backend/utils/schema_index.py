@@ -0,0 +1,284 @@
+# utils/schema_index.py
+from sqlalchemy import inspect, text
+from utils.db import get_engine_for_db
+from utils.embeddings import get_embedding_model
+from utils.vector_snapshots import get_reader, writer_lock, publish_snapshot, read_current_version
+import numpy as np
+import os, re, time, hashlib, threading, traceback
+
+# v2: one row per table + one row per column (name, type, sample values)
+SCHEMA_INDEX_FORMAT = 2
+COLUMN_PRUNE_MIN = int(os.getenv("COLUMN_PRUNE_MIN", "8"))   # tables this narrow are sent whole
+COLUMN_TOP_K = int(os.getenv("COLUMN_TOP_K", "8"))           # best-scoring columns kept per wide table
+SAMPLE_ROWS = 5
+SCHEMA_STALE_CHECK_S = float(os.getenv("SCHEMA_STALE_CHECK_S", "30"))  # 0 = compare on every request
+
+_stale_checked = {}  # db_name → monotonic time of the last freshness check (per worker)
+_stale_lock = threading.Lock()
+
+
+def schema_index_name(db_name: str) -> str:
+    return f"schema_{db_name}"
+
+
+def _table_doc(table: str, col_names: list, col_types: list) -> str:
+    return f"Table: {table}\nColumns: {', '.join(col_names)}\nTypes: {', '.join(col_types)}"
+
+
+def _column_doc(table: str, column: str, col_type: str, samples: list) -> str:
+    sample_str = f" e.g. {', '.join(samples)}" if samples else ""
+    return f"Column: {column} ({col_type}) in table {table}{sample_str}"
+
+
+def _sample_values(conn, table: str, col_names: list) -> dict:
+    """Up to 3 distinct short sample values per column from one small scan of the table."""
+    try:
+        rows = conn.execute(text(f"SELECT * FROM `{table}` LIMIT {SAMPLE_ROWS}")).mappings().all()
+    except Exception as e:
+        print(f"[Schema Index] ⚠️ Could not sample '{table}': {e}")
+        return {}
+    samples = {}
+    for col in col_names:
+        vals = []
+        for row in rows:
+            v = row.get(col)
+            if v is None:
+                continue
+            v = str(v).strip()[:40]
+            if v and v not in vals:
+                vals.append(v)
+            if len(vals) == 3:
+                break
+        samples[col] = vals
+    return samples
+
+
+def _table_key_columns(inspector, table: str) -> list:
+    keys = []
+    try:
+        keys += inspector.get_pk_constraint(table).get("constrained_columns") or []
+        for fk in inspector.get_foreign_keys(table):
+            keys += fk.get("constrained_columns") or []
+    except Exception:
+        pass
+    return list(dict.fromkeys(keys))
+
+
+def live_table_fingerprints(engine, db_name: str) -> dict:
+    """{table: hash of its columns (name, type, key) in order}, from one information_schema query."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = :db ORDER BY TABLE_NAME, ORDINAL_POSITION"
+        ), {"db": db_name}).fetchall()
+    hashes = {}
+    for table, column, col_type, key in rows:
+        hashes.setdefault(table, hashlib.sha1()).update(f"{column} {col_type} {key}\n".encode("utf-8"))
+    return {t: h.hexdigest() for t, h in hashes.items()}
+
+
+def sync_schema_index(db_name: str, tables: list = None):
+    """
+    Incrementally synchronize the schema snapshot with the live DB schema (single writer):
+    - One row per table + one row per column (name, type, sample values)
+    - Adds new tables, removes deleted ones, re-embeds only modified docs
+    - `tables` limits the inspection to those tables (others are carried over as-is)
+    - Publishes a new version only when something changed
+    ✅ Returns the current Snapshot for immediate querying.
+    """
+    name = schema_index_name(db_name)
+    try:
+        with writer_lock(name):
+            current = get_reader(name).get(force=True)
+            if current is not None and current.meta.get("format") != SCHEMA_INDEX_FORMAT:
+                current = None  # older layout → rebuild everything once
+            old_records = current.records if current is not None else []
+            old_vectors = np.asarray(current.vectors) if current is not None else None
+            old_by_key = {(r.get("kind", "table"), r["table"], r.get("column")): i for i, r in enumerate(old_records)}
+            old_tables = {r["table"] for r in old_records}
+
+            # 1️⃣ Fetch live DB schema
+            engine = get_engine_for_db(db_name)
+            live_fingerprints = live_table_fingerprints(engine, db_name)
+            inspector = inspect(engine)
+            live_tables = inspector.get_table_names()
+            to_inspect = set(live_tables if tables is None else [t for t in live_tables if t in set(tables)])
+
+            # 2️⃣ Build table + column records (re-using vectors of unchanged docs)
+            records, vectors, pending = [], [], []
+            added, updated = 0, 0
+
+            def keep_or_embed(record, key):
+                nonlocal updated
+                old_idx = old_by_key.get(key)
+                if old_idx is not None and old_records[old_idx].get("doc") == record["doc"]:
+                    vectors.append(old_vectors[old_idx])
+                else:
+                    pending.append(len(records))
+                    vectors.append(None)
+                    if old_idx is not None and key[0] == "table":
+                        updated += 1
+                records.append(record)
+
+            with engine.connect() as conn:
+                for table in live_tables:
+                    if table not in to_inspect and table in old_tables:
+                        for i, r in enumerate(old_records):
+                            if r["table"] == table:
+                                records.append(r)
+                                vectors.append(old_vectors[i])
+                        continue
+
+                    cols = inspector.get_columns(table)
+                    col_names = [col["name"] for col in cols]
+                    col_types = [str(col["type"]) for col in cols]
+                    samples = _sample_values(conn, table, col_names)
+                    if table not in old_tables:
+                        added += 1
+
+                    keep_or_embed(
+                        {"kind": "table", "table": table, "doc": _table_doc(table, col_names, col_types),
+                         "columns": col_names, "types": col_types, "keys": _table_key_columns(inspector, table)},
+                        ("table", table, None),
+                    )
+                    for col, typ in zip(col_names, col_types):
+                        keep_or_embed(
+                            {"kind": "column", "table": table, "column": col, "type": typ,
+                             "samples": samples.get(col, []), "doc": _column_doc(table, col, typ, samples.get(col, []))},
+                            ("column", table, col),
+                        )
+            removed = len(old_tables - set(live_tables))
+            # what the snapshot reflects: re-inspected tables as they are now, the others as before
+            old_fingerprints = current.meta.get("table_fingerprints") or {} if current is not None else {}
+            fingerprints = {t: live_fingerprints.get(t) if t in to_inspect or t not in old_tables else old_fingerprints.get(t)
+                            for t in live_tables}
+
+            # 3️⃣ Embed only new / modified docs, in one batch
+            if pending:
+                new_vecs = np.asarray(get_embedding_model().embed_documents([records[i]["doc"] for i in pending]), dtype=np.float32)
+                new_vecs /= np.clip(np.linalg.norm(new_vecs, axis=1, keepdims=True), 1e-12, None)
+                for j, i in enumerate(pending):
+                    vectors[i] = new_vecs[j]
+
+            if current is not None and not (pending or removed or len(records) != len(old_records)) \
+                    and old_fingerprints == fingerprints:
+                print(f"[Schema Index] ⚙️ {name}@{current.version} already up to date")
+                return current
+
+            matrix = np.vstack(vectors) if vectors else np.zeros((0, 384), dtype=np.float32)
+            publish_snapshot(name, matrix, records, meta={"db_name": db_name, "format": SCHEMA_INDEX_FORMAT,
+                                                          "table_fingerprints": fingerprints})
+            print(f"[Schema Index] ✅ {name} → added={added}, updated={updated}, removed={removed}, re-embedded docs={len(pending)}")
+
+    except Exception as e:
+        print(f"[Schema Index] ❌ Error while syncing schema for '{db_name}': {e}")
+        traceback.print_exc()
+
+    # ✅ Return the snapshot so it can be used immediately for similarity search
+    return get_reader(name).get(force=True)
+
+
+def _stale_tables(snapshot, db_name: str) -> list:
+    """Tables whose live columns differ from the snapshot (added, changed or dropped since it was built)."""
+    live = live_table_fingerprints(get_engine_for_db(db_name), db_name)
+    indexed = snapshot.meta.get("table_fingerprints") or {}
+    return sorted(t for t in set(live) | set(indexed) if live.get(t) != indexed.get(t))
+
+
+def get_schema_snapshot(db_name: str):
+    """
+    Reader path used per request: memory-mapped current version, no embedding work.
+    Builds the index if no version has ever been published for this DB. At most every
+    SCHEMA_STALE_CHECK_S, the snapshot is compared with information_schema (one metadata query)
+    and the tables changed behind its back (DDL outside the upload path) are re-synced first.
+    """
+    name = schema_index_name(db_name)
+    snapshot = get_reader(name).get()
+    if snapshot is None and read_current_version(name) is None:
+        return sync_schema_index(db_name)
+    if snapshot is None:
+        return snapshot
+
+    now = time.monotonic()
+    with _stale_lock:
+        if now - _stale_checked.get(db_name, float("-inf")) < SCHEMA_STALE_CHECK_S:
+            return snapshot
+        _stale_checked[db_name] = now
+    try:
+        stale = _stale_tables(snapshot, db_name)
+    except Exception as e:
+        print(f"[Schema Index] ⚠️ Freshness check failed for '{db_name}', using {name}@{snapshot.version}: {e}")
+        return snapshot
+    if stale:
+        print(f"[Schema Index] 🔄 {name}@{snapshot.version} is stale for {stale}, re-syncing")
+        snapshot = sync_schema_index(db_name, tables=stale)
+    return snapshot
+
+
+# --- per-snapshot row masks (computed once per published version) ---
+def _masks(snapshot) -> dict:
+    masks = getattr(snapshot, "_row_masks", None)
+    if masks is None:
+        kinds = np.array([r.get("kind", "table") for r in snapshot.records])
+        tables = np.array([r["table"] for r in snapshot.records])
+        masks = {"table": kinds == "table", "column": kinds == "column", "tables": tables}
+        snapshot._row_masks = masks
+    return masks
+
+
+def table_rows(snapshot) -> np.ndarray:
+    """Row numbers of the table-level vectors (the column-level ones are skipped)."""
+    return np.flatnonzero(_masks(snapshot)["table"])
+
+
+def table_records(snapshot) -> dict:
+    return {r["table"]: r for r in snapshot.records if r.get("kind", "table") == "table"}
+
+
+def search_tables(snapshot, question_vector, k: int = 3) -> list:
+    """Top-k tables → [(score, table_name), ...]."""
+    hits = snapshot.search(question_vector, k=k, mask=_masks(snapshot)["table"])
+    return [(score, snapshot.records[i]["table"]) for score, i in hits]
+
+
+def select_columns(snapshot, table: str, question_vector, question: str, join_columns: set = frozenset(),
+                   top_k: int = COLUMN_TOP_K) -> list:
+    """
+    Column pruning for one chosen table: top-k columns by similarity to the question, plus
+    keys needed for joins (PK/FK, columns shared with the other chosen tables) and columns
+    literally named in the question. Narrow tables are returned whole, and so is every table
+    when there is no question vector (lexical fast path): keys + literal names alone can leave
+    the prompt without the columns the SQL needs. Original order kept.
+    """
+    rec = table_records(snapshot).get(table)
+    if rec is None:
+        return []
+    all_cols = rec["columns"]
+    if len(all_cols) <= COLUMN_PRUNE_MIN or question_vector is None:
+        return list(all_cols)
+
+    masks = _masks(snapshot)
+    keep = set(rec.get("keys") or []) | {c for c in all_cols if c in join_columns}
+    words = set(re.findall(r"[a-z0-9_]+", question.lower()))
+    keep |= {c for c in all_cols if c.lower() in words or c.lower().replace("_", " ") in question.lower()}
+    hits = snapshot.search(question_vector, k=top_k, mask=masks["column"] & (masks["tables"] == table))
+    keep |= {snapshot.records[i]["column"] for _, i in hits}
+    return [c for c in all_cols if c in keep]
+
+
+# --- prompt token accounting ---
+_encoder = None
+
+
+def count_tokens(text_: str) -> int:
+    """tiktoken cl100k_base when available (close enough for Gemini budgeting), else ~4 chars/token."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text_))
+    return max(1, len(text_) // 4)
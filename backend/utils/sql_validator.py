@@ -0,0 +1,113 @@
+# utils/sql_validator.py
+"""
+Local pre-execution check of LLM-generated SQL against the cached schema catalog.
+Catches invented tables / columns before the query ever reaches MySQL.
+"""
+import difflib
+import threading
+
+# Counters behind /api/debug/sql-validation: every `invalid` caught here is a failed MySQL
+# round trip (plus a user re-ask → another LLM call) that did not happen.
+VALIDATION_STATS = {"checked": 0, "skipped": 0, "invalid": 0, "repaired": 0, "unrepaired": 0}
+_stats_lock = threading.Lock()
+
+
+def record_stat(key: str, n: int = 1):
+    with _stats_lock:
+        VALIDATION_STATS[key] = VALIDATION_STATS.get(key, 0) + n
+
+
+def _closest(name: str, candidates, n: int = 3) -> list:
+    lowered = {c.lower(): c for c in candidates}
+    return [lowered[m] for m in difflib.get_close_matches(name.lower(), list(lowered), n=n, cutoff=0.5)]
+
+
+def validate_sql(sql: str, catalog: dict) -> dict:
+    """
+    Parse `sql` (MySQL dialect) and check every table and column against `catalog`
+    ({table: [columns]}). Returns {valid, issues, skipped?}; each issue carries the
+    offending identifier and its closest matches.
+    """
+    try:
+        import sqlglot
+        from sqlglot import exp
+    except ImportError:
+        return {"valid": True, "issues": [], "skipped": "sqlglot not installed"}
+
+    try:
+        tree = sqlglot.parse_one(sql.replace("%%", "%"), read="mysql")
+    except Exception as e:
+        # A parser disagreement is not proof the SQL is wrong; let MySQL be the judge
+        return {"valid": True, "issues": [], "skipped": f"unparseable: {e}"}
+
+    tables_ci = {t.lower(): t for t in catalog}
+    columns_ci = {t: {c.lower() for c in cols} for t, cols in catalog.items()}
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    derived = {sq.alias_or_name.lower() for sq in tree.find_all(exp.Subquery) if sq.alias_or_name}
+    select_aliases = {a.alias.lower() for a in tree.find_all(exp.Alias) if a.alias}
+
+    issues, alias_map, referenced = [], {}, []
+    for tbl in tree.find_all(exp.Table):
+        name = tbl.name
+        if not name or name.lower() in cte_names:
+            continue
+        real = tables_ci.get(name.lower())
+        if real is None:
+            if not any(i["identifier"] == name for i in issues):
+                issues.append({"kind": "table", "identifier": name, "suggestions": _closest(name, catalog)})
+            continue
+        referenced.append(real)
+        alias_map[(tbl.alias or name).lower()] = real
+        alias_map[name.lower()] = real
+
+    unverifiable_sources = bool(cte_names or derived)
+    for col in tree.find_all(exp.Column):
+        name = col.name
+        if not name or isinstance(col.this, exp.Star):
+            continue
+        qualifier = (col.table or "").lower()
+        if qualifier:
+            real = alias_map.get(qualifier)
+            if real is None:
+                continue  # CTE / derived table / unknown alias (already reported as a table issue)
+            if name.lower() not in columns_ci[real]:
+                issues.append({"kind": "column", "identifier": name, "table": real,
+                               "suggestions": _closest(name, catalog[real])})
+            continue
+        if name.lower() in select_aliases or unverifiable_sources:
+            continue
+        if referenced and not any(name.lower() in columns_ci[t] for t in referenced):
+            pool = [c for t in referenced for c in catalog[t]]
+            issues.append({"kind": "column", "identifier": name, "table": ", ".join(sorted(set(referenced))),
+                           "suggestions": _closest(name, pool)})
+
+    # de-duplicate (same identifier reported from several places)
+    seen, unique = set(), []
+    for i in issues:
+        key = (i["kind"], i["identifier"].lower(), i.get("table"))
+        if key not in seen:
+            seen.add(key)
+            unique.append(i)
+    return {"valid": not unique, "issues": unique}
+
+
+def build_repair_prompt(sql: str, issues: list) -> str:
+    """Targeted repair: only the offending identifiers and their closest real matches."""
+    lines = []
+    for i in issues:
+        hint = f" — closest: {', '.join(i['suggestions'])}" if i["suggestions"] else " — no close match exists"
+        if i["kind"] == "table":
+            lines.append(f"- table `{i['identifier']}` does not exist{hint}")
+        else:
+            lines.append(f"- column `{i['identifier']}` does not exist in `{i['table']}`{hint}")
+    return f"""
+The following MySQL query references identifiers that do not exist in the database:
+
+{sql}
+
+Problems:
+{chr(10).join(lines)}
+
+Fix only these identifiers (use the closest matches where they fit the intent) and keep the rest of the query unchanged.
+Return only the SQL, no markdown or commentary.
+"""
@@ -0,0 +1,202 @@
+# utils/vector_snapshots.py
+"""
+Immutable, versioned vector index snapshots shared by all uvicorn workers.
+
+Layout (one directory per index, e.g. "schema_<db>", "fewshot"):
+    {VECTOR_INDEX_DIR}/{name}/v000007/vectors.npy   float32, L2-normalized rows
+    {VECTOR_INDEX_DIR}/{name}/v000007/records.json  one record per row + metadata
+    {VECTOR_INDEX_DIR}/{name}/CURRENT               "v000007" (swapped atomically)
+    {VECTOR_INDEX_DIR}/{name}/.writer.lock          held by the single writer
+
+- Writers take the file lock, write a new version directory, then os.replace() CURRENT
+- Readers memory-map vectors.npy, so N workers share one copy through the page cache
+- Old versions stay on disk (KEEP_VERSIONS) so in-flight readers never see a torn index
+"""
+import os, json, time, shutil, threading, contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to an in-process lock
+    fcntl = None
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./vector_index")
+KEEP_VERSIONS = int(os.getenv("VECTOR_INDEX_KEEP_VERSIONS", "3"))
+RECHECK_SECONDS = float(os.getenv("VECTOR_INDEX_RECHECK_SECONDS", "1.0"))
+
+
+class Snapshot:
+    """A read-only view of one published version."""
+
+    def __init__(self, name: str, version: str, vectors: np.ndarray, records: list, meta: dict):
+        self.name = name
+        self.version = version
+        self.vectors = vectors
+        self.records = records
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query_vector, k: int = 3, mask: np.ndarray = None) -> list:
+        """Vectorized cosine top-k over (optionally masked) rows → [(score, row_idx), ...]."""
+        n = len(self.records)
+        if n == 0 or k <= 0:
+            return []
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        scores = np.asarray(self.vectors @ q)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            n = int(mask.sum())
+        k = min(k, n)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+def _index_dir(name: str) -> str:
+    return os.path.join(VECTOR_INDEX_DIR, name)
+
+
+def _current_path(name: str) -> str:
+    return os.path.join(_index_dir(name), "CURRENT")
+
+
+def read_current_version(name: str):
+    try:
+        with open(_current_path(name), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# --- single-writer lock (cross-process) ---
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def writer_lock(name: str, blocking: bool = True):
+    """
+    Cross-process exclusive lock for publishing `name`.
+    Yields True if acquired, False if non-blocking and another writer holds it.
+    """
+    os.makedirs(_index_dir(name), exist_ok=True)
+    with _local_locks_guard:
+        local = _local_locks.setdefault(name, threading.Lock())
+    if not local.acquire(blocking=blocking):
+        yield False
+        return
+    fh = None
+    try:
+        if fcntl is not None:
+            fh = open(os.path.join(_index_dir(name), ".writer.lock"), "a+")
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+        yield True
+    finally:
+        if fh is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            finally:
+                fh.close()
+        local.release()
+
+
+def publish_snapshot(name: str, vectors: np.ndarray, records: list, meta: dict = None) -> str:
+    """
+    Write a new immutable version and atomically point CURRENT at it.
+    Must be called while holding writer_lock(name).
+    """
+    base = _index_dir(name)
+    os.makedirs(base, exist_ok=True)
+    existing = sorted(d for d in os.listdir(base) if d.startswith("v") and d[1:].isdigit())
+    next_no = int(existing[-1][1:]) + 1 if existing else 1
+    version = f"v{next_no:06d}"
+
+    tmp_dir = os.path.join(base, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(tmp_dir, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+    with open(os.path.join(tmp_dir, "records.json"), "w", encoding="utf-8") as f:
+        json.dump({"records": records, "meta": {**(meta or {}), "published_at": time.time()}}, f)
+    os.rename(tmp_dir, os.path.join(base, version))
+
+    tmp_current = _current_path(name) + f".tmp-{os.getpid()}"
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_current, _current_path(name))  # ← the atomic swap readers observe
+
+    keep = KEEP_VERSIONS - 1
+    for old in (existing[:-keep] if keep > 0 else existing):
+        shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+
+    print(f"[VectorIndex] ✅ Published {name}@{version} ({len(records)} rows)")
+    return version
+
+
+def load_snapshot(name: str, version: str) -> Snapshot:
+    vdir = os.path.join(_index_dir(name), version)
+    with open(os.path.join(vdir, "records.json"), "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    vectors = np.load(os.path.join(vdir, "vectors.npy"), mmap_mode="r")
+    return Snapshot(name, version, vectors, payload.get("records", []), payload.get("meta", {}))
+
+
+class SnapshotReader:
+    """
+    Per-process handle that follows CURRENT.
+    Re-reads the pointer at most every RECHECK_SECONDS; a new version is mapped on change.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._snapshot is not None and now - self._checked_at < RECHECK_SECONDS:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            version = read_current_version(self.name)
+            if version is None:
+                self._snapshot = None
+            elif self._snapshot is None or self._snapshot.version != version:
+                try:
+                    self._snapshot = load_snapshot(self.name, version)
+                except FileNotFoundError:
+                    # version pruned between reading CURRENT and opening it → retry once
+                    version = read_current_version(self.name)
+                    self._snapshot = load_snapshot(self.name, version) if version else None
+            return self._snapshot
+
+
+_readers = {}
+_readers_guard = threading.Lock()
+
+
+def get_reader(name: str) -> SnapshotReader:
+    with _readers_guard:
+        if name not in _readers:
+            _readers[name] = SnapshotReader(name)
+        return _readers[name]
+
+
+def list_indexes(prefix: str = "") -> list:
+    if not os.path.isdir(VECTOR_INDEX_DIR):
+        return []
+    return sorted(
+        d for d in os.listdir(VECTOR_INDEX_DIR)
+        if d.startswith(prefix) and os.path.exists(_current_path(d))
+    )
@@ -7,6 +7,8 @@ from components.nl_query import nl_query_ui
 from components.sql_editor import sql_editor_ui
 from components.followup import followup_ui
 from components.result_viewer import show_result_summary
+from components.debug_panel import timing_panel
+from utils.api import start_timing_run
 
 st.set_page_config(
     page_title="NL2SQL Intelligence",
@@ -18,6 +20,7 @@ st.title("NL2SQL Dashboard")
 
 
 # Sidebar
+start_timing_run()
 db_selected = sidebar_ui()
 
 # Two columns for query & results
@@ -33,3 +36,6 @@ with col2:
     if "last_sql" in st.session_state and st.session_state["last_sql"]:
         sql_query = st.session_state["last_sql"]
         show_result_summary(sql_query, db_selected)
+
+# Per-run API timings (cache / 304 / network)
+timing_panel()
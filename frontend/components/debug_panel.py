@@ -0,0 +1,21 @@
+import time
+import streamlit as st
+
+
+def timing_panel():
+    """Sidebar expander listing this run's backend calls: duration and where the answer came from."""
+    timings = st.session_state.get("api_timings", [])
+    started = st.session_state.get("api_run_started")
+    with st.sidebar.expander("⏱️ API timings", expanded=False):
+        if not timings:
+            st.caption("No backend calls in this run.")
+            return
+        st.dataframe(
+            [{"call": t["call"], "ms": t["ms"], "source": t["source"], "status": t.get("status")} for t in timings],
+            use_container_width=True,
+        )
+        network = sum(1 for t in timings if t["source"] == "network")
+        line = f"{len(timings)} call(s), {network} over the network, {sum(t['ms'] for t in timings):.0f} ms in requests"
+        if started:
+            line += f" · run so far {(time.perf_counter() - started) * 1000:.0f} ms"
+        st.caption(line)
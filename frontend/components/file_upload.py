@@ -1,13 +1,44 @@
 import streamlit as st
-from utils.api import upload_file
+from utils.api import upload_buffer
 
 def upload_ui(db_selected):
     st.subheader("Upload Table")
-    uploaded_file = st.file_uploader("Upload Excel/CSV", type=["xlsx","xls","csv"])
+    uploaded_file = st.file_uploader("Upload Excel/CSV/PDF", type=["xlsx","xls","csv","pdf"])
     table_name = st.text_input("Optional table name")
+    if_exists = st.selectbox("If table exists", ["replace", "append", "upsert", "fail"])
+    key_columns = None
+    if if_exists == "upsert":
+        key_columns = st.text_input("Key columns (comma-separated, detected if empty)") or None
     if uploaded_file and st.button("Ingest Table"):
-        with open("temp_upload.xlsx","wb") as f:
-            f.write(uploaded_file.getbuffer())
-            result = upload_file("temp_upload.xlsx", table_name, db_selected["db_name"])
+        # streamed in chunks straight from the upload buffer; an interrupted upload of the same
+        # file resumes where the server left off (upload id kept per file in this session)
+        resume_key = f"upload::{uploaded_file.name}::{uploaded_file.size}"
+        bar = st.progress(0.0, text="Uploading…")
+
+        def on_progress(sent, total, upload_id):
+            st.session_state[resume_key] = upload_id
+            bar.progress(sent / total, text=f"Uploading… {sent // 1024:,} / {total // 1024:,} KiB")
+
+        result = upload_buffer(uploaded_file.getbuffer(), uploaded_file.name, table_name, db_selected["db_name"],
+                               if_exists, key_columns, upload_id=st.session_state.get(resume_key),
+                               on_progress=on_progress)
+        bar.empty()
+        if result.get("status") != "success":
+            st.error(f"Upload failed: {result.get('error')}")
+            return
+        st.session_state.pop(resume_key, None)
         st.success(f"Table created: {result.get('table_name')}")
+        upsert = result.get("upsert")
+        if upsert:
+            st.caption(f"🔑 Key {upsert['key_columns']}: inserted {upsert['inserted']}, "
+                       f"updated {upsert['updated']}, skipped {upsert['skipped']}")
+        quality = result.get("quality")
+        if quality and quality.get("flagged_cells"):
+            flagged = {c: v["anomalies"] for c, v in quality["columns"].items() if v.get("anomalies")}
+            st.warning(f"⚠️ {quality['flagged_cells']} suspicious cell(s): " +
+                       "; ".join(f"{c}: {', '.join(f'{k}={n}' for k, n in a.items())}" for c, a in flagged.items()))
+        pdf = result.get("pdf")
+        if pdf:
+            st.caption(f"📄 {pdf['pages']} pages → {pdf['tables_found']} table(s) in {pdf['elapsed_s']}s "
+                       f"({pdf['pages_per_sec']} pages/s on {pdf['workers']} workers)")
         st.write(result)
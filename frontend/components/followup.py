@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from utils.api import nl_to_sql, execute_sql  # ✅ use your unified API helpers
+from utils.api import nl_to_sql, execute_sql, session_ask, session_execute  # ✅ use your unified API helpers
 
 def followup_ui(db_selected):
     """
@@ -39,18 +39,21 @@ def followup_ui(db_selected):
 
         with st.spinner("Generating follow-up SQL using Gemini..."):
             try:
-                # ✅ Call the same /nl2sql API but give extra context (previous query)
-                context_question = f"""
-                Previous SQL Query: {st.session_state.last_sql}
-                Follow-up Question: {followup}
-                """
-
-                # --- Use your existing API helper ---
-                sql_result = nl_to_sql(
-                    context_question,
-                    db_selected["db_name"],
-                    db_selected["table_name"]
-                )
+                session_id = st.session_state.get("session_id")
+                if session_id:
+                    # ✅ Server-side session: no retrieval, delta prompt, maybe answered from the cached result
+                    sql_result = session_ask(session_id, followup)
+                else:
+                    # Fallback: call the same /nl2sql API but give extra context (previous query)
+                    context_question = f"""
+                    Previous SQL Query: {st.session_state.last_sql}
+                    Follow-up Question: {followup}
+                    """
+                    sql_result = nl_to_sql(
+                        context_question,
+                        db_selected["db_name"],
+                        db_selected["table_name"]
+                    )
 
                 followup_sql = sql_result.get("sql_query")
                 st.session_state.last_followup_sql = followup_sql
@@ -62,9 +65,16 @@ def followup_ui(db_selected):
                 st.success("✅ Generated SQL for follow-up:")
                 st.code(followup_sql, language="sql")
 
-                # --- (Optional) Run the follow-up query immediately ---
-                with st.spinner("Running follow-up query..."):
-                    result = execute_sql(followup_sql, db_selected["db_name"])
+                # --- Run the follow-up query (LOCAL answers already carry their rows) ---
+                if sql_result.get("mode") == "LOCAL":
+                    st.caption("⚡ Answered from the cached previous result (no database query)")
+                    result = sql_result
+                elif session_id:
+                    with st.spinner("Running follow-up query..."):
+                        result = session_execute(session_id, followup_sql)
+                else:
+                    with st.spinner("Running follow-up query..."):
+                        result = execute_sql(followup_sql, db_selected["db_name"])
 
                 if result.get("status") == "success":
                     df = pd.DataFrame(result["rows"])
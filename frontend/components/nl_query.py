@@ -1,5 +1,51 @@
 import streamlit as st
-from utils.api import nl_to_sql
+import pandas as pd
+from utils.api import create_session, session_ask, ask_stream
+
+
+def _ask_and_run(question, db_selected):
+    """One round trip: SQL, rows, summary and chart are rendered as their sections stream in."""
+    session = create_session(db_selected["db_name"], db_selected["table_name"])
+    st.session_state["session_id"] = session.get("session_id")
+    sql_box, status_box, table_box, timing_box = st.empty(), st.empty(), st.empty(), st.empty()
+    status_box.info("Generating SQL...")
+    columns, rows = [], []
+    st.session_state.last_summary = st.session_state.last_chart = None
+
+    for section in ask_stream(question, db_selected["db_name"], db_selected["table_name"],
+                              session_id=st.session_state["session_id"]):
+        kind = section["section"]
+        if kind == "sql":
+            sql_box.code(section["sql_query"], language="sql")
+            st.session_state["last_sql"] = section["sql_query"]
+            st.session_state["last_question"] = question
+            status_box.info("Running query...")
+        elif kind == "result":
+            columns = section["columns"]
+            if section.get("truncated"):
+                st.warning(f"Result truncated to the first {section['row_count']} rows.")
+            for w in (section.get("governor") or {}).get("warnings", []):
+                st.warning(f"⚠️ Expensive query: {w}")
+            status_box.info("Streaming rows · summarizing...")
+        elif kind == "rows":
+            rows.extend(section["rows"])
+            table_box.dataframe(pd.DataFrame(rows, columns=columns))
+        elif kind == "chart":
+            st.session_state.last_chart = section.get("chart_json")
+        elif kind == "summary":
+            st.session_state.last_summary = section.get("summary")
+        elif kind == "error":
+            status_box.error(f"{section.get('stage')}: {section.get('detail')}")
+        elif kind == "done":
+            if columns:
+                status_box.empty()
+            timings = section.get("timings", {})
+            timing_box.caption(" · ".join(f"{k.replace('_ms', '')} {v:.0f} ms" for k, v in timings.items()
+                                          if k.endswith("_ms") and "." not in k))
+
+    if columns:
+        st.session_state.last_result_df = pd.DataFrame(rows, columns=columns)
+
 
 def nl_query_ui(db_selected):
     """
@@ -11,21 +57,36 @@ def nl_query_ui(db_selected):
     # Input field for the user's question
     question = st.text_input("Enter your question here")
 
+    generate_col, run_col = st.columns(2)
+    generate = generate_col.button("Generate SQL")
+    ask_run = run_col.button("⚡ Ask & Run")
+
+    # One request: generate, validate, execute and summarize on the server
+    if question and ask_run:
+        _ask_and_run(question, db_selected)
+
     # When user clicks Generate SQL
-    if question and st.button("Generate SQL"):
+    if question and generate:
         with st.spinner("Generating SQL from your question..."):
-            # ✅ Pass both db_name and table_name to backend
-            sql_result = nl_to_sql(
-                question,
-                db_selected["db_name"],
-                db_selected["table_name"]
-            )
+            # ✅ Each main question starts a new server-side session (follow-ups reuse its context)
+            session = create_session(db_selected["db_name"], db_selected["table_name"])
+            st.session_state["session_id"] = session.get("session_id")
+            sql_result = session_ask(st.session_state["session_id"], question)
 
         # ✅ Display result
         if sql_result.get("status") == "success":
             sql_query = sql_result.get("sql_query")
             st.code(sql_query, language="sql")
+
+            # Pre-execution validation against the schema catalog
+            validation = sql_result.get("validation") or {}
+            if validation.get("repaired"):
+                st.caption("🛠️ Unknown tables/columns were auto-corrected before execution.")
+            elif not validation.get("valid", True):
+                issues = ", ".join(i["identifier"] for i in validation.get("remaining_issues") or validation.get("issues", []))
+                st.warning(f"SQL references unknown identifiers: {issues}")
             st.session_state["last_sql"] = sql_query
+            st.session_state["last_question"] = question
         else:
             error_msg = sql_result.get("error", "Failed to generate SQL query.")
             st.error(error_msg)
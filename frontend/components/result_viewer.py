@@ -1,9 +1,7 @@
 import streamlit as st
-import requests
 import json
 import plotly.graph_objects as go
-
-BASE_URL = "http://localhost:8000/api"
+from utils.api import summarize
 
 def show_result_summary(sql_query, db_selected):
     if "last_summary" not in st.session_state:
@@ -14,13 +12,14 @@ def show_result_summary(sql_query, db_selected):
 
     if st.button("🧠 Generate Natural Language Summary"):
         with st.spinner("Generating summary..."):
-            payload = {"sql_query": sql_query, "db_name": db_selected["db_name"]}
-            res = requests.post(f"{BASE_URL}/summarize/", json=payload)
+            res = summarize(sql_query, db_selected["db_name"])
 
             if res.status_code == 200:
                 data = res.json()
                 st.session_state.last_summary = data.get("summary")
                 st.session_state.last_chart = data.get("chart_json")
+                if (data.get("cached") or {}).get("summary"):
+                    st.caption("⚡ Same result as before: summary served from cache.")
                
     if st.session_state.last_summary:
         st.markdown("### 🧠 Summary")
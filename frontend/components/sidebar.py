@@ -1,26 +1,40 @@
 import streamlit as st
-from utils.api import list_databases, list_tables, execute_sql
-from utils.api import BASE_URL
-import requests
+from utils.api import list_databases, list_tables, preview_table, refresh_schema, fetch_parallel
+
+
+def _load_sidebar_data(db_guess, table_guess):
+    """
+    Databases, the tables of the last selected DB and its preview are independent requests:
+    fetch them concurrently (guessing the selection from the previous run), then fill in
+    whatever the guess missed.
+    """
+    calls = {"databases": (list_databases,)}
+    if db_guess:
+        calls["tables"] = (list_tables, db_guess)
+        if table_guess:
+            calls["preview"] = (preview_table, db_guess, table_guess)
+    return fetch_parallel(calls)
+
 
 def sidebar_ui():
     st.sidebar.title("⚙️ Settings")
 
-    
+    db_guess, table_guess = st.session_state.get("sidebar_db"), st.session_state.get("sidebar_table")
+    prefetched = _load_sidebar_data(db_guess, table_guess)
 
     # --- Step 1: Select Database ---
-    db_response = list_databases()
+    db_response = prefetched["databases"]
     databases = db_response.get("databases", [])
     if not databases:
         st.sidebar.warning("No databases found. Please upload a file first.")
         return None
 
-    db_selected = st.sidebar.selectbox("Select Database", databases)
+    db_selected = st.sidebar.selectbox("Select Database", databases, key="sidebar_db")
 
      # --- 🔄 Refresh schema button ---
     if st.sidebar.button("🔄 Refresh Schema & Embeddings"):
         try:
-            r = requests.post(f"{BASE_URL}/refresh/", json={"db_name": db_selected})
+            r = refresh_schema(db_selected)
             if r.status_code == 200:
                 st.sidebar.success(r.json().get("message", "Schema refreshed ✅"))
             else:
@@ -29,25 +43,27 @@ def sidebar_ui():
             st.sidebar.error(f"Error refreshing schema: {e}")
 
     # --- Step 2: Select Table ---
-    table_response = list_tables(db_selected)
+    table_response = prefetched["tables"] if db_selected == db_guess and "tables" in prefetched else list_tables(db_selected)
     tables = table_response.get("tables", [])
     if not tables:
         st.sidebar.warning(f"No tables found in database '{db_selected}'.")
         return {"db_name": db_selected, "table_name": None}
 
-    table_selected = st.sidebar.selectbox("Select Table", tables)
+    table_selected = st.sidebar.selectbox("Select Table", tables, key="sidebar_table")
 
     # --- Step 3: Optional Table Preview ---
     st.sidebar.markdown("### 🔍 Preview Selected Table")
     if table_selected:
         try:
-            preview_sql = f"SELECT * FROM `{table_selected}` LIMIT 5;"
-            result = execute_sql(preview_sql, db_selected)
+            if (db_selected, table_selected) == (db_guess, table_guess) and "preview" in prefetched:
+                result = prefetched["preview"]
+            else:
+                result = preview_table(db_selected, table_selected)
 
             if result.get("status") == "success":
                 st.sidebar.dataframe(result.get("rows"))
             else:
-                st.sidebar.error(result.get("detail", "Failed to load preview."))
+                st.sidebar.error(result.get("detail", result.get("error", "Failed to load preview.")))
 
         except Exception as e:
             st.sidebar.error(f"Error previewing table: {e}")
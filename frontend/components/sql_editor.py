@@ -1,5 +1,7 @@
+import time
 import streamlit as st
-from utils.api import execute_sql
+from utils.api import (execute_sql, save_example, session_execute, start_export, export_status, export_download_url,
+                       export_bytes, EXPORT_PROXY_MAX_BYTES)
 import pandas as pd
 
 def sql_editor_ui(db_selected):
@@ -8,9 +10,34 @@ def sql_editor_ui(db_selected):
     if "last_sql" in st.session_state:
         edited_sql = st.text_area("Edit SQL if needed", value=st.session_state["last_sql"])
 
+        # ✅ Let the user confirm a good question → SQL pair for few-shot learning
+        if st.session_state.get("last_question") and st.button("👍 Save as Example"):
+            result = save_example(st.session_state["last_question"], edited_sql, db_selected["db_name"])
+            if result.get("status") == "success":
+                st.success(f"Example {result.get('action')} (library size: {result.get('size')})")
+            else:
+                st.error(result.get("detail", "Failed to save example."))
+
+        # ✅ Full results go to a file on the backend (no row cap, streamed in batches)
+        with st.expander("📦 Export full result"):
+            fmt = st.selectbox("Format", ["csv", "parquet", "xlsx"], key="export_format")
+            gz = st.checkbox("gzip", key="export_gzip", disabled=fmt == "xlsx")
+            if st.button("Prepare export"):
+                started = start_export(edited_sql, db_selected["db_name"], fmt, gz and fmt != "xlsx")
+                if started.get("status") != "success":
+                    st.error(started.get("detail", "Export failed."))
+                else:
+                    st.session_state["export_id"] = started["export"]["export_id"]
+            if st.session_state.get("export_id"):
+                _export_progress(st.session_state["export_id"])
+
         if st.button("Run SQL"):
             with st.spinner("Running query..."):
-                result = execute_sql(edited_sql, db_selected["db_name"])
+                # ✅ Inside a session the backend keeps this result for local follow-ups
+                if st.session_state.get("session_id"):
+                    result = session_execute(st.session_state["session_id"], edited_sql)
+                else:
+                    result = execute_sql(edited_sql, db_selected["db_name"])
 
             # --- Handle backend errors gracefully ---
             if result.get("status") != "success":
@@ -22,6 +49,12 @@ def sql_editor_ui(db_selected):
                 st.warning("No data returned from the query.")
                 return
 
+            # --- Governor feedback (row cap / cost guard) ---
+            if result.get("truncated"):
+                st.warning(f"Result truncated to the first {len(rows)} rows.")
+            for w in (result.get("governor") or {}).get("warnings", []):
+                st.warning(f"⚠️ Expensive query: {w}")
+
             # ✅ Convert result into DataFrame
             df = pd.DataFrame(rows)
             st.dataframe(df)
@@ -34,3 +67,34 @@ def sql_editor_ui(db_selected):
             numeric_cols = df.select_dtypes(include="number").columns
             if len(numeric_cols):
                 st.line_chart(df[numeric_cols])
+
+
+def _export_progress(export_id):
+    """
+    Polls the export until it finishes, then links the browser to the backend download
+    (PUBLIC_API_URL), or serves the file through Streamlit when the backend is not public.
+    """
+    progress = st.empty()
+    while True:
+        result = export_status(export_id)
+        export = result.get("export")
+        if not export:
+            st.session_state.pop("export_id", None)
+            progress.error(result.get("detail", "Export not found."))
+            return
+        if export["status"] != "running":
+            break
+        progress.info(f"Exporting… {export['rows']:,} rows written")
+        time.sleep(1)
+    if export["status"] != "done":
+        progress.error(export.get("error") or f"Export {export['status']}.")
+        return
+    progress.success(f"{export['rows']:,} rows, {export['bytes'] / 1e6:.1f} MB in {export['elapsed_s']}s")
+    label, url = f"⬇️ Download {export['filename']}", export_download_url(export_id)
+    if url:
+        st.link_button(label, url)
+    elif export["bytes"] <= EXPORT_PROXY_MAX_BYTES:
+        st.download_button(label, export_bytes(export_id), file_name=export["filename"])
+    else:
+        st.warning(f"The export is larger than {EXPORT_PROXY_MAX_BYTES / 1e6:.0f} MB: set PUBLIC_API_URL so the "
+                   f"browser can download it from the backend directly.")
@@ -1,28 +1,258 @@
+import os
+import time
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # older / newer layouts: worker threads just run without the script context
+    add_script_run_ctx = get_script_run_ctx = None
 
 BASE_URL = "http://127.0.0.1:8000/api"
+# The backend as the *browser* reaches it (public host / reverse proxy); BASE_URL is only
+# reachable from the Streamlit server. Unset: export downloads are proxied through Streamlit.
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "").rstrip("/") or None
+EXPORT_PROXY_MAX_BYTES = int(os.getenv("EXPORT_PROXY_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_TTL_SECONDS = 30          # metadata is served from st.cache_data this long, then revalidated by ETag
+REQUEST_TIMEOUT = (5, 300)      # (connect, read) — NL2SQL / summaries can take a while
+TIMING_KEEP = 50
 
-def list_databases():
-    r = requests.get(f"{BASE_URL}/")
+_tl = threading.local()
+
+
+# --- one pooled keep-alive session per Streamlit server process ---
+@st.cache_resource(show_spinner=False)
+def _http():
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, backoff_factor=0.2, allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _record(call, start, source, status=None):
+    """Per-run request timings for the debug panel."""
+    _record_entry({"call": call, "ms": round((time.perf_counter() - start) * 1000, 1), "source": source,
+                   "status": status})
+
+
+def _record_entry(entry):
+    sink = getattr(_tl, "sink", None)
+    if sink is not None:  # fetch_parallel worker: handed back to the script thread
+        sink.append(entry)
+        return
     try:
-        return r.json()
+        timings = st.session_state.setdefault("api_timings", [])
+        timings.append(entry)
+        del timings[:-TIMING_KEEP]
     except Exception:
-        print("Response text:", r.text)
-    return {}
+        pass
+
+
+def _request(method, url, **kwargs):
+    if "timeout" not in kwargs:
+        kwargs["timeout"] = REQUEST_TIMEOUT
+    start = time.perf_counter()
+    r = _http().request(method, url, **kwargs)
+    _record(f"{method} {url[len(BASE_URL):] or '/'}", start, "network", r.status_code)
+    return r
+
+
+# --- GET caching: fresh for CACHE_TTL_SECONDS, then revalidated with If-None-Match ---
+@st.cache_resource(show_spinner=False)
+def _etag_store():
+    return {}  # url → (etag, payload), shared by all sessions of this process
+
+
+def _revalidating_get(url, params):
+    store = _etag_store()
+    key = url + "?" + json.dumps(params, sort_keys=True)
+    cached = store.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    r = _http().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    if r.status_code == 304 and cached:
+        _tl.source = "304"
+        return cached[1]
+    _tl.source = "network"
+    r.raise_for_status()
+    payload = r.json()
+    if r.headers.get("ETag"):
+        store[key] = (r.headers["ETag"], payload)
+    return payload
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _cached_get(url, params_json):
+    return _revalidating_get(url, json.loads(params_json))
+
+
+def _get_cached(url, params=None):
+    """Cached JSON GET; the debug panel shows whether it came from cache, a 304, or the network."""
+    _tl.source = "cache"  # stays "cache" unless the cached function actually ran
+    start = time.perf_counter()
+    try:
+        return _cached_get(url, json.dumps(params or {}, sort_keys=True))
+    except Exception as e:  # errors are never cached: the next rerun tries again
+        _tl.source = "error"
+        return {"status": "error", "error": str(e)}
+    finally:
+        _record(f"GET {url[len(BASE_URL):] or '/'}", start, _tl.source)
+
+
+def invalidate_cache():
+    """After uploads / schema refreshes: next reads go to the backend (ETags still save the payload)."""
+    _cached_get.clear()
+
+
+def fetch_parallel(calls: dict) -> dict:
+    """
+    {name: (fn, *args)} → {name: result}, run concurrently on the pooled session.
+    Failures come back as {"status": "error", "error": ...} so one slow/broken call never blocks the others.
+    """
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+    def run(fn, *args):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        _tl.sink = []
+        try:
+            return fn(*args), _tl.sink
+        except Exception as e:
+            return {"status": "error", "error": str(e)}, _tl.sink
+        finally:
+            _tl.sink = None
+
+    with ThreadPoolExecutor(max_workers=max(1, len(calls))) as pool:
+        futures = {name: pool.submit(run, *call) for name, call in calls.items()}
+        results = {}
+        for name, future in futures.items():
+            results[name], timings = future.result()
+            for entry in timings:
+                _record_entry(entry)
+    return results
+
+
+def start_timing_run():
+    """Called once at the top of every rerun so the debug panel shows this run only."""
+    st.session_state["api_timings"] = []
+    st.session_state["api_run_started"] = time.perf_counter()
+
+
+# --- metadata (cached) ---
+def list_databases():
+    result = _get_cached(f"{BASE_URL}/")
+    if result.get("status") == "error":
+        print("Failed to list databases:", result["error"])
+    return result
 
 
 def list_tables(db_name):
-    r = requests.get(f"{BASE_URL}/{db_name}")
-    return r.json()
+    return _get_cached(f"{BASE_URL}/{db_name}")
+
+
+def preview_table(db_name, table_name, limit=5):
+    return _get_cached(f"{BASE_URL}/{db_name}/{table_name}/preview", {"limit": limit})
+
+
+def refresh_schema(db_name):
+    r = _request("POST", f"{BASE_URL}/refresh/", json={"db_name": db_name})
+    invalidate_cache()
+    return r
 
-def upload_file(file_path, table_name=None, db_name=None, if_exists="replace"):
+
+def summarize(sql_query, db_name):
+    return _request("POST", f"{BASE_URL}/summarize/", json={"sql_query": sql_query, "db_name": db_name})
+
+
+def upload_file(file_path, table_name=None, db_name=None, if_exists="replace", key_columns=None):
     with open(file_path, "rb") as f:
         files = {"file": (file_path, f)}
-        data = {"table_name": table_name, "if_exists": if_exists, "db_name": db_name}
-        r = requests.post(f"{BASE_URL}/upload/", files=files, data=data)
+        data = {"table_name": table_name, "if_exists": if_exists, "db_name": db_name, "key_columns": key_columns}
+        r = _request("POST", f"{BASE_URL}/upload/", files=files, data=data)
     return r.json()
 
+# --- Resumable chunked upload, streamed straight from the in-memory upload buffer ---
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_RETRIES = 5
+
+
+def _upload_status(upload_id):
+    r = _request("GET", f"{BASE_URL}/upload/chunked/{upload_id}", timeout=30)
+    return r.json() if r.status_code == 200 else None
+
+
+def upload_buffer(buffer, filename, table_name=None, db_name=None, if_exists="replace", key_columns=None,
+                  upload_id=None, on_progress=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Sends `buffer` (bytes / memoryview, e.g. UploadedFile.getbuffer()) in checksummed chunks.
+    - Pass a previous `upload_id` to resume it: the server reports how many bytes it already has
+    - Dropped connections are retried from the server's offset
+    - on_progress(sent_bytes, total_bytes, upload_id) is called after every chunk
+    """
+    view = memoryview(buffer).cast("B")
+    total = len(view)
+    digest = hashlib.sha256()
+    for start in range(0, total, chunk_size):
+        digest.update(view[start:start + chunk_size])
+    sha256 = digest.hexdigest()
+
+    status = _upload_status(upload_id) if upload_id else None
+    if not status or status.get("sha256") != sha256 or status.get("status") != "receiving":
+        keys = [k.strip() for k in key_columns.split(",") if k.strip()] if isinstance(key_columns, str) else key_columns
+        r = _request("POST", f"{BASE_URL}/upload/chunked/", timeout=30, json={
+            "filename": filename, "db_name": db_name, "total_size": total, "table_name": table_name,
+            "if_exists": if_exists, "key_columns": keys, "sha256": sha256,
+        })
+        status = r.json()
+        if r.status_code != 200:
+            return {"status": "error", "error": status.get("detail", status)}
+    upload_id, offset = status["upload_id"], status["received"]
+
+    failures = 0
+    while offset < total:
+        chunk = view[offset:offset + chunk_size].tobytes()
+        try:
+            r = _request("PUT", f"{BASE_URL}/upload/chunked/{upload_id}", params={"offset": offset}, data=chunk,
+                             headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest(),
+                                      "Content-Type": "application/octet-stream"}, timeout=120)
+            body = r.json()
+            if r.status_code in (200, 409):
+                offset = body["received"]  # 409 → the server tells us where to resume
+                failures = 0
+            else:
+                failures += 1
+        except requests.RequestException:
+            failures += 1
+            status = None
+            try:
+                status = _upload_status(upload_id)
+            except requests.RequestException:
+                pass
+            if status:
+                offset = status["received"]
+        if failures > UPLOAD_RETRIES:
+            return {"status": "error", "error": f"Upload interrupted at {offset}/{total} bytes",
+                    "upload_id": upload_id}
+        if failures:
+            time.sleep(min(2 ** failures, 30))
+        if on_progress:
+            on_progress(offset, total, upload_id)
+
+    r = _request("POST", f"{BASE_URL}/upload/chunked/{upload_id}/commit", json={"sha256": sha256}, timeout=None)
+    result = r.json()
+    if r.status_code != 200:
+        return {"status": "error", "error": result.get("detail", result.get("error", result)), "upload_id": upload_id}
+    invalidate_cache()  # new table / rows → table lists and previews are stale
+    return result
+
+
 # def nl_to_sql(question, db_name):
 #     r = requests.post(f"{BASE_URL}/nl2sql/", json={"question": question, "db_name": db_name})
 #     return r.json()
@@ -36,7 +266,7 @@ def nl_to_sql(question,db_name, table_name):
         "db_name": db_name,
         "table_name": table_name
     }
-    r = requests.post(f"{BASE_URL}/nl2sql/", json=payload)
+    r = _request("POST", f"{BASE_URL}/nl2sql/", json=payload)
     try:
         return r.json()
     except Exception:
@@ -44,6 +274,83 @@ def nl_to_sql(question,db_name, table_name):
         return {"status": "error", "error": "Invalid response"}
 
 
+def ask_stream(question, db_name=None, table_name=None, session_id=None, max_rows=None):
+    """
+    Calls the fused /ask endpoint and yields its NDJSON sections as they arrive
+    (sql → result → rows… → profile → chart → summary → done).
+    """
+    payload = {"question": question, "db_name": db_name, "table_name": table_name,
+               "session_id": session_id, "max_rows": max_rows}
+    start = time.perf_counter()
+    status = None
+    try:
+        with _http().post(f"{BASE_URL}/ask/", json=payload, stream=True, timeout=REQUEST_TIMEOUT) as r:
+            status = r.status_code
+            if r.status_code != 200:
+                yield {"section": "error", "stage": "request", "detail": r.text}
+                return
+            for line in r.iter_lines():
+                if line:
+                    yield json.loads(line)
+    finally:
+        _record("POST /ask/ (stream)", start, "network", status)
+
+
+def save_example(question, sql_query, db_name=None):
+    """
+    Calls /nl2sql/examples to store a confirmed question → SQL pair as a few-shot example.
+    """
+    payload = {"question": question, "sql_query": sql_query, "db_name": db_name}
+    r = _request("POST", f"{BASE_URL}/nl2sql/examples", json=payload)
+    return r.json()
+
+
 def execute_sql(sql_query, db_name):
-    r = requests.post(f"{BASE_URL}/execute/", json={"sql_query": sql_query, "db_name": db_name})
+    r = _request("POST", f"{BASE_URL}/execute/", json={"sql_query": sql_query, "db_name": db_name})
+    return r.json()
+
+
+
+# --- Exports: the backend streams the query into a file; the browser downloads it directly
+#     (PUBLIC_API_URL) or through Streamlit ---
+def start_export(sql_query, db_name, fmt="csv", gzip=False):
+    r = _request("POST", f"{BASE_URL}/export/", json={"sql_query": sql_query, "db_name": db_name,
+                                                      "format": fmt, "gzip": gzip})
+    return r.json()
+
+
+def export_status(export_id):
+    r = _request("GET", f"{BASE_URL}/export/{export_id}")
+    return r.json()
+
+
+def export_download_url(export_id):
+    """Direct (resumable) download link for the browser, or None when the backend is not public."""
+    return f"{PUBLIC_API_URL}/export/{export_id}/download" if PUBLIC_API_URL else None
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def export_bytes(export_id):
+    """The finished artifact, fetched by the Streamlit server for st.download_button (kept across reruns)."""
+    r = _request("GET", f"{BASE_URL}/export/{export_id}/download", timeout=(5, 600))
+    r.raise_for_status()
+    return r.content
+
+# --- Conversation sessions (server keeps tables, schema context and last result) ---
+def create_session(db_name, table_name=None):
+    r = _request("POST", f"{BASE_URL}/session/", json={"db_name": db_name, "table_name": table_name})
+    return r.json()
+
+
+def session_ask(session_id, question):
+    r = _request("POST", f"{BASE_URL}/session/{session_id}/ask", json={"question": question})
+    try:
+        return r.json()
+    except Exception:
+        st.error(f"Failed to parse response from backend: {r.text}")
+        return {"status": "error", "error": "Invalid response"}
+
+
+def session_execute(session_id, sql_query):
+    r = _request("POST", f"{BASE_URL}/session/{session_id}/execute", json={"sql_query": sql_query})
     return r.json()